@@ -5,38 +5,89 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import json
 import os
 import textwrap
-import traceback
+import time
 import uuid
 import argparse
+import sys
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
 
+import httpx
+import uvicorn
 from dotenv import load_dotenv
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from langchain.agents import create_agent
 from langchain.agents.middleware import (
     ModelRequest,
-    SummarizationMiddleware,
     TodoListMiddleware,
     dynamic_prompt,
 )
 from langchain.tools import ToolRuntime, tool
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
+from langgraph.checkpoint.memory import InMemorySaver
+from pydantic import BaseModel
 
 from config.mcp_config import get_mcp_dict
 from prompts import middleware_todolist, prompt_enhance, subagent_search
-from tools.tool_role import role_play
+from tools.tool_role import ROLE_PLAY_MODES, RolePlayConfig, role_play, role_play_engine
 from tools.tool_runtime import ToolSchema
 from tools.tool_sci import calculator
-from tools.tool_search import dashscope_search
+from tools.tool_search import api_key_fingerprint, dashscope_search, normalize_query
+from utils.error_classifier import ErrorSummarizer
+from utils.http_pool import HTTPPoolConfig, http_pool
+from utils.llm_router import HedgedChatModel, HedgePolicy, ProviderRouter
+from utils.metrics import MetricsMiddleware, TimedSummarizationMiddleware, registry
 from utils.remove_html import get_cleaned_text
-from utils.tool_view import format_tool_call, format_tool_result
-from utils.web_ui import create_ui, custom_css, theme
+from utils.replay import RecordingTransport, ReplayConfig, ReplayTransport
+from utils.scheduler import AdmissionScheduler, QueueFullError, Ticket
+from utils.session_store import SqliteSessionStore, count_turns
+from utils.tool_cache import CachePolicy, ToolCacheMiddleware, ToolResultCache, cacheable
+from utils.tool_view import format_tool_call, format_tool_progress, format_tool_result
+from utils.workers import serve_workers
+
+# gradio、langchain_openai 与 MCP 适配器导入较慢，在首次使用时才加载，见 bench/bench_import.py
+if TYPE_CHECKING:
+    import gradio as gr
+    from langchain_openai import ChatOpenAI
+
+    from utils.mcp_pool import MCPSessionPool
+
+
+def _import_gradio() -> Any:
+    """
+    首次使用时导入 gradio，并绑定到模块全局的 gr。
+
+    Gradio 按参数的类型注解注入 gr.Request；本模块的注解是字符串，由 typing.get_type_hints
+    在模块全局中解析，gr 只在 TYPE_CHECKING 下导入时无法解析，请求就不会被注入。
+    """
+    global gr
+    import gradio as gr
+
+    return gr
+
 
 load_dotenv()
 
+# 进程内共享的错误摘要器
+error_summarizer = ErrorSummarizer()
+
 TYPING_INDICATOR_HTML = (
     '<span class="typing-indicator" aria-label="AI 正在回复">'
     "<span></span><span></span><span></span>"
@@ -102,6 +153,15 @@ class LLMConfig:
                 temperature=0.7,
                 top_p=0.9,
             )
+        if provider == "replay":
+            # 离线回放录制的模型输出，用于压测，见 utils/replay.py
+            return cls(
+                provider=provider,
+                model="replay",
+                base_url="http://replay.invalid/v1",
+                api_key="replay",
+                enable_thinking=False,
+            )
         raise ValueError(f"未知的 LLM 提供商：{provider!r}")
 
     def to_kwargs(self) -> dict:
@@ -137,18 +197,106 @@ class MCPConfig:
         )
     )
     base_path: str = "./"
+    # 每个 MCP 服务的最大并发工具调用数
+    max_concurrency: int = 4
+    # 会话空闲超过该秒数后，下次使用前先做健康检查
+    health_check_interval: float = 30.0
+    # 建立会话（拉起子进程 + 握手）的超时秒数
+    connect_timeout: float = 30.0
+    # MCP 工具的结果缓存策略（按工具名），未列出的工具不缓存
+    cache_policies: Dict[str, CachePolicy] = field(
+        default_factory=lambda: {
+            "math": CachePolicy(),
+            "get_weather": CachePolicy(ttl=600),
+        }
+    )
 
     def get_active_dict(self) -> dict:
         """获取已启用的 MCP 配置字典"""
         return {k: v for k, v in get_mcp_dict(self.base_path).items() if k in self.enabled}
 
 
+@dataclass
+class CheckpointConfig:
+    """
+    会话状态持久化配置
+
+    开启后进入 thread 模式：每个 Gradio 会话对应一个 LangGraph thread_id，
+    Agent 从 checkpointer 中恢复历史状态，每轮只需发送新的用户消息。
+    """
+
+    # 为 None 时关闭 thread 模式，可选 "memory" / "sqlite"
+    backend: Optional[str] = None
+    # sqlite 数据库文件路径（需要安装 langgraph-checkpoint-sqlite）
+    sqlite_path: str = "./logs/checkpoints.sqlite"
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+
+@dataclass
+class StreamFlushPolicy:
+    """
+    流式输出的刷新策略
+
+    Gradio 每收到一次 yield 都会重新序列化并比对整段对话，因此 token 与工具事件
+    先在服务端合并，满足任一条件时才刷新到界面。第一个更新总是立即刷新，首字延迟不变。
+    """
+
+    # 累计多少个更新（token / 工具事件）后刷新
+    max_tokens: int = 64
+    # 距离上次刷新的最长等待秒数
+    max_latency: float = 0.05
+
+
+@dataclass
+class SchedulerConfig:
+    """
+    准入控制配置
+
+    同一 provider 的并发请求数超过上限时进入等待队列，队列按会话轮转放行；
+    队列已满时直接拒绝新请求，避免突发流量触发 provider 限流、拖慢所有人。
+    """
+
+    # 每个 provider 默认的最大并发请求数
+    max_concurrency: int = 8
+    # 每个 provider 的等待队列长度上限
+    max_queue: int = 32
+    # 按 provider 覆盖并发上限，本地 ollama 通常只能同时处理少量请求
+    provider_limits: Dict[str, int] = field(default_factory=lambda: {"ollama": 2})
+
+
+@dataclass
+class ToolCacheConfig:
+    """工具结果缓存配置，缓存策略由各工具自行声明（见 utils/tool_cache.py）"""
+
+    # 最多缓存的结果条数
+    max_entries: int = 1024
+    # 缓存结果的总字节数上限
+    max_bytes: int = 8 * 1024 * 1024
+    # 搜索子 Agent 摘要（subagent_search_brief）的缓存秒数
+    search_brief_ttl: float = 600.0
+
+
 @dataclass
 class AppConfig:
     """应用总配置"""
 
     llm: LLMConfig = field(default_factory=LLMConfig)
+    # 备用 provider，按顺序对冲与故障转移；为空时只使用 llm
+    fallbacks: List[LLMConfig] = field(default_factory=list)
+    hedge: HedgePolicy = field(default_factory=HedgePolicy)
     mcp: MCPConfig = field(default_factory=MCPConfig)
+    checkpoint: CheckpointConfig = field(default_factory=CheckpointConfig)
+    stream: StreamFlushPolicy = field(default_factory=StreamFlushPolicy)
+    scheduler: SchedulerConfig = field(default_factory=SchedulerConfig)
+    tool_cache: ToolCacheConfig = field(default_factory=ToolCacheConfig)
+    http: HTTPPoolConfig = field(default_factory=HTTPPoolConfig)
+    role_play: RolePlayConfig = field(default_factory=RolePlayConfig)
+    replay: ReplayConfig = field(default_factory=ReplayConfig)
+    # 录制模式：把首选 provider 的流式响应写入该目录，供 replay provider 回放
+    record_dir: Optional[str] = None
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -178,27 +326,71 @@ class AgentService:
     Agent 服务
 
     负责：
-    - LLM 实例的懒加载
+    - LLM 实例的懒加载（配置了备用 provider 时为对冲模型），共享进程级 HTTP 连接池
     - 搜索子 Agent 的懒加载
+    - MCP 长连接会话池的持有与关闭
+    - checkpointer 的创建与关闭（thread 模式）
+    - 请求的准入控制（按 provider 限流、排队与拒绝）
+    - 工具结果缓存（主 Agent 与搜索子 Agent 共享）
     - 主 Agent 的创建与并发安全缓存
     """
 
     def __init__(self, config: AppConfig) -> None:
         self._config = config
-        self._llm: Optional[ChatOpenAI] = None
+        http_pool.configure(config.http)
+        role_play_engine.configure(config.role_play)
+        if config.llm.provider == "replay":
+            replay = ReplayTransport.from_config(config.replay)
+            http_pool.mount(config.llm.base_url, transport=replay, async_transport=replay)
+        elif config.record_dir:
+            recorder = RecordingTransport(
+                httpx.AsyncHTTPTransport(limits=http_pool.limits()), config.record_dir
+            )
+            http_pool.mount(config.llm.base_url, async_transport=recorder)
+        self._llm: Optional[BaseChatModel] = None
+        # 多 provider 模式下各 provider 的延迟与健康状况
+        self.router: Optional[ProviderRouter] = None
+        if config.fallbacks:
+            providers = [c.provider for c in [config.llm, *config.fallbacks]]
+            self.router = ProviderRouter(providers, config.hedge)
         self._search_subagent: Optional[Any] = None
+        self._mcp_pool: Optional[MCPSessionPool] = None
+        self._checkpoint_conn: Optional[Any] = None
         self._agent: Optional[Any] = None
         self._lock = asyncio.Lock()
+        self.scheduler = AdmissionScheduler(
+            max_concurrency=config.scheduler.max_concurrency,
+            max_queue=config.scheduler.max_queue,
+            provider_limits=config.scheduler.provider_limits,
+        )
+        self.tool_cache = ToolResultCache(
+            max_entries=config.tool_cache.max_entries,
+            max_bytes=config.tool_cache.max_bytes,
+        )
 
     # ── LLM ──────────────────────────────────────────────────────────────────
 
     @property
-    def llm(self) -> ChatOpenAI:
+    def llm(self) -> BaseChatModel:
         """获取 LLM 实例（懒加载）"""
         if self._llm is None:
-            self._llm = ChatOpenAI(**self._config.llm.to_kwargs())
+            if self.router is None:
+                self._llm = self._chat_model(self._config.llm)
+            else:
+                models = {
+                    c.provider: self._chat_model(c)
+                    for c in [self._config.llm, *self._config.fallbacks]
+                }
+                self._llm = HedgedChatModel(models=models, router=self.router)
         return self._llm
 
+    @staticmethod
+    def _chat_model(llm_config: LLMConfig) -> ChatOpenAI:
+        """创建 ChatOpenAI，同一 base_url 的请求复用连接池中的 keep-alive 连接"""
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(**llm_config.to_kwargs(), **http_pool.client_kwargs(llm_config.base_url))
+
     # ── 搜索子 Agent ──────────────────────────────────────────────────────────
 
     @property
@@ -208,14 +400,32 @@ class AgentService:
             self._search_subagent = create_agent(
                 model=self.llm,
                 tools=[dashscope_search],
-                middleware=[_search_subagent_prompt],
+                middleware=[
+                    _search_subagent_prompt,
+                    MetricsMiddleware(self._config.llm.provider),
+                    self._tool_cache_middleware(),
+                ],
             )
         return self._search_subagent
 
+    def _tool_cache_middleware(self) -> ToolCacheMiddleware:
+        return ToolCacheMiddleware(self.tool_cache, self._config.mcp.cache_policies)
+
     def _make_search_brief_tool(self) -> Any:
         """创建 subagent_search_brief 工具"""
         subagent = self.search_subagent  # 提前绑定，避免闭包延迟求值
+        model = self._config.llm.model
 
+        # 一次摘要包含多次模型调用与搜索：相同主题（规范化后的搜索词 + 模型）的摘要在 TTL 内复用，
+        # 并发的相同请求只运行一次子 Agent，命中率见 tool_cache 指标；不同 api_key 的调用互不共用
+        def cache_key(args: Dict[str, Any]) -> Dict[str, str]:
+            return {"query": normalize_query(str(args.get("query", ""))), "model": model}
+
+        @cacheable(
+            ttl=self._config.tool_cache.search_brief_ttl,
+            key=cache_key,
+            context_key=api_key_fingerprint,
+        )
         @tool("subagent_search_brief", description=subagent_search.get_tool_description())
         async def search_brief(query: str, runtime: ToolRuntime[ToolSchema]) -> str:
             """调用搜索子 Agent，返回摘要后的搜索结果"""
@@ -243,6 +453,99 @@ class AgentService:
             )
         return local_tools
 
+    # ── MCP ──────────────────────────────────────────────────────────────────
+
+    @property
+    def mcp_pool(self) -> Optional[MCPSessionPool]:
+        """获取 MCP 会话池（懒加载，未启用任何 MCP 服务时为 None）"""
+        if self._mcp_pool is None:
+            mcp_dict = self._config.mcp.get_active_dict()
+            if mcp_dict:
+                from utils.mcp_pool import MCPSessionPool
+
+                self._mcp_pool = MCPSessionPool(
+                    mcp_dict,
+                    max_concurrency=self._config.mcp.max_concurrency,
+                    health_check_interval=self._config.mcp.health_check_interval,
+                    connect_timeout=self._config.mcp.connect_timeout,
+                )
+        return self._mcp_pool
+
+    # ── Checkpointer ─────────────────────────────────────────────────────────
+
+    async def _create_checkpointer(self) -> Optional[Any]:
+        """按配置创建 checkpointer，未开启 thread 模式时返回 None"""
+        checkpoint = self._config.checkpoint
+        if checkpoint.backend is None:
+            return None
+        if checkpoint.backend == "memory":
+            return InMemorySaver()
+        if checkpoint.backend == "sqlite":
+            try:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            except ImportError as exc:
+                raise RuntimeError(
+                    "sqlite checkpointer 需要先安装：uv add langgraph-checkpoint-sqlite"
+                ) from exc
+            os.makedirs(os.path.dirname(os.path.abspath(checkpoint.sqlite_path)), exist_ok=True)
+            self._checkpoint_conn = await aiosqlite.connect(checkpoint.sqlite_path)
+            return AsyncSqliteSaver(self._checkpoint_conn)
+        raise ValueError(f"未知的 checkpointer 类型：{checkpoint.backend!r}")
+
+    async def aclose(self) -> None:
+        """释放长连接资源（MCP 会话、checkpointer 连接），下次使用时重新创建 Agent"""
+        self._agent = None
+        if self._mcp_pool is not None:
+            await self._mcp_pool.close()
+        if self._checkpoint_conn is not None:
+            conn, self._checkpoint_conn = self._checkpoint_conn, None
+            await conn.close()
+
+    # ── 预热 ──────────────────────────────────────────────────────────────────
+
+    async def warmup(self, timeout: float = 60.0) -> Dict[str, Dict[str, Any]]:
+        """
+        在服务所在的事件循环上并发预热各组件，返回每个组件的耗时与错误信息
+
+        LLM 客户端与各 MCP 服务并发初始化，搜索子 Agent 在 LLM 就绪后构建，
+        最后编译主 Agent（复用已就绪的组件）。单个组件超时或失败不影响其他组件。
+        """
+        report: Dict[str, Dict[str, Any]] = {}
+
+        async def timed(name: str, factory: Callable[[], Awaitable[Any]]) -> bool:
+            start = time.perf_counter()
+            error: Optional[str] = None
+            try:
+                await asyncio.wait_for(factory(), timeout)
+            except asyncio.TimeoutError:
+                error = f"超过 {timeout:g} 秒"
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            elapsed = time.perf_counter() - start
+            report[name] = {"seconds": elapsed, "error": error}
+            registry.observe("warmup_seconds", elapsed, component=name)
+            return error is None
+
+        async def warm_llm_and_subagent() -> None:
+            # ChatOpenAI 的构造与图的编译都是同步的 CPU 工作，放到线程中执行，不阻塞事件循环
+            if not await timed("llm", lambda: asyncio.to_thread(lambda: self.llm)):
+                return
+            if self._config.llm.provider == "dashscope":
+                await timed(
+                    "search_subagent", lambda: asyncio.to_thread(lambda: self.search_subagent)
+                )
+
+        components = [warm_llm_and_subagent()]
+        if self.mcp_pool is not None:
+            components.extend(
+                timed(f"mcp:{name}", functools.partial(self.mcp_pool.get_tools, name))
+                for name in self.mcp_pool.server_names
+            )
+        await asyncio.gather(*components)
+        await timed("agent", self.get_agent)
+        return report
+
     # ── 主 Agent ──────────────────────────────────────────────────────────────
 
     async def get_agent(self) -> Any:
@@ -254,23 +557,25 @@ class AgentService:
             if self._agent is not None:  # 双重检查
                 return self._agent
 
-            # 获取 MCP 工具
-            mcp_dict = self._config.mcp.get_active_dict()
+            # 获取 MCP 工具（工具调用经由会话池复用长连接）
             mcp_tools: List[Any] = []
-            if mcp_dict:
-                client = MultiServerMCPClient(mcp_dict)
-                mcp_tools = await client.get_tools()
+            if self.mcp_pool is not None:
+                mcp_tools = await self.mcp_pool.get_tools()
 
             self._agent = create_agent(
                 model=self.llm,
                 tools=mcp_tools + self._get_local_tools(),
+                checkpointer=await self._create_checkpointer(),
                 middleware=[
                     _main_agent_prompt,
-                    SummarizationMiddleware(
+                    TimedSummarizationMiddleware(
                         model=self.llm,
                         trigger=("tokens", 2000),
                         keep=("messages", 7),
+                        provider=self._config.llm.provider,
                     ),
+                    MetricsMiddleware(self._config.llm.provider),
+                    self._tool_cache_middleware(),
                     TodoListMiddleware(system_prompt=middleware_todolist.get_system_prompt()),
                 ],
             )
@@ -297,94 +602,186 @@ def _get_tools_info(agent: Any) -> str:
     return f"\n```text\n{wrapped}\n```\n"
 
 
-def _get_greeting(service: AgentService) -> str:
-    """获取初始欢迎消息"""
+def _get_greeting(agent: Optional[Any]) -> str:
+    """获取初始欢迎消息（Agent 不可用时降级为不含工具列表的版本）"""
+    fallback = "你好！我是你的智能助手。\n请问有什么可以帮你的吗？"
+    if agent is None:
+        return fallback
     try:
-        agent = asyncio.run(service.get_agent())
         tools_info = _get_tools_info(agent)
-        return "\n".join(
-            [
-                "你好！我是你的智能助手，可以使用的工具包括：",
-                tools_info,
-                "\n请问有什么可以帮你的吗？",
-            ]
-        )
     except Exception as exc:
         print(f"获取工具列表时出错: {exc}")
-        return "你好！我是你的智能助手。\n请问有什么可以帮你的吗？"
+        return fallback
+    return "\n".join(
+        [
+            "你好！我是你的智能助手，可以使用的工具包括：",
+            tools_info,
+            "\n请问有什么可以帮你的吗？",
+        ]
+    )
 
 
-async def _summarize_error(llm: ChatOpenAI | None, err: BaseException, limit: int = 500) -> str:
-    """用 LLM 总结错误，失败时降级输出原始日志"""
-    full_trace = "".join(traceback.format_exception(type(err), err, err.__traceback__))
-    full_trace = full_trace[-5000:]  # 避免过长
+def _print_warmup_report(report: Dict[str, Dict[str, Any]]) -> None:
+    """打印启动预热的耗时"""
+    print("启动预热耗时：")
+    for name, item in report.items():
+        status = "ok" if item["error"] is None else f"失败 ({item['error']})"
+        print(f"  - {name:<28} {item['seconds'] * 1000:>9.1f} ms  {status}")
 
-    if llm is not None:
-        try:
-            abstract = await llm.ainvoke(
-                "\n".join(
-                    [
-                        full_trace,
-                        "---",
-                        "以上是 LangChain Agent 的报错信息，请简述报错原因：",
-                    ]
-                )
-            )
-            content = getattr(abstract, "content", abstract)
-            return f"\n ⚠️ 发生错误，以下是摘要信息：\n{content}"
-        except Exception:
-            pass
-    return f"\n ⚠️ 发生错误，以下是原始日志：\n{full_trace[:limit]}"
 
+async def _summarize_error(llm: BaseChatModel | None, err: BaseException, limit: int = 500) -> str:
+    """总结错误：常见错误本地识别，按指纹缓存；新错误才交给 LLM（限速），失败时降级输出原始日志"""
+    return await error_summarizer.summarize(llm, err, limit)
 
-async def _stream_events(
+
+async def _agent_events(
     agent: Any,
     messages: List[Dict],
-    history: List[Dict[str, str]],
     tool_context: ToolSchema,
-) -> AsyncIterator[Tuple[str, List[Dict[str, str]]]]:
-    """处理 Agent 事件流，更新 history 并逐步 yield"""
+    config: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    把 Agent 事件流转换为增量事件，供界面渲染与 HTTP API 共用：
+    - ("token", {"text"})：模型输出的文本增量
+    - ("tool_call", {"id", "name", "args"})：模型发起的工具调用
+    - ("tool_result", {"id", "name", "content"})：工具返回的结果
+    - ("tool_progress", {"id", "name", "title", "content"})：工具运行中通过 stream_writer 推送的阶段性结果
+    """
     # 需要跳过输出的子 Agent 名称（避免与主流输出重复）
     SKIP_SUBAGENTS = {"subagent:search-brief"}
 
-    def clear_typing_indicator() -> None:
-        if history[-1]["content"] == TYPING_INDICATOR_HTML:
-            history[-1]["content"] = ""
-
     async for mode, payload in agent.astream(
         {"messages": messages},
-        stream_mode=["messages", "values"],
+        stream_mode=["messages", "values", "custom"],
         context=tool_context,
+        config=config,
     ):
-        if mode == "messages":
+        if mode == "custom":
+            if isinstance(payload, dict) and payload.get("name"):
+                yield (
+                    "tool_progress",
+                    {
+                        "id": payload.get("tool_call_id"),
+                        "name": payload["name"],
+                        "title": payload.get("title", ""),
+                        "content": payload.get("content", ""),
+                    },
+                )
+
+        elif mode == "messages":
             token, metadata = payload
             node = metadata.get("langgraph_node", "")
 
             if node == "model" and token.content:
-                clear_typing_indicator()
-                history[-1]["content"] += token.content
-                yield "", history
+                yield "token", {"text": token.content}
 
             elif node == "tools":
                 if token.name in SKIP_SUBAGENTS:
                     continue
                 if token.content:
-                    clear_typing_indicator()
-                    history[-1]["content"] += format_tool_result(token.name, token.content)
-                    yield "", history
+                    yield (
+                        "tool_result",
+                        {
+                            "id": getattr(token, "tool_call_id", None),
+                            "name": token.name,
+                            "content": token.content,
+                        },
+                    )
 
         elif mode == "values":
             state_msgs = payload.get("messages") if isinstance(payload, dict) else None
             if not state_msgs:
                 continue
-            tool_calls = getattr(state_msgs[-1], "tool_calls", None)
-            if tool_calls:
-                clear_typing_indicator()
-                history[-1]["content"] += "".join(
-                    format_tool_call(tc.get("name") or "unknown", tc.get("args") or {})
-                    for tc in tool_calls
+            for tc in getattr(state_msgs[-1], "tool_calls", None) or []:
+                yield (
+                    "tool_call",
+                    {
+                        "id": tc.get("id"),
+                        "name": tc.get("name") or "unknown",
+                        "args": tc.get("args") or {},
+                    },
                 )
-                yield "", history
+
+
+async def _stream_events(
+    agent: Any,
+    messages: List[Dict],
+    history: List[Dict[str, str]],
+    tool_context: ToolSchema,
+    config: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, List[Dict[str, str]]]]:
+    """处理 Agent 事件流，更新 history 并逐步 yield"""
+    # 工具调用 ID -> 已显示的阶段性结果块，工具返回后由最终结果替换
+    progress: Dict[Any, List[str]] = {}
+    async for kind, event in _agent_events(agent, messages, tool_context, config=config):
+        if history[-1]["content"] == TYPING_INDICATOR_HTML:
+            history[-1]["content"] = ""
+        if kind == "token":
+            history[-1]["content"] += event["text"]
+        elif kind == "tool_call":
+            history[-1]["content"] += format_tool_call(event["name"], event["args"])
+        elif kind == "tool_progress":
+            block = format_tool_progress(event["name"], event["title"], event["content"])
+            progress.setdefault(event["id"], []).append(block)
+            history[-1]["content"] += block
+        else:
+            for block in progress.pop(event["id"], []):
+                history[-1]["content"] = history[-1]["content"].replace(block, "", 1)
+            history[-1]["content"] += format_tool_result(event["name"], event["content"])
+        yield "", history
+
+
+async def _coalesce_updates(
+    updates: AsyncIterator[Tuple[str, List[Dict[str, str]]]],
+    policy: StreamFlushPolicy,
+) -> AsyncIterator[Tuple[str, List[Dict[str, str]]]]:
+    """按刷新策略合并更新：事件流在独立任务中消费，界面按批次刷新"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    latest: Optional[Tuple[str, List[Dict[str, str]]]] = None
+    pending = 0
+
+    async def produce() -> None:
+        nonlocal latest, pending
+        try:
+            async for update in updates:
+                latest = update
+                pending += 1
+                changed.set()
+        finally:
+            changed.set()
+
+    producer = asyncio.create_task(produce())
+    last_flush: Optional[float] = None
+    try:
+        while True:
+            if producer.done():
+                if pending:
+                    pending = 0
+                    yield latest
+                producer.result()  # 透传事件流中的异常（包括取消）
+                return
+
+            now = loop.time()
+            if pending and (
+                last_flush is None
+                or pending >= policy.max_tokens
+                or now - last_flush >= policy.max_latency
+            ):
+                pending, last_flush = 0, now
+                yield latest
+                continue
+
+            changed.clear()
+            timeout = last_flush + policy.max_latency - now if pending else None
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
 
 
 def _message_content_for_llm(role: str, content: Any) -> Any:
@@ -397,6 +794,7 @@ def _message_content_for_llm(role: str, content: Any) -> Any:
             "tool-call-details" in content
             or "tool-result-details" in content
             or "think-result-details" in content
+            or "tool-progress-details" in content
         ):
             return get_cleaned_text(content)
         return content
@@ -416,17 +814,108 @@ def _message_content_for_llm(role: str, content: Any) -> Any:
     return content
 
 
+def _build_llm_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    copied = dict(message)
+    copied["content"] = _message_content_for_llm(
+        str(copied.get("role", "")),
+        copied.get("content"),
+    )
+    return copied
+
+
 def build_llm_messages(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Build a clean, non-mutating message history for the LangChain agent."""
-    messages: List[Dict[str, Any]] = []
-    for message in history:
-        copied = dict(message)
-        copied["content"] = _message_content_for_llm(
-            str(copied.get("role", "")),
-            copied.get("content"),
+    return [_build_llm_message(message) for message in history]
+
+
+def _message_digest(message: Dict[str, Any]) -> Tuple[str, int, int]:
+    """Cheap content key of a Gradio message: role, length and content hash."""
+    content = message.get("content")
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return str(message.get("role", "")), len(content), hash(content)
+
+
+class LLMMessageCache:
+    """
+    Per-session memo of LLM-facing messages.
+
+    Gradio sends the whole history back on every turn. Entries are keyed by
+    message position and content hash, so only appended or edited messages go
+    through ``get_cleaned_text`` again. Cached message dicts are shared between
+    turns and must be treated as read-only.
+    """
+
+    def __init__(self, max_sessions: int = 256) -> None:
+        self._max_sessions = max_sessions
+        self._sessions: OrderedDict[str, List[Tuple[Tuple[str, int, int], Dict[str, Any]]]] = (
+            OrderedDict()
         )
-        messages.append(copied)
-    return messages
+
+    def build(self, session_id: str, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        entries = self._sessions.pop(session_id, [])
+        del entries[len(history) :]
+
+        messages: List[Dict[str, Any]] = []
+        for index, message in enumerate(history):
+            digest = _message_digest(message)
+            if index < len(entries) and entries[index][0] == digest:
+                messages.append(entries[index][1])
+                continue
+            built = _build_llm_message(message)
+            if index < len(entries):
+                entries[index] = (digest, built)
+            else:
+                entries.append((digest, built))
+            messages.append(built)
+
+        self._sessions[session_id] = entries
+        while len(self._sessions) > self._max_sessions:
+            self._sessions.popitem(last=False)
+        return messages
+
+    def discard(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+class SessionThreads:
+    """
+    Gradio 会话到 LangGraph thread_id 的映射（thread 模式）
+
+    每个 thread 记录已成功完成的对话轮数，规则与 SqliteSessionStore 一致：界面历史的轮数
+    与之不一致（出错、中断、重试、撤销或清空对话）时开启新的 thread。
+    """
+
+    def __init__(self, max_sessions: int = 1024) -> None:
+        self._max_sessions = max_sessions
+        # 会话 -> (thread_id, 已完成的轮数)
+        self._threads: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+
+    def resolve(self, session_id: str, history: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """返回 (thread_id, 是否为新 thread)，history 为本轮之前的界面历史"""
+        turns = count_turns(history)
+        entry = self._threads.pop(session_id, None)
+        fresh = entry is None or turns == 0 or entry[1] != turns
+        thread_id = str(uuid.uuid4()) if fresh else entry[0]
+        self._threads[session_id] = (thread_id, turns)
+        while len(self._threads) > self._max_sessions:
+            self._threads.popitem(last=False)
+        return thread_id, fresh
+
+    def complete(self, session_id: str, thread_id: str, history: List[Dict[str, Any]]) -> None:
+        """一轮成功结束后记录 thread 已包含的轮数，history 为本轮结束后的界面历史"""
+        entry = self._threads.get(session_id)
+        if entry is not None and entry[0] == thread_id:
+            self._threads[session_id] = (thread_id, count_turns(history))
+
+    # 与 SqliteSessionStore 的异步接口一致；内存操作不会阻塞，直接执行
+    async def aresolve(self, session_id: str, history: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        return self.resolve(session_id, history)
+
+    async def acomplete(
+        self, session_id: str, thread_id: str, history: List[Dict[str, Any]]
+    ) -> None:
+        self.complete(session_id, thread_id, history)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -439,31 +928,92 @@ def make_generate_response(service: AgentService, config: AppConfig):
     工厂函数：返回绑定了 service 和 config 的 generate_response 协程生成器。
     Gradio 的 llm_func 签名为 (message, history) -> AsyncIterator。
     """
+    # generate_response 的 request 参数注解为 gr.Request，Gradio 据此注入请求
+    _import_gradio()
+    # 按 Gradio 会话缓存清洗后的历史消息，每轮只清洗新增或被修改的消息
+    message_cache = LLMMessageCache()
+    # thread 模式下，Gradio 会话与 LangGraph thread 的对应关系；
+    # sqlite checkpointer 时与之存放在同一个数据库中，供多个 worker 进程共享
+    session_threads: SessionThreads | SqliteSessionStore = (
+        SqliteSessionStore(config.checkpoint.sqlite_path)
+        if config.checkpoint.backend == "sqlite"
+        else SessionThreads()
+    )
 
     async def generate_response(
         message: str,
         history: List[Dict[str, str]],
+        request: Optional[gr.Request] = None,
     ) -> AsyncIterator[Tuple[str, List[Dict[str, str]]]]:
         if not message or not message.strip():
             yield "", history
             return
 
+        started = time.perf_counter()
+        session_id = getattr(request, "session_hash", None)
+        labels = {"provider": config.llm.provider, "session": session_id}
+
         history.append({"role": "user", "content": message})
         history.append({"role": "assistant", "content": TYPING_INDICATOR_HTML})
         yield "", history
 
+        # 准入控制：并发已满时排队并展示排队位置，队列已满时直接拒绝
+        try:
+            ticket = service.scheduler.submit(config.llm.provider, session_id or str(uuid.uuid4()))
+        except QueueFullError:
+            registry.increment("requests_shed_total", provider=config.llm.provider)
+            history[-1]["content"] = "服务繁忙，请稍后再试。"
+            yield "", history
+            return
+
         try:
-            messages = build_llm_messages(history[:-1])
-            agent = await service.get_agent()
+            if not ticket.granted:
+                while not ticket.granted:
+                    ahead = ticket.position()
+                    history[-1]["content"] = (
+                        f"{TYPING_INDICATOR_HTML} 排队中，前面还有 {ahead} 个请求…"
+                    )
+                    yield "", history
+                    await ticket.wait()
+                history[-1]["content"] = TYPING_INDICATOR_HTML
+                yield "", history
+            registry.observe("queue_wait_seconds", time.perf_counter() - started, **labels)
+
+            run_config: Optional[Dict[str, Any]] = None
+            thread_id: Optional[str] = None
+            if config.checkpoint.enabled and session_id:
+                # thread 模式：历史状态由 checkpointer 恢复，只发送新的用户消息；
+                # 对话中途新开的 thread（如上一轮出错或被中断后）用界面上的完整历史建立上下文
+                thread_id, fresh = await session_threads.aresolve(session_id, history[:-2])
+                run_config = {"configurable": {"thread_id": thread_id}}
+                if fresh and count_turns(history[:-2]):
+                    messages = build_llm_messages(history[:-1])
+                else:
+                    messages = [{"role": "user", "content": message}]
+            elif session_id:
+                messages = message_cache.build(session_id, history[:-1])
+            else:
+                messages = build_llm_messages(history[:-1])
+            with registry.timer("agent_acquire_seconds", **labels):
+                agent = await service.get_agent()
             tool_context = ToolSchema(
                 base_url=config.llm.base_url or "",
                 api_key=config.llm.api_key or "",
                 model=config.llm.model,
+                session_id=session_id or "",
             )
-            async for update in _stream_events(agent, messages, history, tool_context):
+            updates = _stream_events(agent, messages, history, tool_context, config=run_config)
+            first_update = True
+            async for update in _coalesce_updates(updates, config.stream):
+                if first_update:
+                    first_update = False
+                    registry.observe("ttft_seconds", time.perf_counter() - started, **labels)
                 yield update
+            if thread_id is not None:
+                # 只有成功结束的一轮才计入 thread；出错或中断时下一轮会开启新的 thread
+                await session_threads.acomplete(session_id, thread_id, history)
         except asyncio.CancelledError:
-            if history[-1]["content"] == TYPING_INDICATOR_HTML:
+            if history[-1]["content"].startswith(TYPING_INDICATOR_HTML):
                 history[-1]["content"] = ""
             raise
         except Exception as err:
@@ -476,6 +1026,10 @@ def make_generate_response(service: AgentService, config: AppConfig):
                 history[-1]["content"] = ""
             history[-1]["content"] += await _summarize_error(error_llm, err)
             yield "", history
+        finally:
+            ticket.release()
+
+        registry.observe("response_seconds", time.perf_counter() - started, **labels)
 
         cleared_typing_indicator = history[-1]["content"] == TYPING_INDICATOR_HTML
         if cleared_typing_indicator:
@@ -487,6 +1041,141 @@ def make_generate_response(service: AgentService, config: AppConfig):
     return generate_response
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# 应用层：流式 HTTP API
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class ChatRequest(BaseModel):
+    """POST /api/chat 的请求体"""
+
+    message: str
+    # 会话 ID：开启 thread 模式时据此恢复历史，只需发送新消息
+    session_id: Optional[str] = None
+    # 未开启 thread 模式时由调用方携带的历史（role / content）
+    history: List[Dict[str, Any]] = []
+
+
+def _encode_sse(event: str, data: Dict[str, Any]) -> str:
+    return (
+        f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+    )
+
+
+def _encode_ndjson(event: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"event": event, **data}, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+class _TicketStreamingResponse(StreamingResponse):
+    """
+    持有准入 ticket 的流式响应：响应结束时释放 ticket。
+
+    事件生成器在开始迭代前就可能被放弃（客户端断开连接、发送响应头失败），此时生成器中的
+    finally 不会执行，因此在响应本身的生命周期结束时再释放一次（Ticket.release 可重复调用）。
+    """
+
+    def __init__(self, content: AsyncIterator[str], ticket: Ticket, **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+def make_stream_api(service: AgentService, config: AppConfig) -> APIRouter:
+    """
+    工厂函数：返回与 Gradio 界面并列的流式 HTTP API，供程序化调用。
+
+    POST /api/chat 以 SSE（默认）或 NDJSON（Accept: application/x-ndjson）逐个返回增量事件：
+    start、queued、token、tool_call、tool_progress、tool_result、error、done。
+    请求 ID 取自 X-Request-ID 请求头（没有时自动生成），在响应头与 start / done / error 事件中返回。
+    """
+    router = APIRouter()
+
+    @router.post("/api/chat")
+    async def chat(body: ChatRequest, request: Request) -> Response:
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        session_id = body.session_id or request_id
+        labels = {"provider": config.llm.provider, "session": session_id}
+        headers = {"X-Request-ID": request_id}
+
+        try:
+            ticket = service.scheduler.submit(config.llm.provider, session_id)
+        except QueueFullError:
+            registry.increment("requests_shed_total", provider=config.llm.provider)
+            return JSONResponse(
+                {"request_id": request_id, "error": "服务繁忙，请稍后再试。"},
+                status_code=503,
+                headers={**headers, "Retry-After": "1"},
+            )
+
+        ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+        encode = _encode_ndjson if ndjson else _encode_sse
+
+        async def events() -> AsyncIterator[str]:
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                yield encode("start", {"request_id": request_id})
+                while not ticket.granted:
+                    yield encode("queued", {"ahead": ticket.position()})
+                    await ticket.wait()
+                registry.observe("queue_wait_seconds", time.perf_counter() - started, **labels)
+
+                run_config: Optional[Dict[str, Any]] = None
+                if config.checkpoint.enabled and body.session_id:
+                    run_config = {"configurable": {"thread_id": f"api:{body.session_id}"}}
+                    messages = [{"role": "user", "content": body.message}]
+                else:
+                    messages = build_llm_messages(body.history)
+                    messages.append({"role": "user", "content": body.message})
+                agent = await service.get_agent()
+                tool_context = ToolSchema(
+                    base_url=config.llm.base_url or "",
+                    api_key=config.llm.api_key or "",
+                    model=config.llm.model,
+                    session_id=session_id,
+                )
+                first_event = True
+                async for kind, event in _agent_events(
+                    agent, messages, tool_context, config=run_config
+                ):
+                    if first_event:
+                        first_event = False
+                        registry.observe("ttft_seconds", time.perf_counter() - started, **labels)
+                    yield encode(kind, event)
+            except asyncio.CancelledError:
+                # 客户端断开连接
+                status = "cancelled"
+                raise
+            except Exception as err:
+                status = "error"
+                try:
+                    error_llm = service.llm
+                except Exception:
+                    error_llm = None
+                message = await _summarize_error(error_llm, err)
+                yield encode("error", {"request_id": request_id, "message": message})
+            finally:
+                ticket.release()
+                registry.increment("api_requests_total", status=status)
+            seconds = time.perf_counter() - started
+            registry.observe("response_seconds", seconds, **labels)
+            yield encode("done", {"request_id": request_id, "seconds": round(seconds, 3)})
+
+        return _TicketStreamingResponse(
+            events(),
+            ticket,
+            media_type="application/x-ndjson" if ndjson else "text/event-stream",
+            headers={**headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return router
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 主函数
 # ─────────────────────────────────────────────────────────────────────────────
@@ -499,30 +1188,231 @@ def main() -> None:
     parser.add_argument(
         "--provider",
         default="dashscope",
+        choices=["dashscope", "ark", "ollama", "replay"],
+        help="LLM 提供商，replay 为离线回放录制的输出",
+    )
+    parser.add_argument(
+        "--replay-fixtures",
+        default=ReplayConfig.fixtures_dir,
+        help="replay 模式下的 fixture 目录",
+    )
+    parser.add_argument(
+        "--replay-token-rate",
+        type=float,
+        default=ReplayConfig.tokens_per_second,
+        help="replay 模式下每秒输出的 chunk 数，0 表示不限速",
+    )
+    parser.add_argument(
+        "--replay-ttft-ms",
+        type=float,
+        default=ReplayConfig.ttft * 1000,
+        help="replay 模式下的首字延迟（毫秒）",
+    )
+    parser.add_argument(
+        "--record-fixtures",
+        default=None,
+        help="把首选 provider 的流式响应录制到该目录，供 --provider replay 回放",
+    )
+    parser.add_argument(
+        "--fallback-provider",
+        action="append",
+        default=[],
         choices=["dashscope", "ark", "ollama"],
-        help="LLM 提供商",
+        help="备用 LLM 提供商，可重复指定；首选 provider 变慢或出错时对冲或切换到备用 provider",
+    )
+    parser.add_argument(
+        "--checkpointer",
+        default=None,
+        choices=["memory", "sqlite"],
+        help="开启 thread 模式并选择会话状态的存储方式，默认关闭",
+    )
+    parser.add_argument(
+        "--checkpoint-db",
+        default=CheckpointConfig.sqlite_path,
+        help="sqlite checkpointer 的数据库文件路径",
+    )
+    parser.add_argument(
+        "--flush-max-tokens",
+        type=int,
+        default=StreamFlushPolicy.max_tokens,
+        help="流式输出时，累计多少个更新后刷新界面",
+    )
+    parser.add_argument(
+        "--flush-interval-ms",
+        type=float,
+        default=StreamFlushPolicy.max_latency * 1000,
+        help="流式输出时，两次刷新界面之间的最长间隔（毫秒）",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=SchedulerConfig.max_concurrency,
+        help="同一 provider 的最大并发请求数（ollama 默认 2）",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=SchedulerConfig.max_queue,
+        help="等待队列长度上限，队列已满时拒绝新请求",
+    )
+    parser.add_argument(
+        "--http-max-connections",
+        type=int,
+        default=HTTPPoolConfig.max_connections,
+        help="每个模型服务地址的最大 HTTP 连接数",
+    )
+    parser.add_argument(
+        "--http-keepalive-expiry",
+        type=float,
+        default=HTTPPoolConfig.keepalive_expiry,
+        help="空闲 HTTP 连接的保持秒数",
+    )
+    parser.add_argument(
+        "--role-play-concurrency",
+        type=int,
+        default=RolePlayConfig.max_concurrency,
+        help="role_play 工具同时生成回复的角色数上限",
+    )
+    parser.add_argument(
+        "--role-play-mode",
+        default=RolePlayConfig.mode,
+        choices=ROLE_PLAY_MODES,
+        help="role_play 工具的默认执行模式，fanout 每个人设单独调用，batch / fused 一次生成所有回复",
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="将各环节耗时以 JSONL 追加写入该文件，例如 logs/traces.jsonl",
+    )
+    parser.add_argument(
+        "--warmup-timeout",
+        type=float,
+        default=60.0,
+        help="启动预热时，单个组件的超时秒数",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker 进程数，大于 1 时在 port+1 起的端口上启动 worker，本进程运行会话粘滞的代理",
+    )
+    parser.add_argument(
+        "--proxy-processes",
+        type=int,
+        default=None,
+        help="多进程模式下的代理进程数，共用同一个监听端口；默认每 2 个 worker 一个代理进程",
     )
     args = parser.parse_args()
 
+    if args.workers > 1:
+        if args.checkpointer == "memory":
+            parser.error("多进程模式下 thread 模式的状态需要共享，请使用 --checkpointer sqlite")
+        try:
+            asyncio.run(
+                serve_workers(
+                    sys.argv[1:],
+                    args.host,
+                    args.port,
+                    args.workers,
+                    args.warmup_timeout + 60,
+                    proxy_processes=args.proxy_processes or max(1, args.workers // 2),
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.trace_file:
+        registry.enable_trace(args.trace_file)
+
     config = AppConfig(
         llm=LLMConfig.from_env(args.provider),
+        fallbacks=[
+            LLMConfig.from_env(p)
+            for p in dict.fromkeys(args.fallback_provider)
+            if p != args.provider
+        ],
         mcp=MCPConfig(),
+        checkpoint=CheckpointConfig(backend=args.checkpointer, sqlite_path=args.checkpoint_db),
+        stream=StreamFlushPolicy(
+            max_tokens=args.flush_max_tokens,
+            max_latency=args.flush_interval_ms / 1000,
+        ),
+        scheduler=SchedulerConfig(max_concurrency=args.max_concurrency, max_queue=args.max_queue),
+        http=HTTPPoolConfig(
+            max_connections=args.http_max_connections,
+            keepalive_expiry=args.http_keepalive_expiry,
+        ),
+        role_play=RolePlayConfig(
+            max_concurrency=args.role_play_concurrency, mode=args.role_play_mode
+        ),
+        replay=ReplayConfig(
+            fixtures_dir=args.replay_fixtures,
+            tokens_per_second=args.replay_token_rate,
+            ttft=args.replay_ttft_ms / 1000,
+        ),
+        record_dir=args.record_fixtures,
     )
+    asyncio.run(_serve(config, args.host, args.port, args.warmup_timeout))
+
+
+async def _serve(config: AppConfig, host: str, port: int, warmup_timeout: float) -> None:
+    """在同一个事件循环上完成预热并运行服务，MCP 会话等资源无需跨循环重建"""
+    gr = _import_gradio()
+
+    from utils.web_ui import create_ui, custom_css, theme
+
     service = AgentService(config)
+    report = await service.warmup(warmup_timeout)
+    _print_warmup_report(report)
+    agent = await service.get_agent() if report["agent"]["error"] is None else None
 
-    app = create_ui(
+    ui = create_ui(
         llm_func=make_generate_response(service, config),
         tab_name="Gradio APP - WebUI",
         main_title="Gradio Agent APP",
-        initial_message=[{"role": "assistant", "content": _get_greeting(service)}],
+        initial_message=[{"role": "assistant", "content": _get_greeting(agent)}],
+        # 并发由 AgentService 的调度器控制，不使用 Gradio 队列默认的单并发
+        concurrency_limit=None,
     )
-    app.launch(
-        server_name=args.host,
-        server_port=args.port,
-        share=False,
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+        yield
+        # 退出时在服务所在的事件循环上关闭 MCP 会话与 HTTP 连接池
+        await service.aclose()
+        await http_pool.aclose()
+
+    api = FastAPI(lifespan=lifespan)
+    # 供程序化调用的流式 API，与界面共用 AgentService
+    api.include_router(make_stream_api(service, config))
+
+    # 指标接口：/metrics 为文本格式，/metrics.json 为 JSON 格式
+    @api.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_text() -> str:
+        return registry.render_text()
+
+    @api.get("/metrics.json")
+    async def metrics_json() -> Dict[str, Any]:
+        return {
+            **registry.snapshot(),
+            "scheduler": service.scheduler.stats(),
+            "tool_cache": service.tool_cache.stats(),
+            "providers": service.router.stats() if service.router is not None else {},
+            "http_pool": http_pool.stats(),
+            "role_play": role_play_engine.stats(),
+        }
+
+    app = gr.mount_gradio_app(
+        api,
+        ui,
+        path="/",
+        server_name=host,
+        server_port=port,
         theme=theme,
         css=custom_css,
     )
+    await uvicorn.Server(uvicorn.Config(app, host=host, port=port)).serve()
 
 
 if __name__ == "__main__":
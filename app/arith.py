@@ -0,0 +1,278 @@
+"""
+算术表达式计算引擎
+
+calculator（tools/tool_sci.py）、math MCP 服务（mcp_server/math_mcp/server.py）与 skill 示例中的
+safe_eval 共用本模块，支持的语法与函数、开销上限和报错保持一致。只依赖标准库；
+math MCP 服务与 skill 示例需要能单独复制出去运行，各自带一份副本（mcp_server/math_mcp/arith.py、
+skills/dive-into-langgraph/scripts/tools/arith.py），修改本文件后同步复制过去，
+tests/test_arith.py 会检查副本与本文件一致。
+
+- 表达式先按白名单校验语法树，再编译为字节码，按 (表达式, 变量名, 开销上限) 缓存（LRU），
+  重复计算同一个表达式时不再解析与遍历语法树
+- 表达式长度与运算次数在编译前检查；乘方与乘法改写为 CostGuard 的调用，执行前按操作数估算
+  结果的位数（如 9 ** 9 ** 9 约有 3.7 亿位），超出上限直接拒绝；每次乘方与乘法前检查耗时
+- 所有错误都以 ValueError 抛出：除零、数值溢出、超出上限与不支持的语法各有明确的提示
+"""
+
+import ast
+import functools
+import math
+import operator
+import time
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Dict, Iterable, List, Tuple
+
+# 编译缓存保留的表达式数
+COMPILE_CACHE_SIZE = 1024
+
+LOG10_2 = math.log10(2)
+
+# 支持的二元运算
+BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.FloorDiv: operator.floordiv,
+}
+
+# 支持的一元运算
+UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# 支持的函数（均只接受一个参数）
+FUNCTIONS = {
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log2": math.log2,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "abs": abs,
+}
+
+
+@dataclass(frozen=True)
+class EvalLimits:
+    """单次计算的开销上限"""
+
+    # 表达式最大长度（字符）
+    max_length: int = 1000
+    # 最多运算次数（运算符与函数调用），同时限制了语法树的嵌套深度
+    max_ops: int = 200
+    # 整数结果的最大位数，低于 Python 整数转字符串的默认上限（4300 位）
+    max_digits: int = 4000
+    # 单次计算的最长耗时（秒）
+    timeout: float = 1.0
+
+
+DEFAULT_LIMITS = EvalLimits()
+
+
+class CostGuard:
+    """单次计算的开销预算：统计运算次数，在乘方与乘法前估算结果位数并检查耗时"""
+
+    __slots__ = ("limits", "ops", "deadline")
+
+    def __init__(self, limits: EvalLimits) -> None:
+        self.limits = limits
+        self.ops = 0
+        self.deadline = time.monotonic() + limits.timeout
+
+    def count(self) -> None:
+        self.ops += 1
+        if self.ops > self.limits.max_ops:
+            raise ValueError(f"运算次数超过上限 {self.limits.max_ops}")
+
+    def _check(self, digits: float) -> None:
+        if time.monotonic() > self.deadline:
+            raise ValueError(f"计算超时（超过 {self.limits.timeout} 秒）")
+        if digits > self.limits.max_digits:
+            raise ValueError(f"结果过大：约 {digits:.0f} 位，超过上限 {self.limits.max_digits} 位")
+
+    def pow(self, base: Any, exponent: Any) -> Any:
+        # 只有整数的正整数次幂会产生任意大的整数，浮点数溢出时 Python 会直接报错
+        digits = 0.0
+        if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+            digits = exponent * math.log10(abs(base))
+        self._check(digits)
+        return base**exponent
+
+    def mul(self, left: Any, right: Any) -> Any:
+        # 乘积的二进制位数不超过两个因子位数之和
+        digits = 0.0
+        if isinstance(left, int) and isinstance(right, int):
+            digits = (left.bit_length() + right.bit_length()) * LOG10_2
+        self._check(digits)
+        return left * right
+
+
+# 编译时改写为 CostGuard 调用的运算：a ** b -> __pow(a, b)
+GUARDED_OPS = {ast.Pow: "__pow", ast.Mult: "__mul"}
+
+
+class CompiledExpression:
+    """编译后的表达式，variables 为按位置传入的变量名，ops 为运算次数"""
+
+    __slots__ = ("expression", "variables", "code", "ops")
+
+    def __init__(
+        self, expression: str, variables: Tuple[str, ...], code: CodeType, ops: int
+    ) -> None:
+        self.expression = expression
+        self.variables = variables
+        self.code = code
+        self.ops = ops
+
+    def __call__(
+        self, *args: Any, namespace: Dict[str, Any], guard: CostGuard | None = None
+    ) -> Any:
+        if len(args) != len(self.variables):
+            raise ValueError(f"需要 {len(self.variables)} 个变量，实际传入 {len(args)} 个")
+        guard = guard or CostGuard(DEFAULT_LIMITS)
+        scope = {"__builtins__": {}, **namespace, "__pow": guard.pow, "__mul": guard.mul}
+        if args:
+            scope.update(zip(self.variables, args))
+        return eval(self.code, scope)
+
+
+def check_length(expression: str, limits: EvalLimits = DEFAULT_LIMITS) -> None:
+    """检查表达式非空且不超过长度上限"""
+    if not expression.strip():
+        raise ValueError("表达式不能为空")
+    if len(expression) > limits.max_length:
+        raise ValueError(f"表达式过长：{len(expression)} 个字符，超过上限 {limits.max_length}")
+
+
+def _check(node: ast.AST, variables: Tuple[str, ...], guard: CostGuard) -> ast.AST:
+    # 白名单校验与运算计数，只检查不计算；variables 中的名称可作为变量使用
+    # 同一遍中把乘方与乘法改写为 CostGuard 调用，返回改写后的节点
+    if isinstance(node, ast.Expression):
+        node.body = _check(node.body, variables, guard)
+    elif isinstance(node, ast.Name):
+        if node.id not in variables:
+            raise ValueError(f"不支持变量: {node.id}")
+    elif isinstance(node, ast.BinOp):
+        op_type = type(node.op)
+        if op_type not in BIN_OPS:
+            raise ValueError(f"不支持的二元运算符: {op_type}")
+        guard.count()
+        node.left = _check(node.left, variables, guard)
+        node.right = _check(node.right, variables, guard)
+        if op_type in GUARDED_OPS:
+            location = {
+                "lineno": node.lineno,
+                "col_offset": node.col_offset,
+                "end_lineno": node.end_lineno,
+                "end_col_offset": node.end_col_offset,
+            }
+            func = ast.Name(GUARDED_OPS[op_type], ast.Load(), **location)
+            return ast.Call(func, [node.left, node.right], [], **location)
+    elif isinstance(node, ast.UnaryOp):
+        op_type = type(node.op)
+        if op_type not in UNARY_OPS:
+            raise ValueError(f"不支持的一元运算符: {op_type}")
+        guard.count()
+        node.operand = _check(node.operand, variables, guard)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name):
+            raise ValueError("函数调用格式错误")
+        if node.func.id not in FUNCTIONS:
+            raise ValueError(f"不支持的函数: {node.func.id}")
+        if len(node.args) != 1 or node.keywords:
+            raise ValueError(f"{node.func.id} 函数需要且仅需要一个参数")
+        guard.count()
+        node.args[0] = _check(node.args[0], variables, guard)
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float)):
+            raise ValueError(f"只支持整数或浮点数，不支持 {type(node.value).__name__}")
+    else:
+        raise ValueError(f"不支持的语法: {type(node).__name__}")
+    return node
+
+
+@functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _compile_cached(
+    expression: str, variables: Tuple[str, ...], limits: EvalLimits
+) -> CompiledExpression:
+    # 校验失败的表达式抛出异常，不会进入缓存
+    for name in variables:
+        if not name.isidentifier() or name.startswith("__") or name in FUNCTIONS:
+            raise ValueError(f"无效的变量名: {name}")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"无效的数学表达式: {str(e)}")
+    guard = CostGuard(limits)
+    tree = _check(tree, variables, guard)
+    code = compile(tree, "<arith>", "eval", dont_inherit=True)
+    return CompiledExpression(expression, variables, code, guard.ops)
+
+
+def compile_expression(
+    expression: str, variables: Tuple[str, ...] = (), limits: EvalLimits = DEFAULT_LIMITS
+) -> CompiledExpression:
+    """校验并编译表达式，结果按 (表达式, 变量名, 开销上限) 缓存"""
+    check_length(expression, limits)
+    return _compile_cached(expression, tuple(variables), limits)
+
+
+def run(
+    compiled: CompiledExpression,
+    args: Tuple[Any, ...] = (),
+    namespace: Dict[str, Any] = FUNCTIONS,
+    limits: EvalLimits = DEFAULT_LIMITS,
+) -> Any:
+    """在开销预算内执行编译后的表达式，namespace 为表达式中可用的函数"""
+    try:
+        return compiled(*args, namespace=namespace, guard=CostGuard(limits))
+    except ZeroDivisionError:
+        raise ValueError("除零错误")
+    except OverflowError:
+        raise ValueError("数值溢出")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"无效的数学表达式: {str(e)}")
+
+
+def evaluate(expression: str, limits: EvalLimits = DEFAULT_LIMITS) -> int | float:
+    """计算数学表达式，出错时抛出 ValueError"""
+    result = run(compile_expression(expression, (), limits), limits=limits)
+    if isinstance(result, (int, float)):
+        return result
+    raise ValueError(f"计算结果类型错误: {type(result)}")
+
+
+def evaluate_many(
+    expressions: Iterable[str],
+    limits: EvalLimits = DEFAULT_LIMITS,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """
+    批量计算多个表达式，按输入顺序返回结果。
+
+    return_exceptions 为 True 时，出错的表达式在结果中对应 ValueError 实例，其余照常计算；
+    否则遇到第一个错误即抛出。
+    """
+    results: List[Any] = []
+    for expression in expressions:
+        try:
+            results.append(evaluate(expression, limits))
+        except ValueError as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def cache_info() -> functools._CacheInfo:
+    """编译缓存的命中统计"""
+    return _compile_cached.cache_info()
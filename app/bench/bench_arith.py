@@ -0,0 +1,123 @@
+"""
+算术引擎各入口的基准测试
+
+arith 引擎由 calculator 工具、skill 示例中的 safe_eval 与 math MCP 服务共用（后两者各带一份副本）。
+本脚本对每个入口逐个表达式重复计算，报告单次耗时（微秒）与吞吐（次/秒）：
+
+- engine：arith.evaluate，命中编译缓存
+- engine (cold)：arith.evaluate，每次先清空编译缓存，即首次计算一个表达式的耗时
+- interpret：SafeEvaluator.interpret，逐节点解释执行（引擎之前的实现方式）
+- calculator：calculator 工具的函数体；calculator.invoke 为经过 LangChain 工具调用的完整耗时
+- skill safe_eval：skill 示例的 safe_eval 工具（invoke）
+- mcp math：math MCP 服务的工具函数（含自然语言输入的规范化）
+
+用法：
+    python bench/bench_arith.py
+    python bench/bench_arith.py --repeat 5000 --output logs/bench_arith.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+# 将项目根目录添加到 Python 路径
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import arith  # noqa: E402
+from tools.tool_sci import SafeEvaluator, calculator  # noqa: E402
+
+REPO_DIR = os.path.dirname(APP_DIR)
+
+EXPRESSIONS = [
+    "(3 + 5) * 12",
+    "2 ** 10 - 17 // 4 % 3",
+    "(1.5 + 2.25) * (7 - 3) / 0.5",
+    "sqrt(16) + log10(1000) * sin(0.5)",
+]
+
+
+def _load(name: str, *path: str) -> Any:
+    # skill 与 MCP 服务不在 app 的导入路径上，按文件路径加载
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _cold_evaluate(expression: str) -> Any:
+    arith._compile_cached.cache_clear()
+    return arith.evaluate(expression)
+
+
+def entry_points() -> List[Tuple[str, Callable[[str], Any]]]:
+    """(入口名, 计算函数)"""
+    skill = _load(
+        "skill_tool_math", "skills", "dive-into-langgraph", "scripts", "tools", "tool_math.py"
+    )
+    mcp = _load("math_mcp_server", "mcp_server", "math_mcp", "server.py")
+    evaluator = SafeEvaluator()
+    return [
+        ("engine", arith.evaluate),
+        ("engine (cold)", _cold_evaluate),
+        ("interpret", evaluator.interpret),
+        ("calculator", calculator.func),
+        ("calculator.invoke", lambda e: calculator.invoke({"expression": e})),
+        ("skill safe_eval", lambda e: skill.safe_eval.invoke({"expression": e})),
+        ("mcp math", mcp.math),
+    ]
+
+
+def bench_entry(func: Callable[[str], Any], expression: str, repeat: int) -> Dict[str, float]:
+    """重复计算 repeat 次，返回平均单次耗时（微秒）与吞吐（次/秒）"""
+    func(expression)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(expression)
+    elapsed = time.perf_counter() - started
+    return {"latency_us": elapsed / repeat * 1e6, "throughput": repeat / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="算术引擎各入口的基准测试")
+    parser.add_argument("--repeat", type=int, default=2000, help="每个表达式的重复计算次数")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    rows = []
+    for name, func in entry_points():
+        for expression in EXPRESSIONS:
+            # 入口不支持的表达式跳过（如 MCP 服务只接受四则运算）
+            try:
+                result = bench_entry(func, expression, args.repeat)
+            except ValueError:
+                continue
+            rows.append({"entry": name, "expression": expression, **result})
+
+    print(f"每个表达式重复计算 {args.repeat} 次，平均单次耗时（us）：")
+    print(f"{'entry':<18}" + "".join(f"{f'#{i + 1}':>10}" for i in range(len(EXPRESSIONS))))
+    for name in dict.fromkeys(row["entry"] for row in rows):
+        latencies = {row["expression"]: row["latency_us"] for row in rows if row["entry"] == name}
+        cells = [f"{latencies[e]:>10.1f}" if e in latencies else f"{'-':>10}" for e in EXPRESSIONS]
+        print(f"{name:<18}" + "".join(cells))
+    print()
+    for i, expression in enumerate(EXPRESSIONS):
+        print(f"#{i + 1}: {expression}")
+    print()
+    print(f"{'entry':<18} {'throughput (次/秒)':>16}")
+    for name in dict.fromkeys(row["entry"] for row in rows):
+        throughputs = [row["throughput"] for row in rows if row["entry"] == name]
+        print(f"{name:<18} {sum(throughputs) / len(throughputs):>16.0f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+calculator 表达式计算基准测试
+
+对比 SafeEvaluator 的三种计算方式：
+- interpret：每次解析语法树并逐节点解释执行（原有实现）
+- compiled：校验后编译为字节码，按表达式缓存，重复表达式直接执行
+- vectorized：一个带变量的表达式在 NumPy 数组上一次算出所有输入
+
+用法：
+    python bench/bench_calculator.py
+    python bench/bench_calculator.py --repeat 20000 --size 100000 --output logs/bench_calculator.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+# 将项目根目录添加到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.tool_sci import SafeEvaluator  # noqa: E402
+
+EXPRESSIONS = [
+    "(3 + 5) * 12",
+    "sqrt(16) + 2 ** 10",
+    "(sqrt(9) + 1) ** 2 / 3",
+    "log10(1000) * sin(0.5) + cos(0.5) - tan(0.1)",
+    "abs(-7.5) * exp(1) - log2(1024) % 3 + 17 // 4",
+]
+
+VECTOR_EXPRESSION = "sqrt(x ** 2 + y ** 2) * sin(x) + log(abs(y) + 1)"
+
+
+def time_per_call(func: Callable[[], Any], repeat: int) -> float:
+    """运行 repeat 次 func，返回平均每次耗时（微秒）"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def bench_scalar(evaluator: SafeEvaluator, repeat: int) -> List[Dict[str, Any]]:
+    """同一表达式重复计算：interpret 与 compiled（命中编译缓存）的单次耗时"""
+    rows = []
+    for expression in EXPRESSIONS:
+        interpret_us = time_per_call(lambda: evaluator.interpret(expression), repeat)
+        compiled_us = time_per_call(lambda: evaluator.evaluate(expression), repeat)
+        rows.append(
+            {
+                "expression": expression,
+                "interpret_us": interpret_us,
+                "compiled_us": compiled_us,
+                "speedup": interpret_us / compiled_us,
+            }
+        )
+    return rows
+
+
+def bench_vectorized(evaluator: SafeEvaluator, size: int) -> Dict[str, Any]:
+    """同一表达式在 size 组输入上计算：逐个 interpret 与一次 vectorized 的总耗时"""
+    import numpy as np
+
+    rng = random.Random(0)
+    xs = [rng.uniform(-100, 100) for _ in range(size)]
+    ys = [rng.uniform(-100, 100) for _ in range(size)]
+
+    started = time.perf_counter()
+    for x, y in zip(xs, ys):
+        expression = VECTOR_EXPRESSION.replace("x", f"({x!r})").replace("y", f"({y!r})")
+        evaluator.interpret(expression)
+    interpret_ms = (time.perf_counter() - started) * 1000
+
+    x_array, y_array = np.array(xs), np.array(ys)
+    started = time.perf_counter()
+    evaluator.evaluate_vectorized(VECTOR_EXPRESSION, x=x_array, y=y_array)
+    vectorized_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "expression": VECTOR_EXPRESSION,
+        "size": size,
+        "interpret_ms": interpret_ms,
+        "vectorized_ms": vectorized_ms,
+        "speedup": interpret_ms / vectorized_ms,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="calculator 表达式计算基准测试")
+    parser.add_argument("--repeat", type=int, default=5000, help="每个表达式的重复计算次数")
+    parser.add_argument("--size", type=int, default=10000, help="向量化计算的输入组数")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    evaluator = SafeEvaluator()
+    scalar = bench_scalar(evaluator, args.repeat)
+    vectorized = bench_vectorized(evaluator, args.size)
+
+    print(f"单个表达式重复计算 {args.repeat} 次，平均每次耗时：")
+    print(f"{'expression':<48} {'interpret (us)':>15} {'compiled (us)':>14} {'speedup':>8}")
+    for row in scalar:
+        print(
+            f"{row['expression']:<48} {row['interpret_us']:>15.2f} "
+            f"{row['compiled_us']:>14.2f} {row['speedup']:>7.1f}x"
+        )
+    print()
+    print(f"{vectorized['expression']} 在 {vectorized['size']} 组输入上计算：")
+    print(
+        f"interpret {vectorized['interpret_ms']:.1f} ms，"
+        f"vectorized {vectorized['vectorized_ms']:.2f} ms，{vectorized['speedup']:.0f}x"
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            report = {"args": vars(args), "scalar": scalar, "vectorized": vectorized}
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
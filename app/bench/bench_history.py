@@ -0,0 +1,69 @@
+"""
+历史消息清洗基准测试
+
+模拟一段带工具调用 HTML 的长对话，对比每轮全量清洗（build_llm_messages）
+与按会话增量清洗（LLMMessageCache）的单轮耗时。
+
+用法：
+    python bench/bench_history.py --turns 250
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# 将项目根目录添加到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import LLMMessageCache, build_llm_messages  # noqa: E402
+from utils.tool_view import format_tool_call, format_tool_result  # noqa: E402
+
+
+def _assistant_turn(index: int) -> str:
+    return "".join(
+        [
+            format_tool_call("calculator", {"expression": f"{index} * 3"}),
+            format_tool_result("calculator", str(index * 3)),
+            f"第 {index} 轮的结果是 {index * 3}。" * 20,
+        ]
+    )
+
+
+def _run(turns: int, checkpoints: list[int]) -> list[tuple[int, float, float]]:
+    cache = LLMMessageCache()
+    history: list[dict] = []
+    rows = []
+    for turn in range(1, turns + 1):
+        history.append({"role": "user", "content": f"问题 {turn}"})
+
+        # Gradio 每轮都会重新反序列化历史，这里同样传入新的 dict
+        snapshot = [dict(m) for m in history]
+
+        start = time.perf_counter()
+        build_llm_messages(snapshot)
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        cache.build("bench", snapshot)
+        cached_ms = (time.perf_counter() - start) * 1000
+
+        if turn in checkpoints:
+            rows.append((turn, full_ms, cached_ms))
+        history.append({"role": "assistant", "content": _assistant_turn(turn)})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="历史消息清洗基准测试")
+    parser.add_argument("--turns", type=int, default=250, help="对话轮数")
+    args = parser.parse_args()
+
+    checkpoints = sorted({1, 10, 50, 100, 200, args.turns} & set(range(1, args.turns + 1)))
+    print(f"{'turn':>6} {'full (ms)':>12} {'cached (ms)':>12}")
+    for turn, full_ms, cached_ms in _run(args.turns, checkpoints):
+        print(f"{turn:>6} {full_ms:>12.3f} {cached_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
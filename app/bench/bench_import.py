@@ -0,0 +1,122 @@
+"""
+导入耗时分析与启动预算
+
+在新进程中用 python -X importtime 导入 app.py，汇总总耗时与各顶层包的耗时，并检查：
+- 总耗时不超过 --budget-ms（取多次运行的中位数）
+- LAZY_MODULES 中的慢模块没有在导入 app.py 时被加载（它们应在首次使用时才导入）
+
+超出预算时以非零状态退出，可直接放进 CI。
+
+用法：
+    python bench/bench_import.py
+    python bench/bench_import.py --runs 5 --budget-ms 2000 --output logs/import_profile.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 app.py 时不应加载的模块（按需懒加载）
+LAZY_MODULES = ("gradio", "dashscope", "langchain_mcp_adapters", "langchain_openai")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 的输出，返回 (模块名, 自身耗时 us, 累计耗时 us)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_once(module: str = "app") -> Dict[str, Any]:
+    """在新进程中导入 module，返回耗时明细与已加载的懒加载模块"""
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = parse_importtime(result.stderr)
+    total_us = next(cumulative for name, _, cumulative in reversed(rows) if name == module)
+    return {
+        "total_ms": total_us / 1000,
+        "rows": rows,
+        "loaded_lazy_modules": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def by_package(rows: List[Tuple[str, int, int]], top: int) -> List[Tuple[str, float]]:
+    """按顶层包汇总自身耗时（ms），从高到低取前 top 个"""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [(name, us / 1000) for name, us in ranked]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="导入耗时分析与启动预算")
+    parser.add_argument("--module", default="app", help="要导入的模块")
+    parser.add_argument("--runs", type=int, default=3, help="运行次数（另有一次不计入的预热）")
+    parser.add_argument("--budget-ms", type=float, default=2500.0, help="导入总耗时预算（毫秒）")
+    parser.add_argument("--top", type=int, default=15, help="展示耗时最多的前几个顶层包")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    # 预热一次：生成 .pyc 并让文件进入系统缓存
+    profile_once(args.module)
+    runs = [profile_once(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(run["total_ms"] for run in runs)
+    packages = by_package(runs[-1]["rows"], args.top)
+    loaded = runs[-1]["loaded_lazy_modules"]
+
+    print(
+        f"import {args.module}: {total_ms:.0f} ms（{args.runs} 次中位数，预算 {args.budget_ms:.0f} ms）"
+    )
+    print(f"{'package':<32} {'self (ms)':>10}")
+    for name, ms in packages:
+        print(f"{name:<32} {ms:>10.1f}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"导入耗时 {total_ms:.0f} ms 超出预算 {args.budget_ms:.0f} ms")
+    if loaded:
+        failures.append(f"以下模块应懒加载，却在导入时被加载：{', '.join(loaded)}")
+
+    if args.output:
+        report = {
+            "module": args.module,
+            "total_ms": total_ms,
+            "runs_ms": [run["total_ms"] for run in runs],
+            "budget_ms": args.budget_ms,
+            "packages_ms": dict(packages),
+            "loaded_lazy_modules": loaded,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✓ 符合启动预算")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+并发压测
+
+用 replay provider（见 utils/replay.py）离线驱动 make_generate_response，模拟 N 个并发会话的多轮对话：
+每个会话先带上一段含工具调用 HTML 的历史，再依次发送普通问题与触发工具调用的问题。
+报告吞吐、首字延迟（TTFT）与界面更新间隔（ITL）的分位数、事件循环延迟与内存增长，
+并把结果写成 JSON，便于在不同提交之间对比。
+
+用法：
+    python bench/bench_load.py --sessions 32 --turns 4 --output logs/bench_load.json
+    python bench/bench_load.py --sessions 32 --baseline logs/bench_load.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+# 将项目根目录添加到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (  # noqa: E402
+    TYPING_INDICATOR_HTML,
+    AgentService,
+    AppConfig,
+    LLMConfig,
+    MCPConfig,
+    SchedulerConfig,
+    make_generate_response,
+)
+from utils.http_pool import http_pool  # noqa: E402
+from utils.replay import ReplayConfig  # noqa: E402
+from utils.tool_view import format_tool_call, format_tool_result  # noqa: E402
+
+# 依次发送的问题：普通问题走 default fixture，“计算”会触发 calculator 工具调用
+PROMPTS = ["你好", "请帮我计算 (3 + 5) * 12"]
+
+GenerateResponse = Callable[..., AsyncIterator[Any]]
+
+
+def make_history(turns: int) -> List[Dict[str, str]]:
+    """生成一段多轮历史，偶数轮的回复带工具调用 HTML"""
+    history: List[Dict[str, str]] = []
+    for index in range(turns):
+        history.append({"role": "user", "content": f"问题 {index}"})
+        if index % 2 == 0:
+            content = "".join(
+                [
+                    format_tool_call("calculator", {"expression": f"{index} * 3"}),
+                    format_tool_result("calculator", str(index * 3)),
+                    f"第 {index} 轮的结果是 {index * 3}。",
+                ]
+            )
+        else:
+            content = f"这是第 {index} 轮的回答。" * 5
+        history.append({"role": "assistant", "content": content})
+    return history
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """精确分位数（最近秩），单位与输入一致"""
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+    return {
+        "count": len(ordered),
+        "p50": rank(0.5),
+        "p90": rank(0.9),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def rss_bytes() -> int:
+    """当前常驻内存；取不到 /proc 时退回进程峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopLagMonitor:
+    """按固定间隔 sleep，记录实际唤醒时间相对预期的延迟"""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def _run_turn(
+    generate_response: GenerateResponse,
+    message: str,
+    history: List[Dict[str, Any]],
+    request: Any,
+    turn: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    last_at: Optional[float] = None
+    last_content = None
+    async for _, history in generate_response(message, history, request):
+        content = history[-1]["content"]
+        if not content or content.startswith(TYPING_INDICATOR_HTML) or content == last_content:
+            continue
+        now = time.perf_counter()
+        if last_at is None:
+            turn["ttft"] = now - started
+        else:
+            turn["itl"].append(now - last_at)
+        last_at, last_content = now, content
+    turn["duration"] = time.perf_counter() - started
+    turn["chars"] = len(last_content or "")
+    return history
+
+
+async def _run_session(
+    generate_response: GenerateResponse,
+    session: int,
+    turns: int,
+    history_turns: int,
+    results: List[Dict[str, Any]],
+) -> None:
+    request = SimpleNamespace(session_hash=f"bench-{session}")
+    history: List[Dict[str, Any]] = make_history(history_turns)
+    for index in range(turns):
+        message = PROMPTS[(session + index) % len(PROMPTS)]
+        turn: Dict[str, Any] = {"session": session, "ttft": None, "itl": [], "error": None}
+        try:
+            # Gradio 每轮都会重新反序列化历史，这里同样传入新的 dict
+            history = await _run_turn(
+                generate_response, message, [dict(m) for m in history], request, turn
+            )
+        except Exception as err:
+            turn["error"] = repr(err)
+        results.append(turn)
+
+
+async def run_load(
+    generate_response: GenerateResponse,
+    sessions: int,
+    turns: int,
+    history_turns: int = 10,
+) -> Dict[str, Any]:
+    """并发运行 sessions 个会话，每个会话 turns 轮，返回汇总结果"""
+    results: List[Dict[str, Any]] = []
+    monitor = LoopLagMonitor()
+    rss_start = rss_bytes()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _run_session(generate_response, session, turns, history_turns, results)
+            for session in range(sessions)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    rss_end = rss_bytes()
+
+    completed = [t for t in results if t["error"] is None and t["ttft"] is not None]
+    return {
+        "sessions": sessions,
+        "turns": len(results),
+        "errors": sum(1 for t in results if t["error"] is not None),
+        "elapsed_seconds": elapsed,
+        "throughput": {
+            "turns_per_second": len(completed) / elapsed if elapsed else 0.0,
+            "chars_per_second": sum(t["chars"] for t in completed) / elapsed if elapsed else 0.0,
+        },
+        "ttft_ms": percentiles([t["ttft"] * 1000 for t in completed]),
+        "itl_ms": percentiles([gap * 1000 for t in completed for gap in t["itl"]]),
+        "turn_ms": percentiles([t["duration"] * 1000 for t in completed]),
+        "loop_lag_ms": percentiles([lag * 1000 for lag in monitor.samples]),
+        "rss_mb": {
+            "start": rss_start / 2**20,
+            "end": rss_end / 2**20,
+            "growth": (rss_end - rss_start) / 2**20,
+        },
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 对比基线时关注的指标：(路径, 数值越大越好)
+COMPARED_METRICS = [
+    (("throughput", "turns_per_second"), True),
+    (("ttft_ms", "p50"), False),
+    (("ttft_ms", "p99"), False),
+    (("itl_ms", "p50"), False),
+    (("itl_ms", "p99"), False),
+    (("loop_lag_ms", "p99"), False),
+    (("rss_mb", "growth"), False),
+]
+
+
+def _print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(
+        f"{results['sessions']} 个会话，{results['turns']} 轮，"
+        f"{results['errors']} 个错误，耗时 {results['elapsed_seconds']:.2f}s"
+    )
+    print(f"{'metric':<28} {'value':>12} {'baseline':>12} {'change':>9}")
+    for path, higher_is_better in COMPARED_METRICS:
+        value = results[path[0]][path[1]]
+        line = f"{'.'.join(path):<28} {value:>12.2f}"
+        if baseline is not None:
+            old = baseline[path[0]][path[1]]
+            change = (value - old) / old * 100 if old else 0.0
+            worse = change < 0 if higher_is_better else change > 0
+            line += f" {old:>12.2f} {change:>+8.1f}%{' !' if worse and abs(change) > 10 else ''}"
+        print(line)
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    config = AppConfig(
+        llm=LLMConfig.from_env("replay"),
+        replay=ReplayConfig(
+            fixtures_dir=args.fixtures,
+            tokens_per_second=args.token_rate,
+            ttft=args.ttft_ms / 1000,
+        ),
+        scheduler=SchedulerConfig(
+            max_concurrency=args.max_concurrency or args.sessions,
+            max_queue=max(args.sessions, SchedulerConfig.max_queue),
+        ),
+    )
+    if args.no_mcp:
+        config.mcp = MCPConfig(enabled=frozenset())
+    service = AgentService(config)
+    try:
+        # 预热：启动 MCP 服务并构建 Agent，不计入压测
+        await service.get_agent()
+        return await run_load(
+            make_generate_response(service, config), args.sessions, args.turns, args.history
+        )
+    finally:
+        await service.aclose()
+        await http_pool.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="并发压测")
+    parser.add_argument("--sessions", type=int, default=16, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=4, help="每个会话的对话轮数")
+    parser.add_argument("--history", type=int, default=10, help="每个会话预置的历史轮数")
+    parser.add_argument(
+        "--max-concurrency", type=int, default=None, help="准入并发上限，默认等于会话数"
+    )
+    parser.add_argument("--fixtures", default="./bench/fixtures", help="回放 fixture 目录")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="回放每秒输出的 chunk 数")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="回放的首字延迟（毫秒）")
+    parser.add_argument("--no-mcp", action="store_true", help="不启动 MCP 服务")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与之前写出的 JSON 结果对比")
+    args = parser.parse_args()
+
+    results = asyncio.run(_main(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    _print_report(results, baseline)
+
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+role_play 执行模式基准测试
+
+对比 fanout（每个人设单独调用 + 评选）、batch（一次生成所有回复 + 评选）与 fused（一次生成并评选）
+三种模式的耗时、模型调用次数与 token 消耗。
+
+默认使用 replay provider 离线运行：fixture 中的回复按 token 切分后回放，首字延迟与输出速率
+由 --ttft-ms、--token-rate 模拟，耗时随调用次数与输出长度变化。provider 未返回用量时（如回放），
+token 数按字符粗略估计（CJK 字符每个计 1 个，其余连续字符每 4 个计 1 个），结果中会标明。
+也可以用 --provider 指定真实 provider，此时使用 provider 返回的用量。
+
+用法：
+    python bench/bench_role_play.py --runs 5
+    python bench/bench_role_play.py --provider dashscope --runs 3 --output logs/bench_role_play.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 将项目根目录添加到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import LLMConfig  # noqa: E402
+from bench.bench_load import percentiles  # noqa: E402
+from tools.tool_role import ROLE_PLAY_MODES, RolePlayEngine, role_play  # noqa: E402
+from utils.http_pool import http_pool  # noqa: E402
+from utils.replay import Fixture, ReplayTransport, load_fixtures  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DEFAULT_ROLES = role_play.args_schema.model_fields["roles"].default
+DEFAULT_SITUATION = role_play.args_schema.model_fields["situation"].default
+
+
+def _is_cjk(char: str) -> bool:
+    return (
+        "\u2e80" <= char <= "\u9fff" or "\u3000" <= char <= "\u303f" or "\uff00" <= char <= "\uffef"
+    )
+
+
+def split_tokens(text: str) -> List[str]:
+    """把文本粗略切成 token：CJK 字符每个一个，其余连续字符每 4 个一个"""
+    pieces: List[str] = []
+    buffer = ""
+    for char in text:
+        if _is_cjk(char):
+            if buffer:
+                pieces.append(buffer)
+                buffer = ""
+            pieces.append(char)
+        else:
+            buffer += char
+            if len(buffer) == 4:
+                pieces.append(buffer)
+                buffer = ""
+    if buffer:
+        pieces.append(buffer)
+    return pieces
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数，口径与 split_tokens 一致"""
+    return len(split_tokens(text))
+
+
+def tokenize_fixture(fixture: Fixture) -> Fixture:
+    """把 fixture 中的整段回复拆成逐 token 的 chunk，使回放耗时与输出长度成正比"""
+    chunks = []
+    for chunk in fixture.chunks:
+        choice = (chunk.get("choices") or [{}])[0]
+        content = (choice.get("delta") or {}).get("content")
+        if not content:
+            chunks.append(chunk)
+            continue
+        chunks.extend(
+            {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            for piece in split_tokens(content)
+        )
+    return Fixture(chunks, fixture.match, fixture.step)
+
+
+class UsageTracker(BaseCallbackHandler):
+    """统计模型调用次数、输入与输出 token（provider 未返回用量时按字符估计）"""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self._prompts: Dict[Any, str] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._prompts[run_id] = "".join(str(m.content) for batch in messages for m in batch)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self.calls += 1
+        prompt = self._prompts.pop(run_id, "")
+        generation = response.generations[0][0]
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+        if usage.get("input_tokens"):
+            self.prompt_tokens += usage["input_tokens"]
+            self.completion_tokens += usage.get("output_tokens", 0)
+        else:
+            self.estimated = True
+            self.prompt_tokens += estimate_tokens(prompt)
+            self.completion_tokens += estimate_tokens(generation.text)
+
+
+async def run_mode(
+    engine: RolePlayEngine, llm: LLMConfig, mode: str, runs: int, roles: List[str]
+) -> Dict[str, Any]:
+    """顺序运行 runs 次指定模式，返回耗时分位数与平均每次的调用数、token 数"""
+    graph = engine.get_graph(llm.base_url, llm.model, llm.api_key, mode)
+    tracker = UsageTracker()
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await graph.ainvoke(
+            {"roles": roles, "situation": DEFAULT_SITUATION},
+            {"max_concurrency": engine.config.max_concurrency, "callbacks": [tracker]},
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "mode": mode,
+        "latency_ms": percentiles(latencies),
+        "calls": tracker.calls / runs,
+        "prompt_tokens": tracker.prompt_tokens / runs,
+        "completion_tokens": tracker.completion_tokens / runs,
+        "tokens_estimated": tracker.estimated,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="role_play 执行模式基准测试")
+    parser.add_argument(
+        "--provider",
+        default="replay",
+        choices=["replay", "dashscope", "ark", "ollama"],
+        help="LLM 提供商，默认离线回放",
+    )
+    parser.add_argument("--modes", nargs="+", default=list(ROLE_PLAY_MODES), help="要对比的模式")
+    parser.add_argument("--runs", type=int, default=5, help="每种模式的运行次数")
+    parser.add_argument("--concurrency", type=int, default=4, help="fanout 模式的并发数")
+    parser.add_argument("--ttft-ms", type=float, default=500.0, help="回放时每次调用的首字延迟")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="回放时每秒输出的 token 数")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    llm = LLMConfig.from_env(args.provider)
+    if args.provider == "replay":
+        fixtures = [tokenize_fixture(f) for f in load_fixtures(FIXTURES_DIR)]
+        replay = ReplayTransport(fixtures, args.token_rate, args.ttft_ms / 1000)
+        http_pool.mount(llm.base_url, transport=replay, async_transport=replay)
+    engine = RolePlayEngine()
+    engine.config.max_concurrency = args.concurrency
+
+    async def run_all() -> List[Dict[str, Any]]:
+        try:
+            return [
+                await run_mode(engine, llm, mode, args.runs, DEFAULT_ROLES) for mode in args.modes
+            ]
+        finally:
+            await http_pool.aclose()
+
+    rows = asyncio.run(run_all())
+
+    print(f"provider: {args.provider}，{len(DEFAULT_ROLES)} 个人设，每种模式 {args.runs} 次")
+    print(
+        f"{'mode':<8} {'calls':>6} {'p50 (ms)':>10} {'max (ms)':>10} "
+        f"{'prompt tok':>11} {'output tok':>11} {'total tok':>10}"
+    )
+    for row in rows:
+        total = row["prompt_tokens"] + row["completion_tokens"]
+        print(
+            f"{row['mode']:<8} {row['calls']:>6.1f} {row['latency_ms']['p50']:>10.1f} "
+            f"{row['latency_ms']['max']:>10.1f} {row['prompt_tokens']:>11.0f} "
+            f"{row['completion_tokens']:>11.0f} {total:>10.0f}"
+        )
+    if any(row["tokens_estimated"] for row in rows):
+        print("* provider 未返回用量，token 数为按字符估计的值")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            report = {"provider": args.provider, "args": vars(args), "results": rows}
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
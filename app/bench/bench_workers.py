@@ -0,0 +1,157 @@
+"""
+多进程扩展性基准测试
+
+分别以 --workers 1、2、4 … 启动 app.py（replay provider，不限速、无首字延迟），
+通过代理向 POST /api/chat 并发发送带长历史（含工具调用 HTML）的请求，
+统计各 worker 数下的吞吐与延迟，衡量多进程模式的扩展性。结果见 docs/bench-workers.md。
+
+用法：
+    python bench/bench_workers.py --workers 1 2 4 --concurrency 32 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 将项目根目录添加到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.bench_load import PROMPTS, make_history, percentiles  # noqa: E402
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_app(workers: int, port: int, proxy_processes: Optional[int]) -> subprocess.Popen:
+    command = [
+        sys.executable,
+        os.path.join(APP_DIR, "app.py"),
+        "--provider",
+        "replay",
+        "--replay-token-rate",
+        "0",
+        "--replay-ttft-ms",
+        "0",
+        "--max-concurrency",
+        "64",
+        "--max-queue",
+        "256",
+        "--port",
+        str(port),
+        "--workers",
+        str(workers),
+    ]
+    if proxy_processes:
+        command += ["--proxy-processes", str(proxy_processes)]
+    return subprocess.Popen(
+        command, cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/metrics")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} 未能在 {timeout}s 内就绪")
+
+
+async def _drive(url: str, concurrency: int, duration: float, history_turns: int) -> Dict[str, Any]:
+    history = make_history(history_turns)
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client_loop(index: int, client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        turn = 0
+        while time.monotonic() < deadline:
+            body = {"message": PROMPTS[(index + turn) % len(PROMPTS)], "history": history}
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{url}/api/chat", json=body, headers={"X-Session-ID": uuid.uuid4().hex}
+                )
+                if response.status_code != 200 or "event: error" in response.text:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors += 1
+            turn += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(i, client) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_ms": percentiles([latency * 1000 for latency in latencies]),
+    }
+
+
+async def _run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    rows = []
+    for workers in args.workers:
+        process = _start_app(workers, args.port, args.proxy_processes)
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            await _wait_ready(url, args.ready_timeout)
+            # 预热：每个 worker 的首个请求包含 Agent 构建等一次性开销
+            await _drive(url, args.concurrency, 2.0, args.history)
+            result = await _drive(url, args.concurrency, args.duration, args.history)
+        finally:
+            process.terminate()
+            process.wait(30)
+        rows.append({"workers": workers, **result})
+        print(
+            f"{workers:>7} {result['requests_per_second']:>10.1f} "
+            f"{result['latency_ms']['p50']:>10.1f} {result['latency_ms']['p99']:>10.1f} "
+            f"{result['errors']:>7}"
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="多进程扩展性基准测试")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker 数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=20.0, help="每组测试的秒数")
+    parser.add_argument("--history", type=int, default=40, help="每个请求携带的历史轮数")
+    parser.add_argument("--port", type=int, default=7960, help="代理端口，worker 使用其后的端口")
+    parser.add_argument(
+        "--proxy-processes", type=int, default=None, help="代理进程数，默认由 app.py 决定"
+    )
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="等待服务就绪的秒数")
+    parser.add_argument("--output", default=None, help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    print(f"CPU 核数：{os.cpu_count()}")
+    print(f"{'workers':>7} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'errors':>7}")
+    rows = asyncio.run(_run(args))
+
+    if args.output:
+        report = {"cpu_count": os.cpu_count(), "args": vars(args), "results": rows}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,30 @@
 增强版系统提示词
 """
 
+import datetime
+import functools
+from typing import Optional
+
 agent_system_prompt = """
 你是一个智能助手
 
 思考标准：
 1. 根据用户问题的复杂程度调整思考深度
 2. 以下是系统环境信息：
-  - 当前时间：{current_time}
   - 当前时区：{current_timezone}
   - 用户名：{username}
   - 操作系统：{user_os}
+  - 当前时间：{current_time}
 """.strip()
 
+# 系统提示词是每次模型调用的第一段输入，逐字节不变时 provider 端的前缀（KV）缓存才能命中。
+# 因此随时间变化的字段放在末尾，并且只精确到小时：同一小时内的系统提示词完全相同
+TIME_FORMAT = "%Y-%m-%d %H:00"
 
-def get_system_prompt() -> str:
-    """获取系统提示词"""
+
+@functools.cache
+def get_static_prefix() -> str:
+    """系统提示词中不随时间变化的部分，进程内只计算一次"""
     # 延迟导入
     from utils.device_info import get_info
 
@@ -24,14 +33,21 @@ def get_system_prompt() -> str:
     raw_os = get_info("操作系统 (platform)") or "Unknown"
     user_os = "macOS" if raw_os == "Darwin" else raw_os
 
-    return agent_system_prompt.format(
-        current_time=get_info("当前时间 (now)"),
+    # 模板以 {current_time} 结尾，之前的部分都是静态的
+    static, _, _ = agent_system_prompt.partition("{current_time}")
+    return static.format(
         current_timezone=get_info("时区 (timezone)"),
         username=get_info("用户名 (username)"),
         user_os=user_os,
     )
 
 
+def get_system_prompt(now: Optional[datetime.datetime] = None) -> str:
+    """获取系统提示词"""
+    now = now or datetime.datetime.now()
+    return get_static_prefix() + now.strftime(TIME_FORMAT)
+
+
 if __name__ == "__main__":
     import os
     import sys
@@ -36,7 +36,8 @@ tool_description = """
 
 def get_system_prompt() -> str:
     """获取系统提示词"""
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # 时间位于提示词末尾且只精确到小时，同一小时内提示词逐字节不变，便于 provider 端的前缀缓存命中
+    current_time = datetime.now().strftime("%Y-%m-%d %H:00")
     return agent_system_prompt.format(
         current_time=current_time,
     )
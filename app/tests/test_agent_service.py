@@ -1,6 +1,12 @@
+import asyncio
 import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, ToolMessage
 
 from app import AgentService, AppConfig, LLMConfig, MCPConfig
+from utils.llm_router import HedgedChatModel
 
 
 class NamedTool:
@@ -40,5 +46,103 @@ class AgentServiceToolTests(unittest.TestCase):
                 self.assertNotIn("subagent_search_brief", tool_names)
 
 
+class SearchBriefCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_briefs_are_cached_and_coalesced_per_normalized_query(self):
+        service = AgentService(
+            AppConfig(llm=LLMConfig.from_env("dashscope"), mcp=MCPConfig(enabled=frozenset()))
+        )
+        queries = []
+
+        class FakeSubagent:
+            async def ainvoke(self, inputs, config, context):
+                queries.append(inputs["messages"][0]["content"])
+                await asyncio.sleep(0.01)
+                return {"messages": [AIMessage(content=f"摘要：{len(queries)}")]}
+
+        service._search_subagent = FakeSubagent()
+        brief = service._make_search_brief_tool()
+        middleware = service._tool_cache_middleware()
+        runtime = SimpleNamespace(context=None)
+
+        async def handler(request):
+            content = await brief.coroutine(
+                query=request.tool_call["args"]["query"], runtime=runtime
+            )
+            return ToolMessage(content=content, tool_call_id=request.tool_call["id"])
+
+        def call(query, call_id, api_key="key-a"):
+            request = SimpleNamespace(
+                tool=brief,
+                tool_call={"name": brief.name, "args": {"query": query}, "id": call_id},
+                runtime=SimpleNamespace(context=SimpleNamespace(api_key=api_key)),
+            )
+            return middleware.awrap_tool_call(request, handler)
+
+        concurrent = await asyncio.gather(call("LangGraph 1.0", "a"), call(" langgraph  1.0", "b"))
+        later = await call("LANGGRAPH 1.0", "c")
+        other = await call("LangChain", "d")
+
+        other_key = await call("LangGraph 1.0", "e", api_key="key-b")
+
+        self.assertEqual(queries, ["LangGraph 1.0", "LangChain", "LangGraph 1.0"])
+        self.assertEqual([m.content for m in [*concurrent, later]], ["摘要：1"] * 3)
+        self.assertEqual(other.content, "摘要：2")
+        self.assertEqual(other_key.content, "摘要：3")
+        self.assertEqual(
+            service.tool_cache.stats()["tools"]["subagent_search_brief"],
+            {"hits": 1, "misses": 4, "hit_rate": 0.2},
+        )
+
+
+class AgentServiceLLMTests(unittest.TestCase):
+    def test_single_provider_uses_plain_chat_model(self):
+        service = AgentService(AppConfig(llm=LLMConfig.from_env("ollama")))
+
+        self.assertIsNone(service.router)
+        self.assertNotIsInstance(service.llm, HedgedChatModel)
+
+    def test_fallback_providers_are_hedged_in_order(self):
+        service = AgentService(
+            AppConfig(
+                llm=LLMConfig.from_env("ollama"),
+                fallbacks=[LLMConfig(provider="ark", model="m", base_url="http://x", api_key="k")],
+            )
+        )
+
+        self.assertIsInstance(service.llm, HedgedChatModel)
+        self.assertEqual(service.router.order(), ["ollama", "ark"])
+
+
+class SlowMCPPool:
+    server_names = ["fast", "slow"]
+
+    async def get_tools(self, server_name=None):
+        if server_name == "slow":
+            await asyncio.sleep(10)
+        return []
+
+
+class AgentServiceWarmupTests(unittest.IsolatedAsyncioTestCase):
+    async def test_warmup_reports_each_component_and_isolates_timeouts(self):
+        service = AgentService(
+            AppConfig(llm=LLMConfig.from_env("ollama"), mcp=MCPConfig(enabled=frozenset()))
+        )
+        service._mcp_pool = SlowMCPPool()
+
+        async def get_agent():
+            return object()
+
+        with patch.object(service, "get_agent", get_agent):
+            report = await service.warmup(timeout=0.2)
+
+        self.assertEqual(list(report)[-1], "agent")
+        self.assertEqual(set(report), {"llm", "mcp:fast", "mcp:slow", "agent"})
+        self.assertIsNone(report["llm"]["error"])
+        self.assertIsNone(report["mcp:fast"]["error"])
+        self.assertIn("0.2", report["mcp:slow"]["error"])
+        self.assertIsNone(report["agent"]["error"])
+        self.assertLess(report["mcp:slow"]["seconds"], 1)
+
+
 if __name__ == "__main__":
     unittest.main()
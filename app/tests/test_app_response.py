@@ -1,23 +1,31 @@
 import asyncio
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch
 
+from langchain_core.messages import AIMessage, ToolMessage
+
 import app as app_module
-from app import AppConfig, LLMConfig, make_generate_response
-from utils.tool_view import format_tool_call, format_tool_result
+from app import AppConfig, CheckpointConfig, LLMConfig, make_generate_response
+from utils.scheduler import AdmissionScheduler
+from utils.tool_view import format_tool_call, format_tool_progress, format_tool_result
 
 
-class ServiceThatShouldNotStart:
+class FakeService:
     llm = None
 
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or AdmissionScheduler()
+
+
+class ServiceThatShouldNotStart(FakeService):
     async def get_agent(self):
         raise AssertionError("agent should not start before the first UI update")
 
 
-class ServiceThatRecordsStartup:
-    llm = None
-
+class ServiceThatRecordsStartup(FakeService):
     def __init__(self):
+        super().__init__()
         self.started = False
 
     async def get_agent(self):
@@ -25,16 +33,12 @@ class ServiceThatRecordsStartup:
         raise AssertionError("agent should not start before the first UI update")
 
 
-class StaticAgentService:
-    llm = None
-
+class StaticAgentService(FakeService):
     async def get_agent(self):
         return object()
 
 
-class FailingAgentService:
-    llm = None
-
+class FailingAgentService(FakeService):
     async def get_agent(self):
         raise RuntimeError("agent init failed")
 
@@ -73,6 +77,51 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
         self.assertIn("before", messages[1]["content"])
         self.assertIn("after", messages[1]["content"])
 
+    def test_build_llm_messages_drops_leftover_tool_progress(self):
+        history = [
+            {"role": "user", "content": "q"},
+            {
+                "role": "assistant",
+                "content": format_tool_progress("role_play", "1/2【A】", "alpha") + "中断了",
+            },
+        ]
+
+        messages = app_module.build_llm_messages(history)
+
+        self.assertEqual(messages[1]["content"], "中断了")
+
+    async def test_stream_events_replaces_tool_progress_with_result(self):
+        class ProgressAgent:
+            async def astream(self, inputs, stream_mode, context, config):
+                self.stream_mode = stream_mode
+                call = {"id": "call-1", "name": "role_play", "args": {}}
+                yield "values", {"messages": [AIMessage(content="", tool_calls=[call])]}
+                for role in ("A", "B"):
+                    progress = {"name": "role_play", "title": role, "content": f"{role}-reply"}
+                    yield "custom", {"tool_call_id": "call-1", **progress}
+                yield (
+                    "messages",
+                    (
+                        ToolMessage(content="最终结果", name="role_play", tool_call_id="call-1"),
+                        {"langgraph_node": "tools"},
+                    ),
+                )
+
+        agent = ProgressAgent()
+        history = [{"role": "assistant", "content": app_module.TYPING_INDICATOR_HTML}]
+        snapshots = [
+            h[-1]["content"]
+            async for _, h in app_module._stream_events(agent, [], history, tool_context=None)
+        ]
+
+        self.assertIn("custom", agent.stream_mode)
+        self.assertIn("B-reply", snapshots[2])
+        self.assertIn("A-reply", snapshots[2])
+        self.assertEqual(
+            snapshots[-1],
+            format_tool_call("role_play", {}) + format_tool_result("role_play", "最终结果"),
+        )
+
     def test_build_llm_messages_does_not_clean_user_html_like_text(self):
         user_content = '<details class="tool-result-details"><pre>keep me</pre></details>'
         history = [{"role": "user", "content": user_content}]
@@ -82,6 +131,207 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(messages, [{"role": "user", "content": user_content}])
         self.assertIsNot(messages, history)
 
+    def test_llm_message_cache_only_cleans_new_or_changed_messages(self):
+        tool_html = format_tool_result("calculator", "2")
+        history = [
+            {"role": "user", "content": "q1"},
+            {"role": "assistant", "content": tool_html},
+        ]
+        cache = app_module.LLMMessageCache()
+
+        with patch("app.get_cleaned_text", wraps=app_module.get_cleaned_text) as cleaned:
+            first = cache.build("session", history)
+            # Gradio 每轮都会重新反序列化历史，因此这里用新的 dict 模拟
+            history = [dict(m) for m in history] + [
+                {"role": "user", "content": "q2"},
+                {"role": "assistant", "content": "answer " + tool_html},
+            ]
+            second = cache.build("session", history)
+            self.assertEqual(cleaned.call_count, 2)
+
+            history[1] = {"role": "assistant", "content": "edited " + tool_html}
+            third = cache.build("session", history)
+            self.assertEqual(cleaned.call_count, 3)
+
+        self.assertIs(first[1], second[1])
+        self.assertEqual(third, app_module.build_llm_messages(history))
+        self.assertEqual(cache.build("session", history[:1]), [{"role": "user", "content": "q1"}])
+
+    def test_gradio_injects_the_request(self):
+        from gradio.utils import get_type_hints, is_special_typed_parameter
+
+        generate_response = make_generate_response(StaticAgentService(), AppConfig())
+
+        self.assertTrue(is_special_typed_parameter("request", get_type_hints(generate_response)))
+
+    async def test_generate_response_uses_session_message_cache(self):
+        captured = []
+
+        async def stream_events(agent, messages, history, tool_context, **kwargs):
+            captured.append(messages)
+            history[-1]["content"] = format_tool_result("calculator", "2")
+            yield "", history
+
+        generate_response = make_generate_response(StaticAgentService(), AppConfig())
+        request = SimpleNamespace(session_hash="session-a")
+        history = []
+
+        with patch("app._stream_events", stream_events):
+            async for _ in generate_response("first", history, request):
+                pass
+            history = [dict(m) for m in history]
+            async for _ in generate_response("second", history, request):
+                pass
+
+        self.assertIs(captured[0][0], captured[1][0])
+        self.assertNotIn("<details", captured[1][1]["content"])
+        self.assertEqual(captured[1][-1], {"role": "user", "content": "second"})
+
+    async def test_thread_mode_sends_only_new_message_with_session_thread(self):
+        captured = []
+
+        async def stream_events(agent, messages, history, tool_context, config=None):
+            captured.append((messages, config["configurable"]["thread_id"]))
+            history[-1]["content"] = "reply"
+            yield "", history
+
+        generate_response = make_generate_response(
+            StaticAgentService(),
+            AppConfig(checkpoint=CheckpointConfig(backend="memory")),
+        )
+        request = SimpleNamespace(session_hash="session-a")
+        history = [{"role": "assistant", "content": "greeting"}]
+
+        with patch("app._stream_events", stream_events):
+            async for _ in generate_response("first", history, request):
+                pass
+            async for _ in generate_response("second", history, request):
+                pass
+            # 清空对话后开启新的 thread
+            async for _ in generate_response("again", [], request):
+                pass
+
+        self.assertEqual(
+            [m for m, _ in captured],
+            [[{"role": "user", "content": c}] for c in ("first", "second", "again")],
+        )
+        self.assertEqual(captured[0][1], captured[1][1])
+        self.assertNotEqual(captured[1][1], captured[2][1])
+
+    async def test_failed_turn_starts_a_new_thread_seeded_with_the_visible_history(self):
+        captured = []
+
+        async def stream_events(agent, messages, history, tool_context, config=None):
+            captured.append((messages, config["configurable"]["thread_id"]))
+            if messages[-1]["content"] == "boom":
+                # 例如工具抛出异常，checkpoint 中留下未应答的工具调用
+                raise RuntimeError("tool failed")
+            history[-1]["content"] = "reply"
+            yield "", history
+
+        generate_response = make_generate_response(
+            StaticAgentService(),
+            AppConfig(checkpoint=CheckpointConfig(backend="memory")),
+        )
+        request = SimpleNamespace(session_hash="session-a")
+        history = []
+
+        with patch("app._stream_events", stream_events):
+            for message in ("first", "boom", "third", "fourth"):
+                async for _ in generate_response(message, history, request):
+                    pass
+
+        threads = [thread for _, thread in captured]
+        self.assertEqual(threads[0], threads[1])
+        self.assertNotEqual(threads[1], threads[2])
+        self.assertEqual(threads[2], threads[3])
+        # 新 thread 的第一轮带上界面上的完整历史，之后只发送新消息
+        self.assertEqual(
+            [m["content"] for m in captured[2][0] if m["role"] == "user"],
+            ["first", "boom", "third"],
+        )
+        self.assertEqual(captured[3][0], [{"role": "user", "content": "fourth"}])
+
+    async def test_history_diverging_from_the_thread_starts_a_new_thread(self):
+        captured = []
+
+        async def stream_events(agent, messages, history, tool_context, config=None):
+            captured.append((messages, config["configurable"]["thread_id"]))
+            history[-1]["content"] = "reply"
+            yield "", history
+
+        generate_response = make_generate_response(
+            StaticAgentService(),
+            AppConfig(checkpoint=CheckpointConfig(backend="memory")),
+        )
+        request = SimpleNamespace(session_hash="session-a")
+        history = []
+
+        with patch("app._stream_events", stream_events):
+            for message in ("first", "second"):
+                async for _ in generate_response(message, history, request):
+                    pass
+            # 撤销上一轮后重新提问：界面历史比 thread 少一轮
+            retried = history[:2]
+            async for _ in generate_response("second again", retried, request):
+                pass
+
+        self.assertNotEqual(captured[1][1], captured[2][1])
+        self.assertEqual([m["content"] for m in captured[2][0]], ["first", "reply", "second again"])
+
+    async def test_coalesce_updates_flushes_first_update_then_batches(self):
+        history = [{"role": "assistant", "content": ""}]
+
+        async def updates():
+            for index in range(100):
+                history[-1]["content"] += str(index % 10)
+                yield "", history
+                await asyncio.sleep(0)
+
+        policy = app_module.StreamFlushPolicy(max_tokens=10, max_latency=60)
+        flushed = [
+            update[1][-1]["content"]
+            async for update in app_module._coalesce_updates(updates(), policy)
+        ]
+
+        self.assertEqual(flushed[0], "0")
+        self.assertLessEqual(len(flushed), 12)
+        self.assertEqual(len(flushed[-1]), 100)
+
+    async def test_coalesce_updates_flushes_pending_update_after_max_latency(self):
+        history = [{"role": "assistant", "content": ""}]
+        released = asyncio.Event()
+
+        async def updates():
+            for token in ("a", "b"):
+                history[-1]["content"] += token
+                yield "", history
+                await asyncio.sleep(0.001)
+            await released.wait()
+
+        policy = app_module.StreamFlushPolicy(max_tokens=100, max_latency=0.02)
+        stream = app_module._coalesce_updates(updates(), policy)
+
+        self.assertEqual((await anext(stream))[1][-1]["content"], "a")
+        second = await asyncio.wait_for(anext(stream), timeout=1)
+        self.assertEqual(second[1][-1]["content"], "ab")
+        released.set()
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    async def test_coalesce_updates_propagates_stream_errors_after_flushing(self):
+        async def updates():
+            yield "", [{"role": "assistant", "content": "partial"}]
+            raise RuntimeError("stream broke")
+
+        policy = app_module.StreamFlushPolicy()
+        flushed = []
+        with self.assertRaisesRegex(RuntimeError, "stream broke"):
+            async for update in app_module._coalesce_updates(updates(), policy):
+                flushed.append(update)
+
+        self.assertEqual(len(flushed), 1)
+
     async def test_whitespace_only_message_is_ignored(self):
         history = []
         generate_response = make_generate_response(
@@ -124,7 +374,7 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
     async def test_tool_context_uses_configured_model(self):
         captured = {}
 
-        async def stream_events(agent, messages, history, tool_context):
+        async def stream_events(agent, messages, history, tool_context, **kwargs):
             captured["tool_context"] = tool_context
             yield "", history
 
@@ -145,6 +395,44 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(captured["tool_context"].model, "deepseek-v3-2-251201")
 
+    async def test_queued_request_shows_position_until_admitted(self):
+        scheduler = AdmissionScheduler(max_concurrency=1)
+        running = scheduler.submit("dashscope", "other")
+        generate_response = make_generate_response(StaticAgentService(scheduler), AppConfig())
+
+        async def stream_events(agent, messages, history, tool_context, **kwargs):
+            history[-1]["content"] = "reply"
+            yield "", history
+
+        history = []
+        with patch("app._stream_events", stream_events):
+            response = generate_response("hello", history)
+            await anext(response)
+            await anext(response)
+            self.assertIn("typing-indicator", history[1]["content"])
+            self.assertIn("前面还有 0 个请求", history[1]["content"])
+
+            running.release()
+            async for _ in response:
+                pass
+
+        self.assertEqual(history[1]["content"], "reply")
+        self.assertEqual(scheduler.stats()["dashscope"]["running"], 0)
+
+    async def test_full_queue_sheds_request_without_calling_agent(self):
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=0)
+        scheduler.submit("dashscope", "other")
+        generate_response = make_generate_response(
+            ServiceThatShouldNotStart(scheduler), AppConfig()
+        )
+
+        history = []
+        async for _ in generate_response("hello", history):
+            pass
+
+        self.assertIn("服务繁忙", history[1]["content"])
+        self.assertNotIn("typing-indicator", history[1]["content"])
+
     async def test_agent_startup_error_is_rendered_in_history(self):
         history = []
         generate_response = make_generate_response(
@@ -178,7 +466,7 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
             AppConfig(),
         )
 
-        async def stream_events(agent, messages, history, tool_context):
+        async def stream_events(agent, messages, history, tool_context, **kwargs):
             raise asyncio.CancelledError()
             yield "", history
 
@@ -205,7 +493,7 @@ class GenerateResponseTests(unittest.IsolatedAsyncioTestCase):
             {"role": "assistant", "content": tool_html},
         ]
 
-        async def stream_events(agent, messages, history, tool_context):
+        async def stream_events(agent, messages, history, tool_context, **kwargs):
             captured["messages"] = messages
             captured["ui_history"] = history
             yield "", history
@@ -0,0 +1,174 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import arith
+from tools.tool_sci import SafeEvaluator, calculator
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SKILL_SCRIPTS = os.path.join(REPO_DIR, "skills", "dive-into-langgraph", "scripts")
+MCP_PACKAGE = os.path.join(REPO_DIR, "mcp_server", "math_mcp")
+# skill 示例与 math MCP 服务各自带的引擎副本
+VENDORED_COPIES = [
+    os.path.join(SKILL_SCRIPTS, "tools", "arith.py"),
+    os.path.join(MCP_PACKAGE, "arith.py"),
+]
+
+
+def _load(name, *path):
+    # skill 与 MCP 服务不在 app 的导入路径上，按文件路径加载
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _outcome(func, *args):
+    try:
+        return str(func(*args))
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+class CompileCacheTests(unittest.TestCase):
+    def test_repeated_expression_is_compiled_once(self):
+        arith._compile_cached.cache_clear()
+
+        for _ in range(3):
+            arith.evaluate("(3 + 5) * 12")
+            SafeEvaluator().evaluate("(3 + 5) * 12")
+
+        info = arith.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 5))
+
+    def test_cache_evicts_least_recently_used_expressions(self):
+        arith._compile_cached.cache_clear()
+
+        for i in range(arith.COMPILE_CACHE_SIZE + 10):
+            arith.evaluate(f"{i} + 1")
+
+        self.assertEqual(arith.cache_info().currsize, arith.COMPILE_CACHE_SIZE)
+
+    def test_limits_are_part_of_the_cache_key(self):
+        arith.evaluate("1 + 2 + 3")
+
+        with self.assertRaisesRegex(ValueError, "运算次数超过上限 1"):
+            arith.evaluate("1 + 2 + 3", arith.EvalLimits(max_ops=1))
+
+    def test_compiled_code_has_no_builtins(self):
+        compiled = arith.compile_expression("abs(x)", ("x",))
+
+        with self.assertRaises(NameError):
+            compiled(-2, namespace={})
+        self.assertEqual(compiled(-2, namespace=arith.FUNCTIONS), 2)
+
+    def test_evaluate_many_returns_errors_in_place(self):
+        results = arith.evaluate_many(["2 ** 10", "9 ** 9 ** 9"], return_exceptions=True)
+
+        self.assertEqual(results[0], 1024)
+        self.assertIn("结果过大", str(results[1]))
+
+
+class EntryPointTests(unittest.TestCase):
+    """calculator、skill 的 safe_eval 与 math MCP 服务共用引擎，结果与报错一致"""
+
+    EXPRESSIONS = [
+        "(3 + 5) * 12",
+        "2 ** 10 - 17 // 4 % 3",
+        "7 / 2",
+        "1 / 0",
+        "9 ** 9 ** 9",
+        "1 +" * 300 + " 1",
+        "10.0 ** 400",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.skill = _load(
+            "skill_tool_math", "skills", "dive-into-langgraph", "scripts", "tools", "tool_math.py"
+        )
+        cls.mcp = _load("math_mcp_server", "mcp_server", "math_mcp", "server.py")
+
+    def test_vendored_copies_match_the_engine(self):
+        with open(arith.__file__, "rb") as f:
+            engine = f.read()
+        for path in VENDORED_COPIES:
+            with self.subTest(path=os.path.relpath(path, REPO_DIR)), open(path, "rb") as f:
+                self.assertEqual(f.read(), engine, "副本与 app/arith.py 不一致，请重新复制")
+
+    def test_calculator_and_skill_agree(self):
+        for expression in self.EXPRESSIONS:
+            with self.subTest(expression=expression[:20]):
+                self.assertEqual(
+                    _outcome(calculator.func, expression),
+                    _outcome(self.skill.safe_eval.func, expression),
+                )
+
+    def test_mcp_reports_engine_errors(self):
+        for expression in self.EXPRESSIONS:
+            with self.subTest(expression=expression[:20]):
+                expected = _outcome(arith.evaluate, expression, self.mcp.LIMITS)
+                outcome = _outcome(self.mcp.math, f"what's {expression}?")
+                if expected.startswith("ValueError: "):
+                    self.assertTrue(outcome.endswith(f"({expected[len('ValueError: ') :]})"))
+                else:
+                    self.assertEqual(float(outcome), float(expected))
+
+    def test_mcp_keeps_its_expression_length_limit(self):
+        self.assertEqual(self.mcp.math("1" + " + 1" * 49), 50)
+        with self.assertRaisesRegex(ValueError, "表达式过长：201 个字符，超过上限 200"):
+            self.mcp.math("1" + " + 1" * 50)
+
+
+class CopiedOutTests(unittest.TestCase):
+    """skill 与 math MCP 服务复制到 app 之外的目录后仍可单独导入和计算"""
+
+    def _run(self, cwd, code):
+        # 新进程中运行，app 目录不在导入路径上
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.split()
+
+    def test_skill_scripts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copytree(SKILL_SCRIPTS, os.path.join(tmp, "scripts"))
+
+            output = self._run(
+                os.path.join(tmp, "scripts"),
+                "from tools import tool_math; "
+                "print(tool_math.safe_eval.invoke({'expression': '2 ** 10'})); "
+                "print(tool_math.arith.__file__)",
+            )
+
+            self.assertEqual(output[0], "1024")
+            self.assertTrue(output[1].startswith(os.path.realpath(tmp)))
+
+    def test_mcp_server_as_package_and_as_script(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copytree(MCP_PACKAGE, os.path.join(tmp, "math_mcp"))
+            # 作为包导入（python -m math_mcp），以及在包目录内直接导入 server.py（以脚本运行）
+            for cwd, module in (
+                (tmp, "math_mcp.server"),
+                (os.path.join(tmp, "math_mcp"), "server"),
+            ):
+                with self.subTest(module=module):
+                    output = self._run(
+                        cwd,
+                        f"import {module} as server; "
+                        "print(server.math('what is 2 ** 10?')); "
+                        "print(server.arith.__file__)",
+                    )
+
+                    self.assertEqual(output[0], "1024")
+                    self.assertTrue(output[1].startswith(os.path.realpath(tmp)))
+
+
+if __name__ == "__main__":
+    unittest.main()
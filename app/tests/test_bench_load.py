@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from app import TYPING_INDICATOR_HTML
+from bench.bench_load import make_history, percentiles, run_load
+
+
+async def fake_generate_response(message, history, request=None):
+    history.append({"role": "user", "content": message})
+    history.append({"role": "assistant", "content": TYPING_INDICATOR_HTML})
+    yield "", history
+    await asyncio.sleep(0.02)
+    for token in ["你", "好", "！"]:
+        content = history[-1]["content"]
+        history[-1]["content"] = ("" if content == TYPING_INDICATOR_HTML else content) + token
+        yield "", history
+        await asyncio.sleep(0.01)
+
+
+class BenchLoadTests(unittest.IsolatedAsyncioTestCase):
+    def test_history_contains_tool_turns(self):
+        history = make_history(4)
+
+        self.assertEqual(len(history), 8)
+        self.assertIn("tool-call-details", history[1]["content"])
+        self.assertNotIn("tool-call-details", history[3]["content"])
+
+    def test_percentiles_use_nearest_rank(self):
+        stats = percentiles([float(v) for v in range(1, 101)])
+
+        self.assertEqual((stats["p50"], stats["p90"], stats["p99"]), (50.0, 90.0, 99.0))
+        self.assertEqual(percentiles([])["count"], 0)
+
+    async def test_run_load_reports_latency_and_throughput(self):
+        results = await run_load(fake_generate_response, sessions=4, turns=2, history_turns=2)
+
+        self.assertEqual((results["turns"], results["errors"]), (8, 0))
+        self.assertEqual(results["ttft_ms"]["count"], 8)
+        self.assertGreaterEqual(results["ttft_ms"]["p50"], 20)
+        self.assertEqual(results["itl_ms"]["count"], 16)
+        self.assertGreater(results["throughput"]["turns_per_second"], 0)
+        self.assertIn("growth", results["rss_mb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
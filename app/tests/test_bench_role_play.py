@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from app import LLMConfig
+from bench.bench_role_play import (
+    DEFAULT_ROLES,
+    FIXTURES_DIR,
+    estimate_tokens,
+    run_mode,
+    split_tokens,
+    tokenize_fixture,
+)
+from tools import tool_role
+from tools.tool_role import RolePlayEngine
+from utils.http_pool import HTTPClientPool
+from utils.replay import Fixture, ReplayTransport, load_fixtures
+
+
+class BenchRolePlayTests(unittest.TestCase):
+    def test_split_tokens_matches_estimate(self):
+        text = '{"response": "辛苦啦，下班我来接你"}'
+
+        pieces = split_tokens(text)
+
+        self.assertEqual("".join(pieces), text)
+        self.assertEqual(pieces[:4], ['{"re', "spon", 'se":', ' "'])
+        self.assertEqual(estimate_tokens(text), 4 + 10 + 1)
+
+    def test_tokenize_fixture_splits_content_chunks(self):
+        fixture = Fixture([{"choices": [{"index": 0, "delta": {"content": "你好"}}]}], "hi")
+
+        chunks = tokenize_fixture(fixture).chunks
+
+        self.assertEqual([c["choices"][0]["delta"]["content"] for c in chunks], ["你", "好"])
+
+    def test_modes_are_compared_on_replay(self):
+        llm = LLMConfig.from_env("replay")
+        pool = HTTPClientPool()
+        replay = ReplayTransport([tokenize_fixture(f) for f in load_fixtures(FIXTURES_DIR)])
+        pool.mount(llm.base_url, transport=replay, async_transport=replay)
+
+        async def run():
+            try:
+                return {
+                    mode: await run_mode(RolePlayEngine(), llm, mode, 1, DEFAULT_ROLES)
+                    for mode in ("fanout", "batch", "fused")
+                }
+            finally:
+                await pool.aclose()
+
+        with patch.object(tool_role, "http_pool", pool):
+            rows = asyncio.run(run())
+
+        self.assertEqual([rows[m]["calls"] for m in rows], [11, 2, 1])
+        self.assertLess(rows["fused"]["prompt_tokens"], rows["fanout"]["prompt_tokens"])
+        self.assertTrue(rows["fused"]["tokens_estimated"])
+
+
+if __name__ == "__main__":
+    unittest.main()
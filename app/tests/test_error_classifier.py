@@ -0,0 +1,187 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from pydantic import BaseModel, ValidationError
+
+from utils.error_classifier import (
+    AUTH,
+    MCP_DISCONNECT,
+    NETWORK,
+    RATE_LIMIT,
+    TIMEOUT,
+    TOOL_VALIDATION,
+    ErrorSummarizer,
+    classify_error,
+    error_fingerprint,
+)
+from utils.metrics import MetricsRegistry
+
+
+class RateLimitError(Exception):
+    """与 openai.RateLimitError 同名，按类名识别"""
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+class ClosedResourceError(Exception):
+    """与 anyio.ClosedResourceError 同名"""
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(content=f"summary {self.calls}")
+
+
+def _raise_at_same_place(message):
+    try:
+        raise RuntimeError(message)
+    except RuntimeError as err:
+        return err
+
+
+def _raise_status_at_same_place(status_code):
+    try:
+        raise HTTPStatusError(status_code)
+    except HTTPStatusError as err:
+        return err
+
+
+def _raise_in_module(module, exc_type):
+    # 构造调用栈经过指定模块的异常
+    namespace = {"__name__": module, "exc_type": exc_type}
+    exec("def fail():\n    raise exc_type('connection reset')", namespace)
+    try:
+        namespace["fail"]()
+    except exc_type as err:
+        return err
+
+
+def _validation_error():
+    class Args(BaseModel):
+        x: int
+
+    try:
+        Args(x="not a number")
+    except ValidationError as err:
+        return err
+
+
+class ClassifyErrorTests(unittest.TestCase):
+    def test_common_failures_are_classified_locally(self):
+        cases = [
+            (asyncio.TimeoutError(), TIMEOUT),
+            (HTTPStatusError(401), AUTH),
+            (RateLimitError("Error code: 429"), RATE_LIMIT),
+            (ClosedResourceError(), MCP_DISCONNECT),
+            (_raise_in_module("mcp.client.session", BrokenPipeError), MCP_DISCONNECT),
+            (_raise_in_module("httpx._transports", ConnectionResetError), NETWORK),
+            (BrokenPipeError(), NETWORK),
+            (_validation_error(), TOOL_VALIDATION),
+        ]
+        for err, kind in cases:
+            with self.subTest(err=type(err).__name__):
+                self.assertIs(classify_error(err), kind)
+
+    def test_cause_chain_and_exception_groups_are_searched(self):
+        try:
+            try:
+                raise HTTPStatusError(429)
+            except HTTPStatusError as inner:
+                raise RuntimeError("agent failed") from inner
+        except RuntimeError as err:
+            self.assertIs(classify_error(err), RATE_LIMIT)
+
+        group = ExceptionGroup("task group", [ValueError("x"), ClosedResourceError()])
+        self.assertIs(classify_error(group), MCP_DISCONNECT)
+
+    def test_types_take_precedence_over_keywords_and_keywords_match_whole_words(self):
+        class Args(BaseModel):
+            timeout: int
+
+        try:
+            Args(timeout="request timed out")
+        except ValidationError as err:
+            self.assertIs(classify_error(err), TOOL_VALIDATION)
+
+        self.assertIsNone(classify_error(ValueError("invalid value for the timeout argument")))
+        self.assertIsNone(classify_error(ValueError("unauthorizedUser is not a valid name")))
+        self.assertIs(classify_error(RuntimeError("read timed out after 30s")), TIMEOUT)
+
+    def test_unknown_errors_are_not_classified(self):
+        self.assertIsNone(classify_error(RuntimeError("agent init failed")))
+
+    def test_fingerprint_ignores_message(self):
+        self.assertEqual(
+            error_fingerprint(_raise_at_same_place("id=1")),
+            error_fingerprint(_raise_at_same_place("id=2")),
+        )
+        self.assertNotEqual(
+            error_fingerprint(_raise_at_same_place("x")), error_fingerprint(ValueError("x"))
+        )
+
+    def test_fingerprint_includes_status_code(self):
+        self.assertNotEqual(
+            error_fingerprint(_raise_status_at_same_place(429)),
+            error_fingerprint(_raise_status_at_same_place(401)),
+        )
+
+
+class ErrorSummarizerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_known_failures_skip_the_llm(self):
+        llm = CountingLLM()
+        summarizer = ErrorSummarizer(metrics=MetricsRegistry())
+
+        summary = await summarizer.summarize(llm, HTTPStatusError(401))
+
+        self.assertEqual(llm.calls, 0)
+        self.assertIn(AUTH.label, summary)
+        self.assertIn("HTTP 401", summary)
+
+    async def test_same_site_errors_with_different_statuses_are_classified_separately(self):
+        llm = CountingLLM()
+        summarizer = ErrorSummarizer(metrics=MetricsRegistry())
+
+        rate_limited = await summarizer.summarize(llm, _raise_status_at_same_place(429))
+        unauthorized = await summarizer.summarize(llm, _raise_status_at_same_place(401))
+        rate_limited_again = await summarizer.summarize(llm, _raise_status_at_same_place(429))
+
+        self.assertEqual(llm.calls, 0)
+        self.assertIn(RATE_LIMIT.label, rate_limited)
+        self.assertIn(AUTH.label, unauthorized)
+        self.assertIn("HTTP 401", unauthorized)
+        self.assertEqual(rate_limited_again, rate_limited)
+
+    async def test_novel_fingerprint_calls_llm_once(self):
+        llm = CountingLLM()
+        summarizer = ErrorSummarizer(metrics=MetricsRegistry())
+
+        first = await summarizer.summarize(llm, _raise_at_same_place("a"))
+        second = await summarizer.summarize(llm, _raise_at_same_place("b"))
+
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(first, second)
+        self.assertIn("summary 1", first)
+
+    async def test_llm_calls_are_rate_capped(self):
+        llm = CountingLLM()
+        summarizer = ErrorSummarizer(max_llm_calls=1, metrics=MetricsRegistry())
+
+        await summarizer.summarize(llm, ValueError("first"))
+        summary = await summarizer.summarize(llm, KeyError("second"))
+
+        self.assertEqual(llm.calls, 1)
+        self.assertIn("原始日志", summary)
+        self.assertIn("second", summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
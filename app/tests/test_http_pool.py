@@ -0,0 +1,58 @@
+import unittest
+
+import httpx
+
+from app import AgentService, AppConfig, LLMConfig
+from utils.http_pool import HTTPClientPool, HTTPPoolConfig, http_pool
+
+
+class HTTPClientPoolTests(unittest.IsolatedAsyncioTestCase):
+    def test_clients_are_shared_per_base_url(self):
+        pool = HTTPClientPool()
+
+        self.assertIs(
+            pool.async_client("https://a.test/v1"), pool.async_client("https://a.test/v1/")
+        )
+        self.assertIsNot(
+            pool.async_client("https://a.test/v1"), pool.async_client("https://b.test")
+        )
+        self.assertIs(
+            pool.client_kwargs("https://a.test/v1")["http_client"],
+            pool.sync_client("https://a.test/v1"),
+        )
+
+    def test_limits_come_from_config(self):
+        pool = HTTPClientPool(HTTPPoolConfig(max_connections=3, keepalive_expiry=5.0))
+
+        client = pool.async_client("https://a.test")
+        pool_limits = client._transport._pool
+
+        self.assertEqual(pool_limits._max_connections, 3)
+        self.assertEqual(pool_limits._keepalive_expiry, 5.0)
+
+    async def test_stats_count_requests(self):
+        pool = HTTPClientPool()
+        client = pool.async_client("https://a.test")
+        client._transport = httpx.MockTransport(lambda request: httpx.Response(200))
+
+        for _ in range(3):
+            await client.get("https://a.test/ping")
+
+        self.assertEqual(pool.stats()["https://a.test"]["requests"], 3)
+        await pool.aclose()
+        self.assertEqual(pool.stats(), {})
+
+
+class AgentServiceHTTPPoolTests(unittest.TestCase):
+    def test_chat_models_share_pooled_clients(self):
+        config = LLMConfig(provider="ark", model="m", base_url="https://pool.test/v1", api_key="k")
+
+        llm = AgentService(AppConfig(llm=config)).llm
+        other = AgentService(AppConfig(llm=config)).llm
+
+        self.assertIs(llm.http_async_client, http_pool.async_client("https://pool.test/v1"))
+        self.assertIs(llm.http_async_client, other.http_async_client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from bench.bench_import import by_package, parse_importtime, profile_once
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   pydantic.fields
+import time:       300 |        420 | pydantic
+import time:        50 |        470 | app
+"""
+
+
+class ImportBudgetTests(unittest.TestCase):
+    def test_parse_and_group_by_package(self):
+        rows = parse_importtime(SAMPLE)
+
+        self.assertEqual(rows[-1], ("app", 50, 470))
+        self.assertEqual(by_package(rows, top=1), [("pydantic", 0.42)])
+
+    def test_slow_modules_are_not_imported_with_app(self):
+        result = profile_once("app")
+
+        self.assertEqual(result["loaded_lazy_modules"], [])
+        self.assertGreater(result["total_ms"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
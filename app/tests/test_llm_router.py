@@ -0,0 +1,172 @@
+import asyncio
+import unittest
+from typing import Any
+
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+
+from utils.llm_router import HedgedChatModel, HedgePolicy, ProviderRouter
+from utils.metrics import MetricsRegistry
+
+
+class FakeProvider(GenericFakeChatModel):
+    """首个输出前等待 delay 秒，fail 为 True 时直接报错"""
+
+    delay: float = 0.0
+    fail: bool = False
+    calls: int = 0
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeProvider":
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("provider down")
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("provider down")
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def _provider(reply, **kwargs):
+    return FakeProvider(messages=iter([reply] * 10), **kwargs)
+
+
+def _model(primary, secondary, **policy):
+    router = ProviderRouter(
+        ["primary", "secondary"],
+        HedgePolicy(**{"default_delay": 0.05, **policy}),
+        metrics=MetricsRegistry(),
+    )
+    return HedgedChatModel(models={"primary": primary, "secondary": secondary}, router=router)
+
+
+class ProviderRouterTests(unittest.TestCase):
+    def test_hedge_delay_follows_ttft_p95(self):
+        router = ProviderRouter(
+            ["a"], HedgePolicy(default_delay=3.0, min_samples=10), metrics=MetricsRegistry()
+        )
+        self.assertEqual(router.hedge_delay("a"), 3.0)
+
+        for _ in range(20):
+            router.record_first_token("a", 0.8)
+        self.assertLessEqual(router.hedge_delay("a"), 0.8)
+        self.assertGreaterEqual(router.hedge_delay("a"), 0.5)
+
+    def test_failing_provider_is_ejected_for_cooldown(self):
+        router = ProviderRouter(
+            ["a", "b"], HedgePolicy(failure_threshold=2, cooldown=60), metrics=MetricsRegistry()
+        )
+        router.record_failure("a")
+        self.assertEqual(router.order(), ["a", "b"])
+
+        router.record_failure("a")
+        self.assertEqual(router.order(), ["b"])
+        self.assertFalse(router.stats()["a"]["healthy"])
+
+
+class SyncInvokeTests(unittest.TestCase):
+    def test_invoke_uses_first_healthy_provider(self):
+        secondary = _provider("from secondary")
+        model = _model(_provider("from primary"), secondary)
+
+        result = model.invoke("hi")
+
+        self.assertEqual(result.content, "from primary")
+        self.assertEqual(secondary.calls, 0)
+        self.assertEqual(model.router.stats()["primary"]["successes"], 1)
+
+    def test_invoke_fails_over_to_next_provider(self):
+        model = _model(_provider("x", fail=True), _provider("from secondary"))
+
+        result = model.invoke("hi")
+
+        self.assertEqual(result.content, "from secondary")
+        self.assertEqual(model.router.stats()["primary"]["failures"], 1)
+        self.assertEqual(model.router.stats()["secondary"]["successes"], 1)
+
+    def test_invoke_raises_when_all_providers_fail(self):
+        model = _model(_provider("x", fail=True), _provider("y", fail=True))
+
+        with self.assertRaises(ConnectionError):
+            model.invoke("hi")
+
+
+class HedgedChatModelTests(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_primary_does_not_hedge(self):
+        secondary = _provider("from secondary")
+        model = _model(_provider("from primary"), secondary)
+
+        result = await model.ainvoke("hi")
+
+        self.assertEqual(result.content, "from primary")
+        self.assertEqual(secondary.calls, 0)
+
+    async def test_slow_primary_is_hedged_and_loser_cancelled(self):
+        primary = _provider("from primary", delay=1.0)
+        model = _model(primary, _provider("from secondary"))
+
+        result = await asyncio.wait_for(model.ainvoke("hi"), timeout=0.5)
+
+        self.assertEqual(result.content, "from secondary")
+        self.assertEqual(model.router.stats()["secondary"]["successes"], 1)
+
+    async def test_hedge_is_counted_for_the_provider_it_was_sent_to(self):
+        metrics = MetricsRegistry()
+        router = ProviderRouter(
+            ["primary", "secondary", "tertiary"],
+            HedgePolicy(default_delay=0.05),
+            metrics=metrics,
+        )
+        model = HedgedChatModel(
+            models={
+                "primary": _provider("from primary", delay=1.0),
+                "secondary": _provider("from secondary", delay=1.0),
+                "tertiary": _provider("from tertiary"),
+            },
+            router=router,
+        )
+
+        result = await asyncio.wait_for(model.ainvoke("hi"), timeout=0.5)
+
+        self.assertEqual(result.content, "from tertiary")
+        text = metrics.render_text()
+        self.assertIn('provider_hedges_total{provider="secondary"} 1', text)
+        self.assertIn('provider_hedges_total{provider="tertiary"} 1', text)
+        self.assertNotIn('provider_hedges_total{provider="primary"}', text)
+
+    async def test_primary_error_fails_over_immediately(self):
+        model = _model(_provider("x", fail=True), _provider("from secondary"), default_delay=10)
+
+        result = await asyncio.wait_for(model.ainvoke("hi"), timeout=1)
+
+        self.assertEqual(result.content, "from secondary")
+        self.assertEqual(model.router.stats()["primary"]["failures"], 1)
+
+    async def test_error_is_raised_when_all_providers_fail(self):
+        model = _model(_provider("x", fail=True), _provider("y", fail=True))
+
+        with self.assertRaises(ConnectionError):
+            await model.ainvoke("hi")
+
+    async def test_agent_streams_tokens_once(self):
+        model = _model(_provider("hello world", delay=1.0), _provider("hello world"))
+        agent = create_agent(model=model, tools=[])
+
+        tokens = []
+        async for chunk, _ in agent.astream(
+            {"messages": [{"role": "user", "content": "hi"}]}, stream_mode="messages"
+        ):
+            tokens.append(chunk.content)
+
+        self.assertEqual("".join(tokens), "hello world")
+
+
+if __name__ == "__main__":
+    unittest.main()
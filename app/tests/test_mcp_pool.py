@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import anyio
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ErrorData
+
+from utils.mcp_pool import MCPSessionPool
+
+
+class FakeSession:
+    def __init__(self, client):
+        self.client = client
+        # 下一次调用在发出请求前（send）或执行工具后（executed）抛出的异常
+        self.fail_next = None
+        self.fail_at = "send"
+
+    async def call_tool(self, name, args):
+        if self.fail_next is not None and self.fail_at == "send":
+            err, self.fail_next = self.fail_next, None
+            raise err
+        self.client.active += 1
+        self.client.peak = max(self.client.peak, self.client.active)
+        try:
+            await asyncio.sleep(0.01)
+            self.client.executed += 1
+            if self.fail_next is not None:
+                err, self.fail_next = self.fail_next, None
+                raise err
+            return f"{name}:{args['x']}"
+        finally:
+            self.client.active -= 1
+
+    async def send_ping(self):
+        return None
+
+
+class FakeClient:
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+        self.sessions = []
+        self.active = 0
+        self.peak = 0
+        self.executed = 0
+
+    @asynccontextmanager
+    async def session(self, server_name):
+        self.opened += 1
+        session = FakeSession(self)
+        self.sessions.append(session)
+        try:
+            yield session
+        finally:
+            self.closed += 1
+
+
+def _request(x):
+    return SimpleNamespace(server_name="demo", name="echo", args={"x": x})
+
+
+async def _unexpected_handler(request):
+    raise AssertionError("pooled calls should not fall back to per-call sessions")
+
+
+class MCPSessionPoolTests(unittest.IsolatedAsyncioTestCase):
+    def _pool(self, **kwargs):
+        pool = MCPSessionPool({"demo": {"transport": "stdio"}}, **kwargs)
+        pool._client = FakeClient()
+        return pool
+
+    async def test_calls_reuse_one_session(self):
+        pool = self._pool()
+
+        results = [await pool(_request(i), _unexpected_handler) for i in range(5)]
+        await pool.close()
+
+        self.assertEqual(results, [f"echo:{i}" for i in range(5)])
+        self.assertEqual(pool._client.opened, 1)
+        self.assertEqual(pool._client.closed, 1)
+
+    async def test_concurrency_is_capped_per_server(self):
+        pool = self._pool(max_concurrency=2)
+
+        await asyncio.gather(*(pool(_request(i), _unexpected_handler) for i in range(8)))
+        await pool.close()
+
+        self.assertEqual(pool._client.peak, 2)
+
+    async def test_broken_session_is_reopened_and_call_retried(self):
+        pool = self._pool()
+        await pool(_request(0), _unexpected_handler)
+        pool._client.sessions[0].fail_next = anyio.ClosedResourceError()
+
+        result = await pool(_request(1), _unexpected_handler)
+        await pool.close()
+
+        self.assertEqual(result, "echo:1")
+        self.assertEqual(pool._client.opened, 2)
+        self.assertEqual(pool._client.closed, 2)
+        self.assertEqual(pool._client.executed, 2)
+
+    async def test_failures_after_sending_are_not_retried(self):
+        connection_closed = McpError(ErrorData(code=CONNECTION_CLOSED, message="Connection closed"))
+        for err in (connection_closed, ConnectionError("broken pipe"), asyncio.TimeoutError()):
+            with self.subTest(err=type(err).__name__):
+                pool = self._pool()
+                await pool(_request(0), _unexpected_handler)
+                session = pool._client.sessions[0]
+                session.fail_next, session.fail_at = err, "executed"
+
+                with self.assertRaises(type(err)):
+                    await pool(_request(1), _unexpected_handler)
+
+                # 工具只执行了一次，失效的会话被丢弃，下次调用重新建立
+                self.assertEqual(pool._client.executed, 2)
+                self.assertEqual(pool._client.closed, 1)
+                self.assertEqual(await pool(_request(2), _unexpected_handler), "echo:2")
+                self.assertEqual(pool._client.opened, 2)
+                await pool.close()
+
+    async def test_unknown_server_falls_back_to_handler(self):
+        pool = self._pool()
+
+        async def handler(request):
+            return "fallback"
+
+        request = SimpleNamespace(server_name="other", name="echo", args={})
+        self.assertEqual(await pool(request, handler), "fallback")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from utils.metrics import Histogram, MetricsMiddleware, MetricsRegistry
+
+
+class HistogramTests(unittest.TestCase):
+    def test_quantiles_are_bounded_by_observed_range(self):
+        histogram = Histogram()
+        for value in [0.01] * 90 + [2.0] * 10:
+            histogram.observe(value)
+
+        stats = histogram.to_dict()
+
+        self.assertEqual(stats["count"], 100)
+        self.assertAlmostEqual(stats["p50"], 0.01, places=3)
+        self.assertGreater(stats["p99"], 1.0)
+        self.assertLessEqual(stats["p99"], 2.0)
+
+    def test_empty_histogram_reports_zeros(self):
+        stats = Histogram().to_dict()
+
+        self.assertEqual((stats["count"], stats["p95"], stats["max"]), (0, 0.0, 0.0))
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_observations_are_grouped_by_labels(self):
+        registry = MetricsRegistry()
+        registry.observe("ttft_seconds", 0.2, provider="dashscope", session="a")
+        registry.observe("ttft_seconds", 0.4, provider="dashscope", session="a")
+        registry.observe("ttft_seconds", 0.1, provider="ark", session="b")
+
+        series = registry.snapshot()["histograms"]["ttft_seconds"]
+
+        counts = {item["labels"]["provider"]: item["count"] for item in series}
+        self.assertEqual(counts, {"dashscope": 2, "ark": 1})
+        self.assertIn('ttft_seconds_count{provider="ark",session="b"} 1', registry.render_text())
+
+    def test_series_per_metric_are_capped(self):
+        registry = MetricsRegistry(max_series=2)
+        for session in ("a", "b", "c"):
+            registry.observe("response_seconds", 1.0, session=session)
+
+        sessions = [
+            item["labels"]["session"]
+            for item in registry.snapshot()["histograms"]["response_seconds"]
+        ]
+        self.assertEqual(sessions, ["b", "c"])
+
+    def test_trace_writes_jsonl(self):
+        registry = MetricsRegistry()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            registry.enable_trace(path)
+            with registry.timer("tool_call_seconds", tool="calculator"):
+                pass
+            registry.disable_trace()
+
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["name"], "tool_call_seconds")
+        self.assertEqual(records[0]["labels"], {"tool": "calculator"})
+
+
+class MetricsMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+    async def test_tool_calls_are_timed_per_tool_and_session(self):
+        registry = MetricsRegistry()
+        middleware = MetricsMiddleware("dashscope", registry)
+        request = SimpleNamespace(
+            tool_call={"name": "calculator", "args": {}},
+            runtime=SimpleNamespace(context=SimpleNamespace(session_id="s1")),
+        )
+
+        async def handler(_):
+            return "2"
+
+        self.assertEqual(await middleware.awrap_tool_call(request, handler), "2")
+
+        [item] = registry.snapshot()["histograms"]["tool_call_seconds"]
+        self.assertEqual(
+            item["labels"], {"provider": "dashscope", "session": "s1", "tool": "calculator"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app import _main_agent_prompt
+from prompts import prompt_enhance, subagent_search
+
+
+class RecordingModel(GenericFakeChatModel):
+    """记录每次调用收到的系统提示词"""
+
+    system_prompts: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.system_prompts.append(messages[0].content)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+class FrozenDatetime(datetime.datetime):
+    current = datetime.datetime(2026, 1, 1, 9, 0, 5)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+class SystemPromptTests(unittest.TestCase):
+    def test_prompt_is_byte_identical_across_turns_within_an_hour(self):
+        model = RecordingModel(messages=iter([AIMessage(content="ok")] * 3), system_prompts=[])
+        agent = create_agent(model=model, tools=[], middleware=[_main_agent_prompt])
+
+        with patch("prompts.prompt_enhance.datetime.datetime", FrozenDatetime):
+            for second in (5, 31, 59):
+                FrozenDatetime.current = datetime.datetime(2026, 1, 1, 9, 17, second)
+                agent.invoke({"messages": [{"role": "user", "content": "hi"}]})
+
+        first, *rest = [p.encode("utf-8") for p in model.system_prompts]
+        self.assertEqual(len(rest), 2)
+        self.assertTrue(all(prompt == first for prompt in rest))
+
+    def test_only_the_tail_changes_across_hours(self):
+        morning = prompt_enhance.get_system_prompt(datetime.datetime(2026, 1, 1, 9, 59, 59))
+        later = prompt_enhance.get_system_prompt(datetime.datetime(2026, 1, 1, 10, 0, 0))
+
+        prefix = prompt_enhance.get_static_prefix()
+        self.assertTrue(morning.startswith(prefix) and later.startswith(prefix))
+        self.assertEqual(morning[len(prefix) :], "2026-01-01 09:00")
+        self.assertEqual(later[len(prefix) :], "2026-01-01 10:00")
+
+    def test_static_prefix_is_computed_once(self):
+        prompt_enhance.get_static_prefix.cache_clear()
+
+        with patch("utils.device_info.get_info", return_value="x") as get_info:
+            for _ in range(5):
+                prompt_enhance.get_system_prompt()
+        prompt_enhance.get_static_prefix.cache_clear()
+
+        self.assertEqual(get_info.call_count, 3)
+
+    def test_search_subagent_prompt_is_stable_within_an_hour(self):
+        with patch("prompts.subagent_search.datetime") as fake_datetime:
+            fake_datetime.now.side_effect = [
+                datetime.datetime(2026, 1, 1, 9, 0, 1),
+                datetime.datetime(2026, 1, 1, 9, 59, 0),
+            ]
+            first = subagent_search.get_system_prompt()
+            second = subagent_search.get_system_prompt()
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith("2026-01-01 09:00"))
+
+
+if __name__ == "__main__":
+    unittest.main()
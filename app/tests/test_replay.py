@@ -0,0 +1,172 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from app import AgentService, AppConfig, LLMConfig
+from utils.http_pool import HTTPClientPool, http_pool
+from utils.replay import (
+    Fixture,
+    RecordingTransport,
+    ReplayConfig,
+    ReplayTransport,
+    aggregate_chunks,
+    load_fixtures,
+    request_key,
+    select_fixture,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "bench", "fixtures")
+
+
+def _delta(**delta):
+    return {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+
+
+def _model(transport, base_url="https://replay.test/v1"):
+    pool = HTTPClientPool()
+    pool.mount(base_url, transport=transport, async_transport=transport)
+    return ChatOpenAI(model="m", base_url=base_url, api_key="k", **pool.client_kwargs(base_url))
+
+
+class FixtureSelectionTests(unittest.TestCase):
+    def test_request_key_counts_assistant_steps_after_last_user(self):
+        body = {
+            "messages": [
+                {"role": "user", "content": "旧问题"},
+                {"role": "assistant", "content": "旧回答"},
+                {"role": "user", "content": [{"type": "text", "text": "帮我计算"}]},
+                {"role": "assistant", "content": "", "tool_calls": []},
+                {"role": "tool", "content": "96"},
+            ]
+        }
+
+        self.assertEqual(request_key(body), ("帮我计算", 1))
+
+    def test_select_prefers_matching_step_then_default(self):
+        fixtures = [
+            Fixture([], match=None),
+            Fixture([], match="计算", step=0),
+            Fixture([], match="计算", step=1),
+        ]
+
+        self.assertIs(select_fixture(fixtures, "请计算 1+1", 1), fixtures[2])
+        self.assertIs(select_fixture(fixtures, "你好", 0), fixtures[0])
+
+    def test_bundled_fixtures_load(self):
+        fixtures = load_fixtures(FIXTURES_DIR)
+
+        self.assertTrue(any(f.match is None for f in fixtures))
+        self.assertTrue(any(f.match == "计算" and f.step == 0 for f in fixtures))
+
+    def test_aggregate_merges_tool_call_and_reasoning_deltas(self):
+        chunks = [
+            _delta(reasoning_content="想"),
+            _delta(reasoning_content="一想"),
+            _delta(tool_calls=[{"index": 0, "id": "c1", "function": {"name": "calculator"}}]),
+            _delta(tool_calls=[{"index": 0, "function": {"arguments": '{"expression"'}}]),
+            _delta(tool_calls=[{"index": 0, "function": {"arguments": ': "1+1"}'}}]),
+            {"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]},
+        ]
+
+        choice = aggregate_chunks(chunks, "m")["choices"][0]
+
+        self.assertEqual(choice["finish_reason"], "tool_calls")
+        self.assertEqual(choice["message"]["reasoning_content"], "想一想")
+        self.assertEqual(
+            choice["message"]["tool_calls"][0]["function"],
+            {"name": "calculator", "arguments": '{"expression": "1+1"}'},
+        )
+
+
+class ReplayTransportTests(unittest.IsolatedAsyncioTestCase):
+    async def test_stream_replays_tool_calls(self):
+        llm = _model(ReplayTransport(load_fixtures(FIXTURES_DIR)))
+
+        message = None
+        async for chunk in llm.astream("请计算 (3 + 5) * 12"):
+            message = chunk if message is None else message + chunk
+
+        self.assertEqual(message.tool_calls[0]["name"], "calculator")
+        self.assertEqual(message.tool_calls[0]["args"], {"expression": "(3 + 5) * 12"})
+
+    def test_invoke_returns_aggregated_completion(self):
+        llm = _model(ReplayTransport(load_fixtures(FIXTURES_DIR)))
+
+        reply = llm.invoke("你好")
+
+        self.assertTrue(reply.content.startswith("你好！"))
+
+    async def test_ttft_and_token_rate_are_applied(self):
+        fixtures = [Fixture([_delta(content="a"), _delta(content="b"), _delta(content="c")])]
+        llm = _model(ReplayTransport(fixtures, tokens_per_second=20, ttft=0.1))
+
+        started = time.perf_counter()
+        arrivals = []
+        async for chunk in llm.astream("hi"):
+            if chunk.content:
+                arrivals.append(time.perf_counter() - started)
+
+        self.assertGreaterEqual(arrivals[0], 0.1)
+        self.assertGreaterEqual(arrivals[-1] - arrivals[0], 0.09)
+
+    async def test_non_streaming_reply_waits_for_full_generation(self):
+        fixtures = [Fixture([_delta(content="a"), _delta(content="b"), _delta(content="c")])]
+        llm = _model(ReplayTransport(fixtures, tokens_per_second=20, ttft=0.1))
+
+        started = time.perf_counter()
+        reply = await llm.ainvoke("hi")
+
+        self.assertEqual(reply.content, "abc")
+        self.assertGreaterEqual(time.perf_counter() - started, 0.2)
+
+    async def test_other_endpoints_return_404(self):
+        transport = ReplayTransport([])
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("https://replay.test/v1/models")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class RecordingTransportTests(unittest.IsolatedAsyncioTestCase):
+    async def test_recorded_stream_replays_identically(self):
+        source = [_delta(reasoning_content="嗯"), _delta(content="录制"), _delta(content="成功")]
+        upstream = ReplayTransport([Fixture(source)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            llm = _model(RecordingTransport(upstream, directory))
+            recorded = "".join([c.content async for c in llm.astream("录一段")])
+
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(directory, files[0]), encoding="utf-8") as f:
+                record = json.load(f)
+            self.assertEqual((record["match"], record["step"]), ("录一段", 0))
+
+            replayed = _model(ReplayTransport(load_fixtures(directory)))
+            self.assertEqual("".join([c.content async for c in replayed.astream("x")]), recorded)
+
+        self.assertEqual(recorded, "录制成功")
+
+
+class AgentServiceReplayTests(unittest.TestCase):
+    def test_replay_provider_mounts_transport_on_shared_pool(self):
+        config = AppConfig(
+            llm=LLMConfig.from_env("replay"),
+            replay=ReplayConfig(fixtures_dir=FIXTURES_DIR, tokens_per_second=0, ttft=0),
+        )
+
+        reply = AgentService(config).llm.invoke("你好")
+
+        self.assertTrue(reply.content.startswith("你好！"))
+        self.assertIsInstance(
+            http_pool.sync_client(config.llm.base_url)._transport, ReplayTransport
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,20 @@
+import asyncio
 from types import SimpleNamespace
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from tools import tool_role
-from tools.tool_role import BestResponse, Response, _select_best_response_record
+from tools.tool_role import (
+    BatchResponses,
+    BestResponse,
+    FusedResponses,
+    Response,
+    RoleResponse,
+    RolePlayConfig,
+    RolePlayEngine,
+    _select_best_response_record,
+)
+from utils.http_pool import http_pool
 
 
 class _FakeStructuredOutput:
@@ -11,6 +22,14 @@ class _FakeStructuredOutput:
         self.llm = llm
         self.schema = schema
 
+    async def ainvoke(self, prompt):
+        if self.schema is Response:
+            self.llm.active += 1
+            self.llm.max_active = max(self.llm.max_active, self.llm.active)
+            await asyncio.sleep(0.01)
+            self.llm.active -= 1
+        return self.invoke(prompt)
+
     def invoke(self, prompt):
         if self.schema is Response:
             role = prompt.split("作为一个", 1)[1].split("，", 1)[0]
@@ -20,6 +39,16 @@ class _FakeStructuredOutput:
             self.llm.best_response_prompt = prompt
             return BestResponse(id=1)
 
+        if self.schema in (BatchResponses, FusedResponses):
+            self.llm.batch_prompts.append(prompt)
+            roles = prompt.split("人设（按顺序）：", 1)[1].split("\n", 1)[0].split("、")
+            responses = [RoleResponse(role=r, response=f"{r}-reply") for r in roles]
+            if self.llm.drop_one:
+                responses.pop()
+            if self.schema is FusedResponses:
+                return FusedResponses(responses=responses, best_id=len(responses) - 1)
+            return BatchResponses(responses=responses)
+
         raise AssertionError(f"unexpected schema: {self.schema}")
 
 
@@ -27,6 +56,10 @@ class _FakeLLM:
     def __init__(self):
         self.best_response_prompt = ""
         self.structured_output_methods = []
+        self.active = 0
+        self.max_active = 0
+        self.batch_prompts = []
+        self.drop_one = False
 
     def with_structured_output(self, schema, **kwargs):
         self.structured_output_methods.append(kwargs.get("method"))
@@ -59,7 +92,8 @@ class RolePlayTests(unittest.TestCase):
 
     def test_role_play_uses_runtime_model(self):
         graph = Mock()
-        graph.invoke.return_value = {
+        graph.ainvoke = AsyncMock()
+        graph.ainvoke.return_value = {
             "responses": [{"role": "A", "content": "alpha"}],
             "best_role": "A",
             "best_response": "alpha",
@@ -73,16 +107,21 @@ class RolePlayTests(unittest.TestCase):
         )
 
         with (
+            patch.object(tool_role, "role_play_engine", RolePlayEngine()),
             patch.object(tool_role, "init_chat_model", return_value=Mock()) as init_chat_model,
             patch.object(tool_role, "create_doge_graph", return_value=graph),
         ):
-            result = tool_role.role_play.func(runtime=runtime, situation="测试", roles=["A"])
+            result = asyncio.run(
+                tool_role.role_play.coroutine(runtime=runtime, situation="测试", roles=["A"])
+            )
 
         init_chat_model.assert_called_once_with(
             model="deepseek-v3-2-251201",
             model_provider="openai",
             base_url="https://example.test/v1",
             api_key="test-key",
+            http_client=http_pool.sync_client("https://example.test/v1"),
+            http_async_client=http_pool.async_client("https://example.test/v1"),
         )
         self.assertIn("deepseek-v3-2-251201", result)
 
@@ -96,15 +135,9 @@ class RolePlayTests(unittest.TestCase):
         )
 
         with self.assertRaisesRegex(ValueError, "roles 不能为空"):
-            tool_role.role_play.func(runtime=runtime, situation="测试", roles=[])
+            asyncio.run(tool_role.role_play.coroutine(runtime=runtime, situation="测试", roles=[]))
 
     def test_role_play_rejects_too_many_roles(self):
-        graph = Mock()
-        graph.invoke.return_value = {
-            "responses": [{"role": "A", "content": "alpha"}],
-            "best_role": "A",
-            "best_response": "alpha",
-        }
         runtime = SimpleNamespace(
             context=SimpleNamespace(
                 base_url="https://example.test/v1",
@@ -114,15 +147,17 @@ class RolePlayTests(unittest.TestCase):
         )
 
         with (
-            patch.object(tool_role, "init_chat_model", return_value=Mock()),
-            patch.object(tool_role, "create_doge_graph", return_value=graph),
+            patch.object(tool_role, "init_chat_model") as init_chat_model,
             self.assertRaisesRegex(ValueError, "roles 最多支持 10 个"),
         ):
-            tool_role.role_play.func(
-                runtime=runtime,
-                situation="测试",
-                roles=[f"R{i}" for i in range(11)],
+            asyncio.run(
+                tool_role.role_play.coroutine(
+                    runtime=runtime,
+                    situation="测试",
+                    roles=[f"R{i}" for i in range(11)],
+                )
             )
+        init_chat_model.assert_not_called()
 
     def test_best_response_prompt_numbers_candidates(self):
         llm = _FakeLLM()
@@ -139,7 +174,184 @@ class RolePlayTests(unittest.TestCase):
 
         graph.invoke({"roles": ["A", "B"], "situation": "测试"})
 
-        self.assertEqual(llm.structured_output_methods, ["json_mode", "json_mode", "json_mode"])
+        self.assertEqual(llm.structured_output_methods, ["json_mode", "json_mode"])
+
+    def test_async_graph_limits_fan_out_concurrency(self):
+        llm = _FakeLLM()
+        graph = tool_role.create_doge_graph(llm)
+        roles = [f"R{i}" for i in range(6)]
+
+        result = asyncio.run(
+            graph.ainvoke({"roles": roles, "situation": "测试"}, {"max_concurrency": 2})
+        )
+
+        self.assertEqual([item["role"] for item in result["responses"]], roles)
+        self.assertEqual(result["best_role"], "R1")
+        self.assertEqual(llm.max_active, 2)
+
+
+class ProgressiveStreamingTests(unittest.TestCase):
+    def test_responses_are_reported_as_they_complete(self):
+        class SlowFirstLLM(_FakeLLM):
+            def with_structured_output(self, schema, **kwargs):
+                structured = super().with_structured_output(schema, **kwargs)
+                ainvoke = structured.ainvoke
+
+                async def delayed(prompt):
+                    if "作为一个A" in prompt:
+                        await asyncio.sleep(0.05)
+                    return await ainvoke(prompt)
+
+                structured.ainvoke = delayed
+                return structured
+
+        completed = []
+        with patch.object(tool_role, "init_chat_model", return_value=SlowFirstLLM()):
+            result = asyncio.run(
+                RolePlayEngine().ainvoke(
+                    "https://example.test/v1",
+                    "m",
+                    "k",
+                    ["A", "B"],
+                    "测试",
+                    on_response=completed.append,
+                )
+            )
+
+        self.assertEqual([r["role"] for r in completed], ["B", "A"])
+        self.assertEqual([r["role"] for r in result["responses"]], ["A", "B"])
+        self.assertEqual(result["best_role"], "B")
+
+    def test_tool_streams_each_response_with_its_call_id(self):
+        written = []
+        runtime = SimpleNamespace(
+            context=SimpleNamespace(base_url="https://example.test/v1", api_key="k", model="m"),
+            tool_call_id="call-7",
+            stream_writer=written.append,
+        )
+
+        with (
+            patch.object(tool_role, "role_play_engine", RolePlayEngine()),
+            patch.object(tool_role, "init_chat_model", return_value=_FakeLLM()),
+        ):
+            asyncio.run(
+                tool_role.role_play.coroutine(runtime=runtime, situation="测试", roles=["A", "B"])
+            )
+
+        self.assertEqual(
+            {(e["tool_call_id"], e["name"]) for e in written}, {("call-7", "role_play")}
+        )
+        self.assertEqual(
+            sorted((e["title"], e["content"]) for e in written),
+            [("1/2【A】", "A-reply"), ("2/2【B】", "B-reply")],
+        )
+
+
+class BatchModeTests(unittest.TestCase):
+    def test_batch_mode_generates_all_responses_in_one_call(self):
+        llm = _FakeLLM()
+        graph = tool_role.create_role_play_graph(llm, "batch")
+
+        result = asyncio.run(graph.ainvoke({"roles": ["A", "B", "C"], "situation": "测试"}))
+
+        self.assertEqual(len(llm.batch_prompts), 1)
+        self.assertIn("A、B、C", llm.batch_prompts[0])
+        self.assertEqual(
+            result["responses"],
+            [{"role": r, "content": f"{r}-reply"} for r in ("A", "B", "C")],
+        )
+        self.assertIn("1. 【B】B-reply", llm.best_response_prompt)
+        self.assertEqual(result["best_role"], "B")
+
+    def test_fused_mode_judges_in_the_same_call(self):
+        llm = _FakeLLM()
+        graph = tool_role.create_role_play_graph(llm, "fused")
+
+        result = graph.invoke({"roles": ["A", "B", "C"], "situation": "测试"})
+
+        self.assertEqual(len(llm.batch_prompts), 1)
+        self.assertEqual(llm.best_response_prompt, "")
+        self.assertEqual((result["best_role"], result["best_response"]), ("C", "C-reply"))
+
+    def test_batch_mode_rejects_missing_responses(self):
+        llm = _FakeLLM()
+        llm.drop_one = True
+        graph = tool_role.create_role_play_graph(llm, "batch")
+
+        with self.assertRaisesRegex(ValueError, "回复数 1 与人设数 2 不一致"):
+            graph.invoke({"roles": ["A", "B"], "situation": "测试"})
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "未知的 role_play 模式"):
+            RolePlayEngine().get_graph("https://example.test/v1", "model", "key", "serial")
+
+    def test_tool_mode_overrides_configured_default(self):
+        llm = _FakeLLM()
+        runtime = SimpleNamespace(
+            context=SimpleNamespace(base_url="https://example.test/v1", api_key="k", model="m")
+        )
+
+        with (
+            patch.object(tool_role, "role_play_engine", RolePlayEngine()),
+            patch.object(tool_role, "init_chat_model", return_value=llm),
+        ):
+            result = asyncio.run(
+                tool_role.role_play.coroutine(
+                    runtime=runtime, situation="测试", roles=["A", "B"], mode="fused"
+                )
+            )
+
+        self.assertEqual(len(llm.batch_prompts), 1)
+        self.assertIn("最受 m 喜爱的是【B】的回复", result)
+
+
+class RolePlayEngineTests(unittest.TestCase):
+    def test_graph_is_cached_per_model(self):
+        engine = RolePlayEngine()
+
+        with patch.object(tool_role, "init_chat_model", side_effect=lambda **_: _FakeLLM()) as init:
+            first = engine.get_graph("https://example.test/v1", "model-a", "key")
+            again = engine.get_graph("https://example.test/v1", "model-a", "key")
+            other = engine.get_graph("https://example.test/v1", "model-b", "key")
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+        self.assertEqual(init.call_count, 2)
+        self.assertEqual(engine.stats(), {"graphs": 2, "hits": 1, "misses": 2})
+
+    def test_graph_is_rebuilt_when_http_clients_change(self):
+        engine = RolePlayEngine()
+        base_url = "https://rebuild.example.test/v1"
+
+        with patch.object(tool_role, "init_chat_model", side_effect=lambda **_: _FakeLLM()):
+            first = engine.get_graph(base_url, "model", "key")
+            http_pool.mount(base_url)
+            second = engine.get_graph(base_url, "model", "key")
+
+        self.assertIsNot(first, second)
+
+    def test_cache_is_bounded(self):
+        engine = RolePlayEngine(RolePlayConfig(max_graphs=2))
+
+        with patch.object(tool_role, "init_chat_model", side_effect=lambda **_: _FakeLLM()):
+            for model in ("a", "b", "c"):
+                engine.get_graph("https://example.test/v1", model, "key")
+
+        self.assertEqual(engine.stats()["graphs"], 2)
+
+    def test_ainvoke_passes_max_concurrency(self):
+        engine = RolePlayEngine(RolePlayConfig(max_concurrency=3))
+        llm = _FakeLLM()
+
+        with patch.object(tool_role, "init_chat_model", return_value=llm):
+            result = asyncio.run(
+                engine.ainvoke(
+                    "https://example.test/v1", "model", "key", [f"R{i}" for i in range(8)], "测试"
+                )
+            )
+
+        self.assertEqual(len(result["responses"]), 8)
+        self.assertEqual(llm.max_active, 3)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from utils.scheduler import AdmissionScheduler, QueueFullError
+
+
+class AdmissionSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_is_capped_per_provider(self):
+        scheduler = AdmissionScheduler(max_concurrency=2, provider_limits={"ollama": 1})
+        active = peak = 0
+
+        async def run(provider, session):
+            nonlocal active, peak
+            async with scheduler.submit(provider, session):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(run("dashscope", f"s{i}") for i in range(6)))
+        self.assertEqual(peak, 2)
+
+        peak = 0
+        await asyncio.gather(*(run("ollama", f"s{i}") for i in range(3)))
+        self.assertEqual(peak, 1)
+
+    def test_queue_is_round_robin_across_sessions(self):
+        scheduler = AdmissionScheduler(max_concurrency=1)
+        running = scheduler.submit("p", "busy")
+        a1, a2, a3 = (scheduler.submit("p", "a") for _ in range(3))
+        b1 = scheduler.submit("p", "b")
+        c1 = scheduler.submit("p", "c")
+
+        self.assertEqual([t.position() for t in (a1, b1, c1, a2, a3)], [0, 1, 2, 3, 4])
+
+        order = []
+        current = running
+        for _ in range(5):
+            current.release()
+            current = next(t for t in (a1, a2, a3, b1, c1) if t.granted and t not in order)
+            order.append(current)
+
+        self.assertEqual(order, [a1, b1, c1, a2, a3])
+
+    def test_full_queue_sheds_new_requests(self):
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=1)
+        scheduler.submit("p", "a")
+        scheduler.submit("p", "b")
+
+        with self.assertRaises(QueueFullError):
+            scheduler.submit("p", "c")
+        self.assertEqual(scheduler.stats()["p"]["queued"], 1)
+
+    def test_abandoned_ticket_leaves_queue(self):
+        scheduler = AdmissionScheduler(max_concurrency=1)
+        running = scheduler.submit("p", "a")
+        waiting = scheduler.submit("p", "b")
+        behind = scheduler.submit("p", "c")
+
+        waiting.release()
+        self.assertEqual(behind.position(), 0)
+
+        running.release()
+        self.assertTrue(behind.granted)
+        stats = scheduler.stats()["p"]
+        self.assertEqual((stats["running"], stats["queued"]), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
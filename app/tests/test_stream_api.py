@@ -0,0 +1,170 @@
+import asyncio
+import json
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from app import AppConfig, CheckpointConfig, make_stream_api
+from utils.scheduler import AdmissionScheduler
+
+
+class FakeAgent:
+    def __init__(self):
+        self.calls = []
+
+    async def astream(self, inputs, stream_mode, context, config):
+        self.calls.append((inputs["messages"], config))
+        call = {"id": "call-1", "name": "calculator", "args": {"expression": "1+1"}}
+        yield "values", {"messages": [AIMessage(content="", tool_calls=[call])]}
+        progress = {"tool_call_id": "call-1", "name": "calculator", "title": "1/1", "content": "2"}
+        yield "custom", progress
+        yield (
+            "messages",
+            (
+                ToolMessage(content="2", name="calculator", tool_call_id="call-1"),
+                {"langgraph_node": "tools"},
+            ),
+        )
+        for text in ["结果", "是 2"]:
+            yield "messages", (AIMessageChunk(content=text), {"langgraph_node": "model"})
+
+
+class FakeService:
+    llm = None
+
+    def __init__(self, agent=None, scheduler=None):
+        self.agent = agent or FakeAgent()
+        self.scheduler = scheduler or AdmissionScheduler()
+
+    async def get_agent(self):
+        return self.agent
+
+
+class FailingService(FakeService):
+    async def get_agent(self):
+        raise TimeoutError("agent init timed out")
+
+
+def _client(service, config=None):
+    api = FastAPI()
+    api.include_router(make_stream_api(service, config or AppConfig()))
+    return TestClient(api)
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class StreamAPITests(unittest.TestCase):
+    def test_sse_streams_typed_deltas_with_request_id(self):
+        response = _client(FakeService()).post(
+            "/api/chat", json={"message": "1+1"}, headers={"X-Request-ID": "req-1"}
+        )
+
+        self.assertEqual(response.headers["x-request-id"], "req-1")
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = _sse_events(response.text)
+        self.assertEqual(
+            [kind for kind, _ in events],
+            ["start", "tool_call", "tool_progress", "tool_result", "token", "token", "done"],
+        )
+        self.assertEqual(events[0][1], {"request_id": "req-1"})
+        self.assertEqual(events[1][1]["args"], {"expression": "1+1"})
+        self.assertEqual(
+            events[2][1], {"id": "call-1", "name": "calculator", "title": "1/1", "content": "2"}
+        )
+        self.assertEqual(events[3][1], {"id": "call-1", "name": "calculator", "content": "2"})
+        self.assertEqual(
+            "".join(data["text"] for kind, data in events if kind == "token"), "结果是 2"
+        )
+
+    def test_ndjson_and_caller_history(self):
+        service = FakeService()
+        response = _client(service).post(
+            "/api/chat",
+            json={
+                "message": "second",
+                "history": [
+                    {"role": "user", "content": "first"},
+                    {"role": "assistant", "content": "answer"},
+                ],
+            },
+            headers={"Accept": "application/x-ndjson"},
+        )
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines[0]["event"], "start")
+        self.assertEqual(lines[0]["request_id"], response.headers["x-request-id"])
+        messages, config = service.agent.calls[0]
+        self.assertEqual([m["content"] for m in messages], ["first", "answer", "second"])
+        self.assertIsNone(config)
+
+    def test_thread_mode_sends_only_new_message(self):
+        service = FakeService()
+        config = AppConfig(checkpoint=CheckpointConfig(backend="memory"))
+
+        _client(service, config).post("/api/chat", json={"message": "hi", "session_id": "s1"})
+
+        messages, run_config = service.agent.calls[0]
+        self.assertEqual(messages, [{"role": "user", "content": "hi"}])
+        self.assertEqual(run_config["configurable"]["thread_id"], "api:s1")
+
+    def test_errors_are_reported_as_events(self):
+        response = _client(FailingService()).post("/api/chat", json={"message": "hi"})
+
+        events = _sse_events(response.text)
+        self.assertEqual([kind for kind, _ in events], ["start", "error", "done"])
+        self.assertIn("超时", events[1][1]["message"])
+
+    def test_full_queue_is_rejected_with_503(self):
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=0)
+        scheduler.submit("dashscope", "other")
+
+        response = _client(FakeService(scheduler=scheduler)).post(
+            "/api/chat", json={"message": "hi"}, headers={"X-Request-ID": "req-2"}
+        )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["request_id"], "req-2")
+
+    def test_ticket_is_released_when_response_fails_before_streaming(self):
+        scheduler = AdmissionScheduler(max_concurrency=1)
+        api = FastAPI()
+        api.include_router(make_stream_api(FakeService(scheduler=scheduler), AppConfig()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/chat",
+            "raw_path": b"/api/chat",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        body = json.dumps({"message": "hi"}).encode()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            # 客户端在响应头发出前断开，事件生成器不会开始迭代
+            raise OSError("client disconnected")
+
+        with self.assertRaises(Exception):
+            asyncio.run(api(scope, receive, send))
+
+        self.assertEqual(scheduler.stats()["dashscope"]["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from langchain_core.messages import ToolMessage
+
+from tools.tool_sci import calculator
+from tools.tool_search import dashscope_search
+from utils.metrics import MetricsRegistry
+from utils.tool_cache import CachePolicy, ToolCacheMiddleware, ToolResultCache
+
+
+def _request(tool, args, call_id, name=None, api_key=None):
+    return SimpleNamespace(
+        tool=tool,
+        tool_call={"name": name or tool.name, "args": args, "id": call_id},
+        runtime=SimpleNamespace(context=SimpleNamespace(api_key=api_key)),
+    )
+
+
+class ToolResultCacheTests(unittest.TestCase):
+    def test_args_are_canonicalized(self):
+        cache = ToolResultCache(metrics=MetricsRegistry())
+        cache.put("weather", {"city": "杭州", "unit": "c"}, "sunny", ttl=None, size=5)
+
+        self.assertEqual(cache.get("weather", {"unit": "c", "city": "杭州"}), "sunny")
+        self.assertIsNone(cache.get("other", {"unit": "c", "city": "杭州"}))
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        cache = ToolResultCache(max_entries=2, max_bytes=10, metrics=MetricsRegistry())
+        cache.put("t", {"x": 1}, "a", ttl=None, size=4)
+        cache.put("t", {"x": 2}, "b", ttl=None, size=4)
+        cache.get("t", {"x": 1})
+        cache.put("t", {"x": 3}, "c", ttl=None, size=4)
+
+        self.assertEqual(cache.get("t", {"x": 1}), "a")
+        self.assertIsNone(cache.get("t", {"x": 2}))
+
+        cache.put("t", {"x": 4}, "d", ttl=None, size=8)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], 10)
+
+    def test_ttl_entries_expire(self):
+        cache = ToolResultCache(metrics=MetricsRegistry())
+        with patch("utils.tool_cache.time.monotonic", return_value=100.0):
+            cache.put("search", {"q": "x"}, "result", ttl=60, size=6)
+        with patch("utils.tool_cache.time.monotonic", return_value=159.0):
+            self.assertEqual(cache.get("search", {"q": "x"}), "result")
+        with patch("utils.tool_cache.time.monotonic", return_value=161.0):
+            self.assertIsNone(cache.get("search", {"q": "x"}))
+
+    def test_hit_rate_is_reported_per_tool(self):
+        metrics = MetricsRegistry()
+        cache = ToolResultCache(metrics=metrics)
+        cache.get("t", {})
+        cache.put("t", {}, "v", ttl=None, size=1)
+        cache.get("t", {})
+        cache.get("t", {})
+
+        self.assertEqual(cache.stats()["tools"]["t"], {"hits": 2, "misses": 1, "hit_rate": 2 / 3})
+        self.assertIn('tool_cache_hits_total{tool="t"} 2', metrics.render_text())
+
+
+class ToolCacheMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+    async def test_cacheable_tool_is_called_once_and_hits_keep_call_id(self):
+        middleware = ToolCacheMiddleware(ToolResultCache(metrics=MetricsRegistry()))
+        calls = []
+
+        async def handler(request):
+            calls.append(request.tool_call["id"])
+            return ToolMessage(content="4", tool_call_id=request.tool_call["id"], name="calculator")
+
+        first = await middleware.awrap_tool_call(
+            _request(calculator, {"expression": "2+2"}, "call-1"), handler
+        )
+        second = await middleware.awrap_tool_call(
+            _request(calculator, {"expression": "2+2"}, "call-2"), handler
+        )
+
+        self.assertEqual(calls, ["call-1"])
+        self.assertEqual((first.content, second.content), ("4", "4"))
+        self.assertEqual(second.tool_call_id, "call-2")
+
+    async def test_errors_and_uncached_tools_always_run(self):
+        middleware = ToolCacheMiddleware(
+            ToolResultCache(metrics=MetricsRegistry()),
+            policies={"flaky": CachePolicy(ttl=60)},
+        )
+        plain_tool = SimpleNamespace(name="plain", metadata=None)
+        calls = []
+
+        async def handler(request):
+            calls.append(request.tool_call["name"])
+            return ToolMessage(content="boom", tool_call_id="x", status="error")
+
+        for _ in range(2):
+            await middleware.awrap_tool_call(_request(plain_tool, {}, "a", "flaky"), handler)
+            await middleware.awrap_tool_call(_request(plain_tool, {}, "b"), handler)
+
+        self.assertEqual(calls, ["flaky", "plain", "flaky", "plain"])
+
+    async def test_search_results_are_not_shared_across_api_keys(self):
+        middleware = ToolCacheMiddleware(ToolResultCache(metrics=MetricsRegistry()))
+        calls = []
+
+        async def handler(request):
+            api_key = request.runtime.context.api_key
+            calls.append(api_key)
+            return ToolMessage(content=f"结果 ({api_key})", tool_call_id=request.tool_call["id"])
+
+        results = [
+            await middleware.awrap_tool_call(
+                _request(dashscope_search, {"query": "LangGraph"}, f"call-{i}", api_key=key),
+                handler,
+            )
+            for i, key in enumerate(["key-a", "key-b", None, "key-a"])
+        ]
+
+        self.assertEqual(calls, ["key-a", "key-b", None])
+        self.assertEqual(results[3].content, "结果 (key-a)")
+
+    async def test_concurrent_identical_calls_share_one_execution(self):
+        metrics = MetricsRegistry()
+        cache = ToolResultCache(metrics=metrics)
+        # 主 Agent 与子 Agent 各有一个中间件实例，共用同一个缓存
+        middlewares = [ToolCacheMiddleware(cache), ToolCacheMiddleware(cache)]
+        calls = []
+
+        async def handler(request):
+            calls.append(request.tool_call["id"])
+            await asyncio.sleep(0.01)
+            return ToolMessage(content="结果", tool_call_id=request.tool_call["id"])
+
+        results = await asyncio.gather(
+            *(
+                middlewares[i % 2].awrap_tool_call(
+                    _request(dashscope_search, {"query": query}, f"call-{i}"), handler
+                )
+                for i, query in enumerate(["LangGraph 教程", " langgraph　教程 ", "LANGGRAPH 教程"])
+            )
+        )
+
+        self.assertEqual(calls, ["call-0"])
+        self.assertEqual([r.tool_call_id for r in results], ["call-0", "call-1", "call-2"])
+        self.assertEqual({r.content for r in results}, {"结果"})
+        self.assertIn('tool_cache_shared_total{tool="dashscope_search"} 2', metrics.render_text())
+        self.assertEqual(cache.stats()["in_flight"], 0)
+
+    async def test_waiting_calls_run_themselves_when_the_shared_call_fails(self):
+        middleware = ToolCacheMiddleware(ToolResultCache(metrics=MetricsRegistry()))
+        calls = []
+
+        async def handler(request):
+            calls.append(request.tool_call["id"])
+            await asyncio.sleep(0.01)
+            if request.tool_call["id"] == "call-0":
+                raise ConnectionError("upstream reset")
+            return ToolMessage(content="4", tool_call_id=request.tool_call["id"])
+
+        results = await asyncio.gather(
+            *(
+                middleware.awrap_tool_call(
+                    _request(calculator, {"expression": "2+2"}, f"call-{i}"), handler
+                )
+                for i in range(3)
+            ),
+            return_exceptions=True,
+        )
+
+        self.assertIsInstance(results[0], ConnectionError)
+        self.assertEqual([r.content for r in results[1:]], ["4", "4"])
+        self.assertEqual(calls, ["call-0", "call-1", "call-2"])
+
+    async def test_waiting_calls_run_themselves_when_cache_if_rejects_the_result(self):
+        cache = ToolResultCache(metrics=MetricsRegistry())
+        middleware = ToolCacheMiddleware(
+            cache, policies={"search": CachePolicy(ttl=60, cache_if=bool)}
+        )
+        search_tool = SimpleNamespace(name="search", metadata=None)
+        calls = []
+
+        async def handler(request):
+            calls.append(request.tool_call["id"])
+            await asyncio.sleep(0.01)
+            # 首次调用返回空结果，不满足 cache_if
+            content = "" if request.tool_call["id"] == "call-0" else "结果"
+            return ToolMessage(content=content, tool_call_id=request.tool_call["id"])
+
+        results = await asyncio.gather(
+            *(
+                middleware.awrap_tool_call(_request(search_tool, {"q": "x"}, f"call-{i}"), handler)
+                for i in range(3)
+            )
+        )
+
+        self.assertEqual(calls, ["call-0", "call-1", "call-2"])
+        self.assertEqual([r.content for r in results], ["", "结果", "结果"])
+        self.assertEqual([r.tool_call_id for r in results], ["call-0", "call-1", "call-2"])
+        self.assertEqual(cache.stats()["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
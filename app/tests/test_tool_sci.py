@@ -0,0 +1,206 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from tools.tool_sci import EvalLimits, SafeEvaluator, calculator
+
+EXPRESSIONS = [
+    "(3 + 5) * 12",
+    "(sqrt(9) + 1) ** 2 / 3",
+    "log10(1000) * sin(0.5) + cos(0.5) - tan(0.1)",
+    "abs(-7.5) * exp(1) - log2(1024) % 3 + 17 // 4",
+    "-2 ** 0.5",
+    "1 / 0",
+    "10 % 0",
+    "log(-1)",
+    "x + 1",
+    "__import__('os')",
+    "sqrt(1, 2)",
+    "math.sqrt(4)",
+    "'a' * 3",
+    "[1, 2]",
+    "1 if 1 else 2",
+    "1 +",
+    "   ",
+    "9 ** 9 ** 9",
+    "10.0 ** 400",
+    "exp(1000)",
+    "1 +" * 300 + " 1",
+]
+
+# 构造出来用于占满 CPU 或内存的表达式
+ADVERSARIAL = [
+    "9 ** 9 ** 9",
+    "2 ** 10 ** 10",
+    "(-7) ** 99999999",
+    "10 ** 5000",
+    "((2 ** 60) ** 60) ** 60",
+    "(10 ** 2000) * (10 ** 2500)",
+    "(9 ** 999) * (9 ** 999) * (9 ** 999) * (9 ** 999) * (9 ** 999)",
+    "abs(7 ** 77777) + 1",
+]
+
+
+def _outcome(func, expression):
+    try:
+        return func(expression)
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+class CompiledEvaluationTests(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = SafeEvaluator()
+
+    def test_compiled_results_and_errors_match_the_interpreter(self):
+        for expression in EXPRESSIONS:
+            with self.subTest(expression=expression):
+                self.assertEqual(
+                    _outcome(self.evaluator.evaluate, expression),
+                    _outcome(self.evaluator.interpret, expression),
+                )
+
+    def test_invalid_variable_names_are_rejected(self):
+        for name in ("sqrt", "1x", "a b"):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                self.evaluator.compile("1", (name,))
+
+    def test_calculator_tool_uses_the_compiled_path(self):
+        self.assertEqual(calculator.invoke({"expression": "(3 + 5) * 12"}), "96")
+
+
+class CostLimitTests(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = SafeEvaluator()
+
+    def test_oversized_results_are_rejected_before_computing(self):
+        for evaluate in (self.evaluator.evaluate, self.evaluator.interpret):
+            for expression in ADVERSARIAL:
+                with self.subTest(evaluate=evaluate.__name__, expression=expression):
+                    started = time.perf_counter()
+                    with self.assertRaisesRegex(ValueError, "结果过大"):
+                        evaluate(expression)
+                    self.assertLess(time.perf_counter() - started, 0.1)
+
+    def test_large_results_within_budget_are_exact(self):
+        self.assertEqual(self.evaluator.evaluate("10 ** 3000"), 10**3000)
+        self.assertEqual(self.evaluator.evaluate("(2 ** 64) * (2 ** 64)"), 2**128)
+        self.assertEqual(self.evaluator.evaluate("(-1) ** 99999999 + 1 ** 99999999"), 0)
+        self.assertEqual(self.evaluator.evaluate("2 ** -2 * 0 ** 5"), 0)
+
+    def test_calculator_reports_oversized_results_quickly(self):
+        started = time.perf_counter()
+        with self.assertRaisesRegex(ValueError, "结果过大"):
+            calculator.invoke({"expression": "9**9**9"})
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+    def test_float_overflow_is_reported(self):
+        for expression in ("10.0 ** 400", "exp(1000)", "10 ** 400 / 3.0"):
+            with (
+                self.subTest(expression=expression),
+                self.assertRaisesRegex(ValueError, "数值溢出"),
+            ):
+                self.evaluator.evaluate(expression)
+
+    def test_operation_count_and_nesting_are_bounded(self):
+        for expression in ("1 +" * 300 + " 1", "-" * 300 + "1", "2 *" * 250 + " 1"):
+            for evaluate in (self.evaluator.evaluate, self.evaluator.interpret):
+                with self.subTest(expression=expression[:10], evaluate=evaluate.__name__):
+                    with self.assertRaisesRegex(ValueError, "运算次数超过上限 200"):
+                        evaluate(expression)
+
+        with self.assertRaisesRegex(ValueError, "无效的数学表达式"):
+            self.evaluator.evaluate("(" * 300 + "1" + ")" * 300)
+
+    def test_long_expressions_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "表达式过长"):
+            self.evaluator.evaluate("1" * 1001)
+
+    def test_wall_clock_budget_is_checked_before_each_pow_and_mult(self):
+        for evaluate in (self.evaluator.evaluate, self.evaluator.interpret):
+            with (
+                self.subTest(evaluate=evaluate.__name__),
+                patch("arith.time.monotonic", side_effect=[0.0, 0.5, 2.0]),
+                self.assertRaisesRegex(ValueError, "计算超时"),
+            ):
+                evaluate("2 ** 3 * 4")
+
+    def test_limits_are_configurable_per_evaluator(self):
+        strict = SafeEvaluator(EvalLimits(max_digits=10, max_ops=2))
+
+        self.assertEqual(self.evaluator.evaluate("10 ** 20"), 10**20)
+        with self.assertRaisesRegex(ValueError, "结果过大"):
+            strict.evaluate("10 ** 20")
+        with self.assertRaisesRegex(ValueError, "运算次数超过上限 2"):
+            strict.evaluate("1 + 2 + 3 + 4")
+
+
+class BatchEvaluationTests(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = SafeEvaluator()
+
+    def test_evaluate_many_keeps_input_order(self):
+        self.assertEqual(self.evaluator.evaluate_many(["1 + 1", "2 ** 10", "7 // 2"]), [2, 1024, 3])
+
+    def test_evaluate_many_raises_first_error_by_default(self):
+        with self.assertRaisesRegex(ValueError, "除零错误"):
+            self.evaluator.evaluate_many(["1 + 1", "1 / 0", "y"])
+
+    def test_evaluate_many_can_return_errors_in_place(self):
+        results = self.evaluator.evaluate_many(["1 + 1", "1 / 0", "y"], return_exceptions=True)
+
+        self.assertEqual(results[0], 2)
+        self.assertEqual([str(e) for e in results[1:]], ["除零错误", "不支持变量: y"])
+
+    def test_vectorized_matches_scalar_evaluation(self):
+        expression = "sqrt(x ** 2 + y ** 2) * sin(x) + log(abs(y) + 1)"
+        xs = np.linspace(-5, 5, 11)
+        ys = np.linspace(1, 3, 11)
+
+        result = self.evaluator.evaluate_vectorized(expression, x=xs, y=ys)
+
+        expected = [
+            self.evaluator.evaluate(expression.replace("x", f"({x!r})").replace("y", f"({y!r})"))
+            for x, y in zip(xs.tolist(), ys.tolist())
+        ]
+        np.testing.assert_allclose(result, expected)
+
+    def test_vectorized_broadcasts_scalars(self):
+        result = self.evaluator.evaluate_vectorized("x * k", x=np.arange(3), k=2)
+
+        self.assertEqual(result.tolist(), [0, 2, 4])
+
+    def test_vectorized_integer_inputs_do_not_wrap_on_overflow(self):
+        expression = "x ** 30 - y * 3 ** 40"
+        xs = np.arange(2, 12)
+        ys = np.arange(10)
+
+        result = self.evaluator.evaluate_vectorized(expression, x=xs, y=ys)
+
+        expected = [
+            self.evaluator.evaluate(f"{x} ** 30 - {y} * 3 ** 40")
+            for x, y in zip(xs.tolist(), ys.tolist())
+        ]
+        np.testing.assert_allclose(result, [float(e) for e in expected])
+
+    def test_vectorized_rejects_non_numeric_inputs(self):
+        with self.assertRaisesRegex(ValueError, "变量 x 必须是数值"):
+            self.evaluator.evaluate_vectorized("x ** 2", x=10**30)
+
+    def test_vectorized_follows_numpy_rules_for_invalid_values(self):
+        result = self.evaluator.evaluate_vectorized("1 / x + sqrt(x - 1)", x=np.array([0.0, 2.0]))
+
+        self.assertTrue(np.isinf(result[0]) or np.isnan(result[0]))
+        self.assertAlmostEqual(result[1], 1.5)
+
+    def test_vectorized_rejects_unknown_variables_and_syntax(self):
+        with self.assertRaisesRegex(ValueError, "不支持变量: z"):
+            self.evaluator.evaluate_vectorized("x + z", x=np.arange(3))
+        with self.assertRaisesRegex(ValueError, "不支持的语法"):
+            self.evaluator.evaluate_vectorized("x[0]", x=np.arange(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
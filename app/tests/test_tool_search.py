@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import dashscope
+
+from tools.tool_search import dashscope_search, normalize_query
+
+
+def _runtime(api_key):
+    return SimpleNamespace(context=SimpleNamespace(api_key=api_key))
+
+
+def _response(status_code=200, content="搜索结果", message=""):
+    choice = SimpleNamespace(message=SimpleNamespace(content=content))
+    return SimpleNamespace(
+        status_code=status_code, message=message, output=SimpleNamespace(choices=[choice])
+    )
+
+
+class DashscopeSearchTests(unittest.TestCase):
+    def test_each_call_uses_its_own_api_key(self):
+        call = AsyncMock(return_value=_response())
+
+        async def search_concurrently():
+            return await asyncio.gather(
+                dashscope_search.coroutine(query="天气", runtime=_runtime("key-a")),
+                dashscope_search.coroutine(query="新闻", runtime=_runtime("key-b")),
+            )
+
+        with (
+            patch("dashscope.AioGeneration.call", call),
+            patch.object(dashscope, "api_key", "global-key"),
+        ):
+            results = asyncio.run(search_concurrently())
+            self.assertEqual(dashscope.api_key, "global-key")
+
+        self.assertEqual(results, ["搜索结果", "搜索结果"])
+        self.assertEqual(
+            {(c.kwargs["prompt"], c.kwargs["api_key"]) for c in call.call_args_list},
+            {("天气", "key-a"), ("新闻", "key-b")},
+        )
+
+    def test_failures_are_reported_in_the_result(self):
+        call = AsyncMock(return_value=_response(status_code=401, message="Invalid API-key"))
+
+        with patch("dashscope.AioGeneration.call", call):
+            result = asyncio.run(dashscope_search.coroutine(query="x", runtime=_runtime("k")))
+
+        self.assertEqual(result, "Search failed with status code: 401, message: Invalid API-key")
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  LangGraph　\tＡＰＩ  "), "langgraph api")
+
+
+if __name__ == "__main__":
+    unittest.main()
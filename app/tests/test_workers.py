@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from starlette.testclient import TestClient
+
+from utils.session_store import SqliteSessionStore
+from utils.workers import (
+    STICKY_COOKIE,
+    StickyRouter,
+    create_proxy_app,
+    spawn_proxies,
+    stop_workers,
+)
+
+WORKERS = ["http://127.0.0.1:7001", "http://127.0.0.1:7002", "http://127.0.0.1:7003"]
+
+
+def _echo_transport(down=()):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.port in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        body = {
+            "port": request.url.port,
+            "path": request.url.path,
+            "query": request.url.query.decode(),
+        }
+        # 与真实 worker 一样以流的形式返回，代理按原始字节转发
+        return httpx.Response(
+            200,
+            headers=[("set-cookie", "a=1"), ("set-cookie", "b=2")],
+            stream=httpx.ByteStream(json.dumps(body).encode()),
+        )
+
+    return httpx.MockTransport(handler)
+
+
+class StickyRouterTests(unittest.TestCase):
+    def test_same_key_maps_to_same_worker_and_falls_back_in_order(self):
+        router = StickyRouter(WORKERS)
+
+        first = list(router.candidates("session-a"))
+
+        self.assertEqual(first, list(router.candidates("session-a")))
+        self.assertEqual(sorted(first), [0, 1, 2])
+        self.assertEqual(first[1], (first[0] + 1) % 3)
+
+
+class StickyProxyTests(unittest.TestCase):
+    def test_cookie_pins_browser_to_one_worker(self):
+        with TestClient(create_proxy_app(WORKERS, _echo_transport())) as client:
+            first = client.get("/gradio_api/info?x=1")
+            ports = {client.get("/gradio_api/queue/data").json()["port"] for _ in range(5)}
+
+        self.assertIn(STICKY_COOKIE, first.cookies)
+        self.assertEqual(first.json()["query"], "x=1")
+        self.assertEqual(ports, {first.json()["port"]})
+        self.assertEqual(first.headers.get_list("set-cookie")[:2], ["a=1", "b=2"])
+
+    def test_session_header_routes_and_skips_dead_workers(self):
+        router = StickyRouter(WORKERS)
+        preferred = next(router.candidates("s1"))
+        dead_port = int(WORKERS[preferred].rsplit(":", 1)[1])
+
+        with TestClient(create_proxy_app(WORKERS, _echo_transport(down={dead_port}))) as client:
+            response = client.post("/api/chat", headers={"X-Session-ID": "s1"}, json={})
+
+        self.assertNotEqual(response.json()["port"], dead_port)
+        self.assertEqual(response.headers["x-worker"], str((preferred + 1) % 3))
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"port": self.server.server_address[1]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ProxyProcessTests(unittest.TestCase):
+    def test_proxy_processes_share_the_socket_and_route_consistently(self):
+        upstreams = [ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler) for _ in range(3)]
+        for server in upstreams:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in upstreams]
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        proxies = spawn_proxies(sock, urls, 2)
+        # 主进程不接受连接，请求全部由两个代理子进程处理
+        address = "http://127.0.0.1:%d" % sock.getsockname()[1]
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    httpx.get(f"{address}/ready", timeout=1)
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+
+            for session in ("a", "b", "c"):
+                ports = {
+                    httpx.get(f"{address}/x", headers={"X-Session-ID": session}).json()["port"]
+                    for _ in range(10)
+                }
+                expected = next(StickyRouter(urls).candidates(session))
+                self.assertEqual(ports, {upstreams[expected].server_address[1]})
+        finally:
+            stop_workers(proxies)
+            sock.close()
+            for server in upstreams:
+                server.shutdown()
+                server.server_close()
+
+
+class SqliteSessionStoreTests(unittest.TestCase):
+    def test_thread_is_shared_between_store_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.sqlite")
+            worker_a, worker_b = SqliteSessionStore(path), SqliteSessionStore(path)
+            asked = [{"role": "user", "content": "hi"}]
+
+            thread, fresh = worker_a.resolve("s", [])
+            self.assertTrue(fresh)
+            worker_a.complete("s", thread, asked)
+            self.assertEqual(worker_b.resolve("s", asked), (thread, False))
+            # 界面上开启新对话时换一个 thread
+            self.assertNotEqual(worker_b.resolve("s", [])[0], thread)
+
+            worker_a.close()
+            worker_b.close()
+
+    def test_turns_that_did_not_complete_start_a_new_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SqliteSessionStore(os.path.join(directory, "sessions.sqlite"))
+            first = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+            second = [
+                *first,
+                {"role": "user", "content": "boom"},
+                {"role": "assistant", "content": ""},
+            ]
+
+            thread, _ = store.resolve("s", [])
+            store.complete("s", thread, first)
+            self.assertEqual(store.resolve("s", first), (thread, False))
+            # 第二轮出错，没有 complete：下一轮界面历史多出一轮，开启新的 thread
+            retry, fresh = store.resolve("s", second)
+            self.assertTrue(fresh)
+            self.assertNotEqual(retry, thread)
+            store.close()
+
+    def test_databases_without_turns_column_are_migrated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.sqlite")
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE gradio_sessions (session_id TEXT PRIMARY KEY, "
+                "thread_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("INSERT INTO gradio_sessions VALUES ('s', 'old-thread', 0)")
+            conn.commit()
+            conn.close()
+
+            store = SqliteSessionStore(path)
+            thread, fresh = store.resolve("s", [{"role": "user", "content": "hi"}])
+
+            self.assertTrue(fresh)
+            self.assertNotEqual(thread, "old-thread")
+            store.close()
+
+    def test_oldest_sessions_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SqliteSessionStore(os.path.join(directory, "s.sqlite"), max_sessions=2)
+            asked = [{"role": "user", "content": "hi"}]
+            first, _ = store.resolve("a", [])
+            store.complete("a", first, asked)
+            store.resolve("b", [])
+            store.resolve("c", [])
+
+            self.assertNotEqual(store.resolve("a", asked)[0], first)
+            store.close()
+
+
+class SqliteSessionStoreAsyncTests(unittest.IsolatedAsyncioTestCase):
+    async def test_waiting_for_the_write_lock_does_not_block_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.sqlite")
+            store = SqliteSessionStore(path)
+            # 另一个 worker 持有写锁，0.2 秒后提交
+            other = sqlite3.connect(path, check_same_thread=False)
+            other.execute("BEGIN IMMEDIATE")
+            asyncio.get_running_loop().call_later(0.2, other.commit)
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            thread, _ = await asyncio.wait_for(store.aresolve("s", []), timeout=5)
+            ticker.cancel()
+
+            self.assertGreaterEqual(ticks, 10)
+            asked = [{"role": "user", "content": "hi"}]
+            await store.acomplete("s", thread, asked)
+            self.assertEqual(store.resolve("s", asked), (thread, False))
+            other.close()
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
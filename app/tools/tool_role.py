@@ -1,16 +1,33 @@
 """
 角色扮演工具
+
+编译好的 Doge 工作流与模型按 (base_url, model, api_key) 缓存在 role_play_engine 中，
+工具以异步方式运行工作流，支持三种执行模式（ROLE_PLAY_MODES）：
+- fanout：每个角色单独调用一次模型（并发数由 RolePlayConfig.max_concurrency 控制），再调用一次评选
+- batch：一次调用生成所有角色的回复，再调用一次评选
+- fused：一次调用同时生成所有回复并评选出最佳回复
+
+batch / fused 的调用次数与重复的提示词更少，但输出集中在一次调用中，总耗时取决于输出速度，
+两种模式的耗时与 token 对比见 bench/bench_role_play.py。
+
+工具运行期间，每个角色的回复一生成就通过 runtime.stream_writer 以自定义流事件发出，
+界面逐条显示（见 app.py 的 _agent_events），评选结果随工具返回值最后到达。
 """
 
 import operator
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Annotated, Any, Callable, Dict, Literal, Optional, Tuple, TypedDict
 
-from typing import Annotated, TypedDict
 from pydantic import BaseModel
 from langchain.tools import tool, ToolRuntime
 from langchain.chat_models import init_chat_model
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Send
 from tools.tool_runtime import ToolSchema
+from utils.http_pool import http_pool
 
 
 # 角色扮演的提示词
@@ -24,8 +41,22 @@ best_response_prompt = """下面是几种类型的男生，面对女神{situatio
 下面是男生们的反应：\n\n{responses}"""
 
 
+# 一次生成所有角色回复的提示词
+batch_role_play_prompt = """面对女神{situation}的情况，下面几种人设的男生分别应该如何一句话回复女神？
+人设（按顺序）：{roles}
+请以JSON格式返回，包含responses字段：按人设顺序排列的列表，每一项包含role与response字段"""
+
+
+# 一次生成所有角色回复并评选最佳回复的提示词
+fused_role_play_prompt = """面对女神{situation}的情况，下面几种人设的男生分别应该如何一句话回复女神？
+人设（按顺序）：{roles}
+写完所有回复后，评选出最能挽回女神的心的回复，第一条回复对应的是0号ID。
+请以JSON格式返回，包含responses与best_id字段：responses是按人设顺序排列的列表，每一项包含role与response字段，best_id是最佳回复的ID"""
+
+
 MAX_ROLES = 10
 STRUCTURED_OUTPUT_METHOD = "json_mode"
+ROLE_PLAY_MODES = ("fanout", "batch", "fused")
 
 
 # 角色
@@ -49,6 +80,22 @@ class BestResponse(BaseModel):
     id: int
 
 
+# 单个角色的回复（批量生成时使用）
+class RoleResponse(BaseModel):
+    role: str
+    response: str
+
+
+# 批量生成的所有回复
+class BatchResponses(BaseModel):
+    responses: list[RoleResponse]
+
+
+# 批量生成的所有回复与最佳回复的 ID
+class FusedResponses(BatchResponses):
+    best_id: int
+
+
 # 全局上下文
 class Overall(TypedDict):
     situation: str
@@ -66,8 +113,9 @@ class DogeOutput(TypedDict):
     best_role: str
 
 
-# 创建 Doge 工作流
+# 创建 Doge 工作流（节点同时提供同步与异步实现，invoke / ainvoke 均可运行）
 def create_doge_graph(llm):
+    response_llm = llm.with_structured_output(Response, method=STRUCTURED_OUTPUT_METHOD)
 
     # [MAP] 使用 Send 函数分发角色
     def continue_to_responses(state: Overall):
@@ -79,31 +127,23 @@ def create_doge_graph(llm):
     # [MAP] 角色回复节点：生成每个角色的回复
     def generate_response(state: Role):
         prompt = role_play_prompt.format(role=state["role"], situation=state["situation"])
-        response = llm.with_structured_output(
-            Response,
-            method=STRUCTURED_OUTPUT_METHOD,
-        ).invoke(prompt)
+        response = response_llm.invoke(prompt)
         return {"responses": [{"role": state["role"], "content": response.response}]}
 
-    # [REDUCE] 最佳回复节点：返回最佳回复
-    def best_response(state: Overall):
-        responses = "\n\n".join(
-            f"{index}. 【{item['role']}】{item['content']}"
-            for index, item in enumerate(state["responses"])
-        )
-        prompt = best_response_prompt.format(responses=responses, situation=state["situation"])
-        response = llm.with_structured_output(
-            BestResponse,
-            method=STRUCTURED_OUTPUT_METHOD,
-        ).invoke(prompt)
-        best_record = _select_best_response_record(state["responses"], response)
-        return {"best_response": best_record["content"], "best_role": best_record["role"]}
+    async def agenerate_response(state: Role):
+        prompt = role_play_prompt.format(role=state["role"], situation=state["situation"])
+        response = await response_llm.ainvoke(prompt)
+        return {"responses": [{"role": state["role"], "content": response.response}]}
 
     doge_builder = StateGraph(Overall, output_schema=DogeOutput)
 
     # 添加节点
-    doge_builder.add_node("generate_response", generate_response)
-    doge_builder.add_node("best_response", best_response)
+    doge_builder.add_node(
+        "generate_response",
+        RunnableLambda(generate_response, afunc=agenerate_response, name="generate_response"),
+        input_schema=Role,
+    )
+    doge_builder.add_node("best_response", _best_response_node(llm))
 
     # 添加边
     doge_builder.add_conditional_edges(START, continue_to_responses, ["generate_response"])
@@ -116,14 +156,201 @@ def create_doge_graph(llm):
     return doge_graph
 
 
+# 创建批量生成的 Doge 工作流：一次调用生成所有回复，fuse_judging 时在同一次调用中评选
+def create_batch_doge_graph(llm, fuse_judging: bool = False):
+    schema = FusedResponses if fuse_judging else BatchResponses
+    template = fused_role_play_prompt if fuse_judging else batch_role_play_prompt
+    responses_llm = llm.with_structured_output(schema, method=STRUCTURED_OUTPUT_METHOD)
+
+    def _update(state: Overall, output: BatchResponses) -> dict:
+        responses = _align_batch_responses(state["roles"], output)
+        update: Dict[str, Any] = {"responses": responses}
+        if fuse_judging:
+            best_record = _select_best_response_record(responses, BestResponse(id=output.best_id))
+            update.update(best_response=best_record["content"], best_role=best_record["role"])
+        return update
+
+    # 批量回复节点：一次生成所有角色的回复
+    def generate_responses(state: Overall):
+        prompt = template.format(roles="、".join(state["roles"]), situation=state["situation"])
+        return _update(state, responses_llm.invoke(prompt))
+
+    async def agenerate_responses(state: Overall):
+        prompt = template.format(roles="、".join(state["roles"]), situation=state["situation"])
+        return _update(state, await responses_llm.ainvoke(prompt))
+
+    doge_builder = StateGraph(Overall, output_schema=DogeOutput)
+
+    # 添加节点
+    doge_builder.add_node(
+        "generate_responses",
+        RunnableLambda(generate_responses, afunc=agenerate_responses, name="generate_responses"),
+    )
+    doge_builder.add_edge(START, "generate_responses")
+    if fuse_judging:
+        doge_builder.add_edge("generate_responses", END)
+    else:
+        doge_builder.add_node("best_response", _best_response_node(llm))
+        doge_builder.add_edge("generate_responses", "best_response")
+        doge_builder.add_edge("best_response", END)
+
+    # 编译图
+    return doge_builder.compile(
+        name="best-response-fused" if fuse_judging else "best-response-batch"
+    )
+
+
+def create_role_play_graph(llm, mode: str = "fanout"):
+    """按执行模式创建 Doge 工作流"""
+    if mode == "fanout":
+        return create_doge_graph(llm)
+    if mode in ("batch", "fused"):
+        return create_batch_doge_graph(llm, fuse_judging=mode == "fused")
+    raise ValueError(f"未知的 role_play 模式: {mode}，可选 {', '.join(ROLE_PLAY_MODES)}")
+
+
+# [REDUCE] 最佳回复节点：返回最佳回复
+def _best_response_node(llm) -> RunnableLambda:
+    best_response_llm = llm.with_structured_output(BestResponse, method=STRUCTURED_OUTPUT_METHOD)
+
+    def best_response(state: Overall):
+        prompt = _best_response_prompt(state)
+        response = best_response_llm.invoke(prompt)
+        best_record = _select_best_response_record(state["responses"], response)
+        return {"best_response": best_record["content"], "best_role": best_record["role"]}
+
+    async def abest_response(state: Overall):
+        prompt = _best_response_prompt(state)
+        response = await best_response_llm.ainvoke(prompt)
+        best_record = _select_best_response_record(state["responses"], response)
+        return {"best_response": best_record["content"], "best_role": best_record["role"]}
+
+    return RunnableLambda(best_response, afunc=abest_response, name="best_response")
+
+
+def _align_batch_responses(roles: list[str], output: BatchResponses) -> list[dict]:
+    # 模型可能改写人设名称，按顺序对应到请求的人设
+    if len(output.responses) != len(roles):
+        raise ValueError(f"批量生成的回复数 {len(output.responses)} 与人设数 {len(roles)} 不一致")
+    return [{"role": role, "content": item.response} for role, item in zip(roles, output.responses)]
+
+
+def _best_response_prompt(state: Overall) -> str:
+    responses = "\n\n".join(
+        f"{index}. 【{item['role']}】{item['content']}"
+        for index, item in enumerate(state["responses"])
+    )
+    return best_response_prompt.format(responses=responses, situation=state["situation"])
+
+
 def _select_best_response_record(responses: list[dict], best_response: BestResponse) -> dict:
     if not 0 <= best_response.id < len(responses):
         raise ValueError(f"无效的最佳回复 ID: {best_response.id}")
     return responses[best_response.id]
 
 
+@dataclass
+class RolePlayConfig:
+    """role_play 工具配置"""
+
+    # 同时生成回复的角色数上限（Send 分发的 generate_response 分支并发数）
+    max_concurrency: int = 4
+    # 最多缓存的 (base_url, model, api_key, 模式) 组合数
+    max_graphs: int = 16
+    # 调用时未指定模式时使用的执行模式，见 ROLE_PLAY_MODES
+    mode: str = "fanout"
+
+
+class RolePlayEngine:
+    """按 (base_url, model, api_key, 模式) 缓存模型与编译好的 Doge 工作流，线程安全"""
+
+    def __init__(self, config: Optional[RolePlayConfig] = None) -> None:
+        self.config = config or RolePlayConfig()
+        # key -> (构建时使用的 HTTP 客户端, 编译好的工作流)
+        self._graphs: OrderedDict[Tuple[str, str, str, str], Tuple[Dict[str, Any], Any]] = (
+            OrderedDict()
+        )
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def configure(self, config: RolePlayConfig) -> None:
+        """更新配置，并发上限对之后的调用生效"""
+        self.config = config
+
+    def get_graph(self, base_url: str, model: str, api_key: str, mode: str = "fanout") -> Any:
+        """取出缓存的工作流，不存在时创建模型并编译"""
+        if mode not in ROLE_PLAY_MODES:
+            raise ValueError(f"未知的 role_play 模式: {mode}，可选 {', '.join(ROLE_PLAY_MODES)}")
+        key = (base_url, model, api_key, mode)
+        clients = http_pool.client_kwargs(base_url)
+        with self._lock:
+            entry = self._graphs.get(key)
+            # 连接池的客户端被替换（如挂载了回放 transport）后，旧模型不再复用
+            if entry is not None and entry[0] == clients:
+                self._graphs.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        llm = init_chat_model(
+            model=model,
+            model_provider="openai",
+            base_url=base_url,
+            api_key=api_key,
+            **clients,
+        )
+        graph = create_role_play_graph(llm, mode)
+        with self._lock:
+            self._graphs[key] = (clients, graph)
+            self._graphs.move_to_end(key)
+            while len(self._graphs) > self.config.max_graphs:
+                self._graphs.popitem(last=False)
+        return graph
+
+    async def ainvoke(
+        self,
+        base_url: str,
+        model: str,
+        api_key: str,
+        roles: list[str],
+        situation: str,
+        mode: Optional[str] = None,
+        on_response: Optional[Callable[[dict], None]] = None,
+    ) -> DogeOutput:
+        """
+        异步运行 Doge 工作流，fanout 模式下各角色的回复按 max_concurrency 并发生成。
+
+        传入 on_response 时，每生成一条回复（{"role", "content"}）就按完成顺序回调一次。
+        """
+        graph = self.get_graph(base_url, model, api_key, mode or self.config.mode)
+        inputs = {"roles": roles, "situation": situation}
+        config = {"max_concurrency": self.config.max_concurrency}
+        if on_response is None:
+            return await graph.ainvoke(inputs, config)
+
+        # updates 按节点完成顺序到达；最终结果取最后一次 values，回复仍按人设顺序排列
+        result: Any = None
+        async for kind, payload in graph.astream(inputs, config, stream_mode=["updates", "values"]):
+            if kind == "values":
+                result = payload
+                continue
+            for update in payload.values():
+                for record in (update or {}).get("responses", []):
+                    on_response(record)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"graphs": len(self._graphs), "hits": self._hits, "misses": self._misses}
+
+
+# 进程级默认引擎
+role_play_engine = RolePlayEngine()
+
+
 @tool
-def role_play(
+async def role_play(
     runtime: ToolRuntime[ToolSchema],
     situation: str = "告诉你她今天要加班",
     roles: list[str] = [
@@ -138,6 +365,7 @@ def role_play(
         "文艺长发男",
         "萌萌二次元",
     ],
+    mode: Optional[Literal["fanout", "batch", "fused"]] = None,
 ):
     """在指定情境下，模拟多个人设与女神对话的场景
 
@@ -150,6 +378,8 @@ def role_play(
     Args:
         situation: 设定的情境描述，默认为 "告诉你她今天要加班"
         roles: 参与角色扮演的人设列表，默认为一组预设的经典角色
+        mode: 执行模式，fanout 为每个人设单独生成回复，batch 为一次生成所有回复后再评选，
+            fused 为一次同时生成回复并评选；默认使用应用配置的模式，通常无需指定
 
     Returns:
         str: 包含所有角色回复及最佳回复评选结果的格式化文本
@@ -159,18 +389,32 @@ def role_play(
     if len(roles) > MAX_ROLES:
         raise ValueError(f"roles 最多支持 {MAX_ROLES} 个")
 
-    base_url = runtime.context.base_url
-    api_key = runtime.context.api_key
     model_name = runtime.context.model
+    stream_writer = getattr(runtime, "stream_writer", None)
+    finished = 0
+
+    # 每个角色的回复生成后立即推送到界面，不必等待所有角色与评选完成
+    def on_response(record: dict) -> None:
+        nonlocal finished
+        finished += 1
+        stream_writer(
+            {
+                "tool_call_id": getattr(runtime, "tool_call_id", None),
+                "name": "role_play",
+                "title": f"{finished}/{len(roles)}【{record['role']}】",
+                "content": record["content"],
+            }
+        )
 
-    llm = init_chat_model(
-        model=model_name,
-        model_provider="openai",
-        base_url=base_url,
-        api_key=api_key,
+    response = await role_play_engine.ainvoke(
+        runtime.context.base_url,
+        model_name,
+        runtime.context.api_key,
+        roles,
+        situation,
+        mode,
+        on_response=on_response if stream_writer is not None else None,
     )
-    doge_graph = create_doge_graph(llm)
-    response = doge_graph.invoke({"roles": roles, "situation": situation})
 
     return "\n".join(
         [f"{len(roles)} 种人设的回复："]
@@ -9,3 +9,5 @@ class ToolSchema(BaseModel):
     base_url: str
     api_key: str
     model: str
+    # 发起调用的 Gradio 会话，用于按会话统计指标
+    session_id: str = ""
@@ -1,44 +1,46 @@
 """
 科学计算工具
+
+表达式的校验、编译缓存与开销上限由 arith 引擎实现（与 math MCP 服务、skill 示例共用），
+SafeEvaluator 在其上提供 evaluate / evaluate_many，以及在 NumPy 数组上向量化计算的 evaluate_vectorized。
+逐节点解释执行的 interpret 保留作对照，性能对比见 bench/bench_calculator.py。
 """
 
 import ast
-import math
-import operator
+import copy
+from typing import Any, Iterable, List, Tuple
 
 from langchain.tools import tool
 
+import arith
+from arith import CompiledExpression, CostGuard, EvalLimits
+from utils.tool_cache import cacheable
+
 
 class SafeEvaluator(ast.NodeVisitor):
-    # 支持的二元运算
-    BIN_OPS = {
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.Pow: operator.pow,
-        ast.Mod: operator.mod,
-        ast.FloorDiv: operator.floordiv,
+    # 支持的运算与函数（与 arith 引擎一致）
+    BIN_OPS = arith.BIN_OPS
+    UNARY_OPS = arith.UNARY_OPS
+    SAFE_FUNCS = arith.FUNCTIONS
+
+    # 向量化计算时使用的 NumPy 函数名（与 SAFE_FUNCS 一一对应）
+    NUMPY_FUNCS = {
+        "sqrt": "sqrt",
+        "exp": "exp",
+        "log": "log",
+        "log2": "log2",
+        "log10": "log10",
+        "sin": "sin",
+        "cos": "cos",
+        "tan": "tan",
+        "abs": "abs",
     }
 
-    # 支持的一元运算
-    UNARY_OPS = {
-        ast.UAdd: operator.pos,
-        ast.USub: operator.neg,
-    }
+    # interpret 时当次计算的开销预算
+    _guard: CostGuard
 
-    # 支持的函数
-    SAFE_FUNCS = {
-        "sqrt": math.sqrt,
-        "exp": math.exp,
-        "log": math.log,
-        "log2": math.log2,
-        "log10": math.log10,
-        "sin": math.sin,
-        "cos": math.cos,
-        "tan": math.tan,
-        "abs": abs,
-    }
+    def __init__(self, limits: EvalLimits | None = None) -> None:
+        self.limits = limits or arith.DEFAULT_LIMITS
 
     def visit(self, node):
         return super().visit(node)
@@ -55,8 +57,13 @@ class SafeEvaluator(ast.NodeVisitor):
         op_type = type(node.op)
         if op_type not in self.BIN_OPS:
             raise ValueError(f"不支持的二元运算符: {op_type}")
+        self._guard.count()
         left = self.visit(node.left)
         right = self.visit(node.right)
+        if op_type is ast.Pow:
+            return self._guard.pow(left, right)
+        if op_type is ast.Mult:
+            return self._guard.mul(left, right)
         return self.BIN_OPS[op_type](left, right)
 
     def visit_UnaryOp(self, node):
@@ -64,6 +71,7 @@ class SafeEvaluator(ast.NodeVisitor):
         op_type = type(node.op)
         if op_type not in self.UNARY_OPS:
             raise ValueError(f"不支持的一元运算符: {op_type}")
+        self._guard.count()
         operand = self.visit(node.operand)
         return self.UNARY_OPS[op_type](operand)
 
@@ -79,6 +87,7 @@ class SafeEvaluator(ast.NodeVisitor):
         if len(node.args) != 1:
             raise ValueError(f"{func_name} 函数需要且仅需要一个参数")
 
+        self._guard.count()
         arg = self.visit(node.args[0])
         return self.SAFE_FUNCS[func_name](arg)
 
@@ -91,14 +100,16 @@ class SafeEvaluator(ast.NodeVisitor):
         # 一切未列入白名单的节点，直接拒绝
         raise ValueError(f"不支持的语法: {type(node).__name__}")
 
-    def evaluate(self, expression: str) -> float | int:
-        # 安全计算数学表达式
-        if not expression.strip():
-            raise ValueError("表达式不能为空")
+    def interpret(self, expression: str) -> float | int:
+        # 逐节点解释执行（不使用编译缓存）
+        arith.check_length(expression, self.limits)
 
+        # 开销预算按次计算，在副本上执行，共享的计算器仍可并发使用
+        visitor = copy.copy(self)
+        visitor._guard = CostGuard(self.limits)
         try:
             tree = ast.parse(expression, mode="eval")
-            result = self.visit(tree)
+            result = visitor.visit(tree)
 
             if isinstance(result, (int, float)):
                 return result
@@ -106,12 +117,67 @@ class SafeEvaluator(ast.NodeVisitor):
                 raise ValueError(f"计算结果类型错误: {type(result)}")
         except ZeroDivisionError:
             raise ValueError("除零错误")
+        except OverflowError:
+            raise ValueError("数值溢出")
         except ValueError:
             raise
         except Exception as e:
             raise ValueError(f"无效的数学表达式: {str(e)}")
 
+    # ── 编译执行（arith 引擎） ──────────────────────────────────────────────────
+
+    def compile(self, expression: str, variables: Tuple[str, ...] = ()) -> CompiledExpression:
+        """校验并编译表达式，结果按 (表达式, 变量名, 开销上限) 缓存"""
+        return arith.compile_expression(expression, variables, self.limits)
 
+    def evaluate(self, expression: str) -> float | int:
+        # 安全计算数学表达式
+        return arith.evaluate(expression, self.limits)
+
+    def evaluate_many(
+        self, expressions: Iterable[str], return_exceptions: bool = False
+    ) -> List[Any]:
+        """
+        批量计算多个表达式，按输入顺序返回结果。
+
+        return_exceptions 为 True 时，出错的表达式在结果中对应 ValueError 实例，其余照常计算；
+        否则遇到第一个错误即抛出。
+        """
+        return arith.evaluate_many(expressions, self.limits, return_exceptions)
+
+    def evaluate_vectorized(self, expression: str, **inputs: Any) -> Any:
+        """
+        在 NumPy 数组上向量化计算带变量的表达式，例如：
+
+            evaluator.evaluate_vectorized("sqrt(x ** 2 + y ** 2)", x=xs, y=ys)
+
+        inputs 为变量名到数组（或标量）的映射，按 NumPy 广播规则计算，返回 ndarray。
+        函数换成对应的 NumPy 函数；除零与定义域错误按 NumPy 的规则得到 inf / nan，不会抛出异常。
+        整数输入按 float64 计算：int64 溢出时会静默回绕，与逐个计算的结果不一致。
+        """
+        import numpy as np
+
+        compiled = self.compile(expression, tuple(sorted(inputs)))
+        arrays = []
+        for name in compiled.variables:
+            array = np.asarray(inputs[name])
+            if array.dtype.kind in "biu":
+                array = array.astype(np.float64)
+            elif array.dtype.kind not in "fc":
+                # object 数组（如超出 int64 的整数）的运算不受开销上限约束，直接拒绝
+                raise ValueError(f"变量 {name} 必须是数值，不支持 {array.dtype}")
+            arrays.append(array)
+        namespace = {name: getattr(np, func) for name, func in self.NUMPY_FUNCS.items()}
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            result = arith.run(compiled, tuple(arrays), namespace, self.limits)
+        return np.asarray(result)
+
+
+# 进程内共享的计算器（无状态，可并发使用）
+_evaluator = SafeEvaluator()
+
+
+@cacheable()
 @tool()
 def calculator(expression: str) -> str:
     """
@@ -123,6 +189,5 @@ def calculator(expression: str) -> str:
     注意: 上叙函数仅支持单参数。像 log(9, 3) 这样的，不行
     例子: 计算 (sqrt(9) + 1) ** 2
     """
-    evaluator = SafeEvaluator()
-    result = evaluator.evaluate(expression)
+    result = _evaluator.evaluate(expression)
     return str(result)
@@ -2,23 +2,54 @@
 联网搜索工具
 """
 
-import dashscope
+import hashlib
+import unicodedata
+from typing import Any, Dict, Optional
 
-from dashscope import Generation
 from langchain.tools import tool, ToolRuntime
 from tools.tool_runtime import ToolSchema
+from utils.tool_cache import cacheable
 
 
+def normalize_query(query: str) -> str:
+    """规范化搜索词：全角转半角、合并空白、忽略大小写，等价的搜索共用缓存"""
+    return " ".join(unicodedata.normalize("NFKC", query).split()).casefold()
+
+
+def _search_cache_key(args: Dict[str, Any]) -> Dict[str, str]:
+    return {"query": normalize_query(str(args.get("query", "")))}
+
+
+def api_key_fingerprint(context: Optional[ToolSchema]) -> str:
+    """调用方 api_key 的摘要：搜索按 api_key 鉴权与计费，缓存按它隔离，缓存键中不保存 key 本身"""
+    api_key = getattr(context, "api_key", "") or ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+# 搜索结果随时间变化，只在短时间内复用；失败的结果不缓存；并发的相同搜索只请求一次；
+# 不同 api_key 的调用互不共用结果
+@cacheable(
+    ttl=300,
+    cache_if=lambda content: not content.startswith("Search failed"),
+    key=_search_cache_key,
+    context_key=api_key_fingerprint,
+)
 @tool
-def dashscope_search(
+async def dashscope_search(
     query: str,
     runtime: ToolRuntime[ToolSchema],
 ) -> str:
     """使用 DashScope 提供的搜索 API 搜索互联网信息"""
-    dashscope.api_key = runtime.context.api_key
+    # dashscope 导入较慢，首次搜索时才加载
+    from dashscope import AioGeneration
 
-    response = Generation.call(
-        model="qwen-max", prompt=query, enable_search=True, result_format="message"
+    # api_key 随请求传入，不修改进程级的 dashscope.api_key，并发会话之间互不影响
+    response = await AioGeneration.call(
+        model="qwen-max",
+        prompt=query,
+        enable_search=True,
+        result_format="message",
+        api_key=runtime.context.api_key,
     )
 
     if response.status_code == 200:
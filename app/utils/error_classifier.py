@@ -0,0 +1,270 @@
+"""
+错误分类与摘要
+
+对话出错时，原先每次都把几 KB 的 traceback 发给 LLM 做摘要。provider 故障期间这会让
+失败的 provider 承受双倍请求，错误路径也要多等几秒。这里先在本地识别常见错误：
+- 超时、鉴权失败、限流、网络连接失败、MCP 连接断开、工具参数校验失败
+- 优先按异常类型与 HTTP 状态码识别，都不匹配时才按错误消息中的整词识别
+
+本地分类每次按当前异常进行（开销很小，且依赖状态码与消息）；本地无法识别的错误才调用 LLM，
+LLM 摘要按 traceback 指纹（异常类型链 + HTTP 状态码 + 调用栈的文件与函数名）缓存，
+同一位置的同类错误只摘要一次，且 LLM 调用次数受滑动窗口限速。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import time
+import traceback
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+
+from utils.metrics import MetricsRegistry, registry
+
+
+@dataclass(frozen=True)
+class ErrorKind:
+    """一类可在本地识别的错误"""
+
+    name: str
+    label: str
+    hint: str
+
+
+TIMEOUT = ErrorKind("timeout", "请求超时", "模型或工具响应超时，请稍后重试。")
+AUTH = ErrorKind("auth", "鉴权失败", "API Key 无效或没有权限，请检查 .env 中的配置。")
+RATE_LIMIT = ErrorKind("rate_limit", "触发限流", "模型服务的请求频率或额度已达上限，请稍后再试。")
+NETWORK = ErrorKind("network", "网络连接失败", "无法连接模型服务，请检查网络或 base_url 配置。")
+MCP_DISCONNECT = ErrorKind(
+    "mcp_disconnect", "MCP 连接断开", "MCP 服务连接已断开，下次调用时会自动重连。"
+)
+TOOL_VALIDATION = ErrorKind(
+    "tool_validation", "工具参数错误", "模型生成的工具参数未通过校验，可以换个说法重试。"
+)
+
+
+def _exception_chain(err: BaseException) -> Iterator[BaseException]:
+    """依次遍历异常本身、其 cause / context 以及 ExceptionGroup 中的子异常"""
+    pending: List[BaseException] = [err]
+    seen = set()
+    while pending:
+        exc = pending.pop(0)
+        if id(exc) in seen:
+            continue
+        seen.add(id(exc))
+        yield exc
+        pending.extend(getattr(exc, "exceptions", ()))
+        pending.extend(e for e in (exc.__cause__, exc.__context__) if e is not None)
+
+
+def _type_names(exc: BaseException) -> set:
+    # 按类名匹配，无需导入 openai / httpx / anyio 等可选依赖
+    return {cls.__name__ for cls in type(exc).__mro__}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+# 属于 MCP 层的模块：内置的 ConnectionError 只有在这些模块中抛出时才算 MCP 连接断开
+_MCP_MODULES = ("mcp", "langchain_mcp_adapters", "utils.mcp_pool")
+
+
+def _raised_in(exc: BaseException, modules: Tuple[str, ...]) -> bool:
+    """异常的调用栈是否经过 modules 中的模块（含子模块）"""
+    tb = exc.__traceback__
+    while tb is not None:
+        name = tb.tb_frame.f_globals.get("__name__", "")
+        if any(name == module or name.startswith(module + ".") for module in modules):
+            return True
+        tb = tb.tb_next
+    return False
+
+
+@dataclass(frozen=True)
+class _Rule:
+    """
+    一条分类规则
+
+    names 按异常类名（含基类）匹配，statuses 按 HTTP 状态码匹配；raised_in 非空时，
+    类名与状态码只在调用栈经过这些模块时才算匹配。keywords 按整词匹配错误消息。
+    """
+
+    kind: ErrorKind
+    names: Tuple[str, ...] = ()
+    statuses: Tuple[int, ...] = ()
+    keywords: Tuple[str, ...] = ()
+    raised_in: Tuple[str, ...] = ()
+
+    def match_type(self, exc: BaseException) -> bool:
+        if not (_type_names(exc) & set(self.names) or _status_code(exc) in self.statuses):
+            return False
+        return not self.raised_in or _raised_in(exc, self.raised_in)
+
+    def match_message(self, exc: BaseException) -> bool:
+        if not self.keywords:
+            return False
+        pattern = r"\b(?:" + "|".join(re.escape(k) for k in self.keywords) + r")\b"
+        return re.search(pattern, str(exc).lower()) is not None
+
+
+# 先按类型与状态码匹配所有规则，都不匹配时再按消息关键词匹配；同一轮中先匹配到的优先
+_RULES: List[_Rule] = [
+    _Rule(
+        AUTH,
+        names=("AuthenticationError", "PermissionDeniedError"),
+        statuses=(401, 403),
+        keywords=("invalid api key", "invalidapikey", "incorrect api key", "unauthorized"),
+    ),
+    _Rule(
+        RATE_LIMIT,
+        names=("RateLimitError",),
+        statuses=(429,),
+        keywords=("rate limit", "ratelimit", "throttled", "throttling", "too many requests"),
+    ),
+    _Rule(
+        TIMEOUT,
+        names=("TimeoutError", "TimeoutException", "APITimeoutError"),
+        keywords=("timed out",),
+    ),
+    _Rule(
+        TOOL_VALIDATION,
+        names=("ValidationError", "ToolInvocationError"),
+        keywords=("validation error",),
+    ),
+    _Rule(
+        MCP_DISCONNECT,
+        names=("ClosedResourceError", "BrokenResourceError", "EndOfStream"),
+        keywords=("connection closed",),
+    ),
+    # 内置的 ConnectionError（连接重置、管道断开等）在 MCP 层抛出时才是 MCP 连接断开，
+    # 其余（如 httpx 请求模型服务时连接被重置）归为网络连接失败
+    _Rule(MCP_DISCONNECT, names=("ConnectionError",), raised_in=_MCP_MODULES),
+    _Rule(
+        NETWORK,
+        names=("APIConnectionError", "ConnectError", "ConnectionError"),
+        keywords=("connection error", "name or service not known"),
+    ),
+]
+
+
+def classify_error(err: BaseException) -> Optional[ErrorKind]:
+    """识别常见错误类型，无法识别时返回 None"""
+    chain = list(_exception_chain(err))
+    for rule in _RULES:
+        if any(rule.match_type(exc) for exc in chain):
+            return rule.kind
+    for rule in _RULES:
+        if any(rule.match_message(exc) for exc in chain):
+            return rule.kind
+    return None
+
+
+def error_fingerprint(err: BaseException) -> str:
+    """
+    traceback 指纹
+
+    只取异常类型链、HTTP 状态码与调用栈中的文件名、函数名，不含行号与错误消息，
+    同一位置、同一原因的错误（即使消息中的 ID、时间不同）得到相同指纹；
+    同一位置不同状态码的错误（如 429 与 401）指纹不同。
+    """
+    parts = []
+    for exc in _exception_chain(err):
+        parts.append(f"{type(exc).__module__}.{type(exc).__qualname__}")
+        status = _status_code(exc)
+        if status is not None:
+            parts.append(f"status={status}")
+        for frame in traceback.extract_tb(exc.__traceback__):
+            parts.append(f"{os.path.basename(frame.filename)}:{frame.name}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ErrorSummarizer:
+    """
+    错误摘要
+
+    优先级：本地分类 > 指纹缓存 > LLM 摘要（限速）> 原始日志。
+    本地分类不走缓存，每次按当前异常判断类型并渲染错误消息；只有 LLM 摘要按指纹缓存。
+    原始日志不进入缓存，限速窗口过后同一指纹仍有机会得到 LLM 摘要。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_llm_calls: int = 5,
+        llm_window: float = 60.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self._max_entries = max_entries
+        self._max_llm_calls = max_llm_calls
+        self._llm_window = llm_window
+        self._metrics = metrics or registry
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._llm_calls: Deque[float] = deque()
+
+    def _remember(self, fingerprint: str, summary: str) -> None:
+        self._cache[fingerprint] = summary
+        self._cache.move_to_end(fingerprint)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _render(kind: ErrorKind, err: BaseException, limit: int) -> str:
+        summary = f"\n ⚠️ 发生错误（{kind.label}）：{kind.hint}"
+        message = str(err).strip()
+        if message:
+            summary += f"\n{type(err).__name__}: {message.splitlines()[0][:limit]}"
+        return summary
+
+    def _acquire_llm_slot(self) -> bool:
+        now = time.monotonic()
+        while self._llm_calls and now - self._llm_calls[0] > self._llm_window:
+            self._llm_calls.popleft()
+        if len(self._llm_calls) >= self._max_llm_calls:
+            return False
+        self._llm_calls.append(now)
+        return True
+
+    async def summarize(self, llm: Any, err: BaseException, limit: int = 500) -> str:
+        # 本地分类依赖状态码与消息，必须按当前异常判断，不能按指纹复用
+        kind = classify_error(err)
+        if kind is not None:
+            self._metrics.increment("error_summaries_total", source="local", kind=kind.name)
+            return self._render(kind, err, limit)
+
+        fingerprint = error_fingerprint(err)
+        cached = self._cache.get(fingerprint)
+        if cached is not None:
+            self._cache.move_to_end(fingerprint)
+            self._metrics.increment("error_summaries_total", source="cache")
+            return cached
+
+        full_trace = "".join(traceback.format_exception(type(err), err, err.__traceback__))
+        full_trace = full_trace[-5000:]  # 避免过长
+
+        if llm is not None and self._acquire_llm_slot():
+            try:
+                abstract = await llm.ainvoke(
+                    "\n".join(
+                        [
+                            full_trace,
+                            "---",
+                            "以上是 LangChain Agent 的报错信息，请简述报错原因：",
+                        ]
+                    )
+                )
+                content = getattr(abstract, "content", abstract)
+                summary = f"\n ⚠️ 发生错误，以下是摘要信息：\n{content}"
+                self._metrics.increment("error_summaries_total", source="llm")
+                self._remember(fingerprint, summary)
+                return summary
+            except Exception:
+                pass
+        self._metrics.increment("error_summaries_total", source="raw")
+        return f"\n ⚠️ 发生错误，以下是原始日志：\n{full_trace[:limit]}"
@@ -0,0 +1,146 @@
+"""
+进程级共享的 HTTP 连接池
+
+ChatOpenAI 与 init_chat_model 默认各自创建 HTTP 客户端，role_play 每次调用还会新建模型，
+每次请求都要重新握手 TCP 与 TLS。这里按 base_url 维护一对长连接客户端（同步 + 异步），
+注入到应用创建的所有模型客户端中，同一服务端点的请求复用 keep-alive 连接。
+
+mount 可以为某个 base_url 挂载自定义 transport（例如回放录制的响应，见 utils/replay.py）。
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+@dataclass
+class HTTPPoolConfig:
+    """HTTP 连接池配置"""
+
+    # 每个 base_url 的最大连接数
+    max_connections: int = 100
+    # 每个 base_url 保持的空闲 keep-alive 连接数
+    max_keepalive_connections: int = 20
+    # 空闲连接的保持秒数
+    keepalive_expiry: float = 30.0
+    # 建立连接的超时秒数（读写超时由模型客户端的 timeout 参数控制）
+    connect_timeout: float = 10.0
+
+
+class HTTPClientPool:
+    """按 base_url 缓存 httpx 客户端，线程安全"""
+
+    def __init__(self, config: Optional[HTTPPoolConfig] = None) -> None:
+        self.config = config or HTTPPoolConfig()
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+        self._transports: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config: HTTPPoolConfig) -> None:
+        """更新配置，只影响之后新建的客户端"""
+        self.config = config
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_keepalive_connections,
+            keepalive_expiry=self.config.keepalive_expiry,
+        )
+
+    def mount(
+        self,
+        base_url: Optional[str],
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        """为 base_url 挂载自定义 transport，已创建的该地址客户端会被替换"""
+        key = self._key(base_url)
+        with self._lock:
+            self._transports[key] = {"sync": transport, "async": async_transport}
+            self._sync.pop(key, None)
+            self._async.pop(key, None)
+
+    def _client_options(self, key: str, is_async: bool) -> Dict[str, Any]:
+        def count(_: httpx.Request) -> None:
+            with self._lock:
+                self._requests[key] = self._requests.get(key, 0) + 1
+
+        async def acount(request: httpx.Request) -> None:
+            count(request)
+
+        options: Dict[str, Any] = {
+            "limits": self.limits(),
+            "timeout": httpx.Timeout(None, connect=self.config.connect_timeout),
+            "follow_redirects": True,
+            "event_hooks": {"request": [acount if is_async else count]},
+        }
+        transport = self._transports.get(key, {}).get("async" if is_async else "sync")
+        if transport is not None:
+            options["transport"] = transport
+        return options
+
+    @staticmethod
+    def _key(base_url: Optional[str]) -> str:
+        return (base_url or "default").rstrip("/")
+
+    def sync_client(self, base_url: Optional[str]) -> httpx.Client:
+        key = self._key(base_url)
+        with self._lock:
+            if key not in self._sync:
+                self._sync[key] = httpx.Client(**self._client_options(key, is_async=False))
+            return self._sync[key]
+
+    def async_client(self, base_url: Optional[str]) -> httpx.AsyncClient:
+        key = self._key(base_url)
+        with self._lock:
+            if key not in self._async:
+                self._async[key] = httpx.AsyncClient(**self._client_options(key, is_async=True))
+            return self._async[key]
+
+    def client_kwargs(self, base_url: Optional[str]) -> Dict[str, Any]:
+        """ChatOpenAI / init_chat_model 的 http_client 与 http_async_client 参数"""
+        return {
+            "http_client": self.sync_client(base_url),
+            "http_async_client": self.async_client(base_url),
+        }
+
+    @staticmethod
+    def _connections(client: Any) -> Dict[str, int]:
+        # httpx 未公开连接池状态，读取底层 httpcore 连接池，取不到时返回 0
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"open": len(connections), "idle": idle}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各 base_url 的请求数与连接数"""
+        with self._lock:
+            keys = sorted(self._sync.keys() | self._async.keys())
+            return {
+                key: {
+                    "requests": self._requests.get(key, 0),
+                    "sync": self._connections(self._sync.get(key)),
+                    "async": self._connections(self._async.get(key)),
+                }
+                for key in keys
+            }
+
+    async def aclose(self) -> None:
+        """关闭所有客户端（进程退出时调用）"""
+        with self._lock:
+            sync_clients, self._sync = list(self._sync.values()), {}
+            async_clients, self._async = list(self._async.values()), {}
+        for client in sync_clients:
+            client.close()
+        for client in async_clients:
+            await client.aclose()
+
+
+# 进程级默认连接池
+http_pool = HTTPClientPool()
@@ -0,0 +1,268 @@
+"""
+多 provider 对冲请求与故障转移
+
+单个 provider 变慢时，整个应用的尾延迟都会被拖长。HedgedChatModel 把多个 provider 的模型
+包装成一个模型：
+- 请求先发给首选 provider；等待首个输出超过该 provider 首字延迟 p95 推算出的阈值后，
+  再向下一个 provider 发出对冲请求，先产生输出的一方胜出，另一方被取消
+- provider 在产生输出前报错时立即切换到下一个 provider
+- 连续失败达到阈值的 provider 被暂时移出轮换，冷却期过后自动恢复
+- 同步调用（invoke）不做对冲，按顺序依次尝试 provider，报错即切换到下一个
+
+ProviderRouter 记录每个 provider 的健康状况与首字延迟，供选择顺序与 /metrics.json 使用。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from utils.metrics import Histogram, MetricsRegistry, registry
+
+
+@dataclass
+class HedgePolicy:
+    """对冲与摘除策略"""
+
+    # 样本不足时使用的对冲阈值（秒）
+    default_delay: float = 3.0
+    # 对冲阈值 = 首字延迟 p95 × multiplier，且不低于 min_delay
+    multiplier: float = 1.0
+    min_delay: float = 0.5
+    # 至少积累多少个首字延迟样本后才使用 p95
+    min_samples: int = 20
+    # 连续失败多少次后摘除
+    failure_threshold: int = 3
+    # 摘除的冷却秒数
+    cooldown: float = 30.0
+
+
+class _ProviderStats:
+    def __init__(self) -> None:
+        self.ttft = Histogram()
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+
+class ProviderRouter:
+    """记录各 provider 的首字延迟与健康状况，决定尝试顺序与对冲阈值"""
+
+    def __init__(
+        self,
+        providers: List[str],
+        policy: Optional[HedgePolicy] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.providers = list(providers)
+        self.policy = policy or HedgePolicy()
+        self._metrics = metrics or registry
+        self._stats = {name: _ProviderStats() for name in self.providers}
+
+    def order(self) -> List[str]:
+        """按优先级返回未被摘除的 provider；全部被摘除时返回全部，避免无可用 provider"""
+        now = time.monotonic()
+        healthy = [name for name in self.providers if self._stats[name].ejected_until <= now]
+        return healthy or list(self.providers)
+
+    def hedge_delay(self, provider: str) -> float:
+        """等待首个输出超过该秒数后发出对冲请求"""
+        ttft = self._stats[provider].ttft
+        if ttft.count < self.policy.min_samples:
+            return self.policy.default_delay
+        return max(self.policy.min_delay, ttft.quantile(0.95) * self.policy.multiplier)
+
+    def record_first_token(self, provider: str, seconds: float) -> None:
+        self._stats[provider].ttft.observe(seconds)
+        self._metrics.observe("provider_ttft_seconds", seconds, provider=provider)
+
+    def record_success(self, provider: str) -> None:
+        stats = self._stats[provider]
+        stats.successes += 1
+        stats.consecutive_failures = 0
+
+    def record_failure(self, provider: str) -> None:
+        stats = self._stats[provider]
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        self._metrics.increment("provider_failures_total", provider=provider)
+        if stats.consecutive_failures >= self.policy.failure_threshold:
+            stats.consecutive_failures = 0
+            stats.ejected_until = time.monotonic() + self.policy.cooldown
+            self._metrics.increment("provider_ejections_total", provider=provider)
+
+    def record_hedge(self, provider: str) -> None:
+        self._metrics.increment("provider_hedges_total", provider=provider)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            name: {
+                "healthy": stats.ejected_until <= now,
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "ttft_p50": stats.ttft.quantile(0.5),
+                "ttft_p95": stats.ttft.quantile(0.95),
+                "hedge_delay": self.hedge_delay(name),
+            }
+            for name, stats in self._stats.items()
+        }
+
+
+# 对冲任务发往主流程的消息类型
+_CHUNK, _ERROR, _DONE = "chunk", "error", "done"
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    按 ProviderRouter 的顺序对冲调用多个模型
+
+    models 与 router.providers 一一对应。bind_tools 会对每个模型分别绑定工具，
+    因此可以直接传给 create_agent。
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    models: Dict[str, Any]
+    router: ProviderRouter
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat-model"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> HedgedChatModel:
+        bound = {name: model.bind_tools(tools, **kwargs) for name, model in self.models.items()}
+        return self.model_copy(update={"models": bound})
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 同步调用不做对冲：按顺序依次尝试，报错即切换到下一个 provider，全部失败时抛出最后一个错误
+        error: Optional[Exception] = None
+        for provider in self.router.order():
+            try:
+                # 子模型不挂回调，token 只由本模型上报一次
+                message = self.models[provider].invoke(
+                    messages, config={"callbacks": []}, stop=stop, **kwargs
+                )
+            except Exception as exc:
+                self.router.record_failure(provider)
+                error = exc
+                continue
+            # 完整响应的耗时不是首字延迟，不计入对冲阈值的样本
+            self.router.record_success(provider)
+            message = message.model_copy(update={"id": None})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise error
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(
+            self._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        router = self.router
+        pending = router.order()
+        queue: asyncio.Queue[Tuple[str, str, Any]] = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def pump(provider: str) -> None:
+            started = time.perf_counter()
+            first = True
+            try:
+                # 子模型不挂回调，token 只由本模型上报一次
+                async for chunk in self.models[provider].astream(
+                    messages, config={"callbacks": []}, stop=stop, **kwargs
+                ):
+                    if first:
+                        first = False
+                        router.record_first_token(provider, time.perf_counter() - started)
+                    await queue.put((provider, _CHUNK, chunk))
+            except Exception as exc:
+                await queue.put((provider, _ERROR, exc))
+            else:
+                await queue.put((provider, _DONE, None))
+
+        def start_next(hedge: bool = False) -> Optional[float]:
+            """
+            启动下一个 provider，返回其对冲阈值；没有可用 provider 时返回 None。
+            hedge 为 True 时这是一次对冲请求，按实际发往的 provider 计数。
+            """
+            if not pending:
+                return None
+            provider = pending.pop(0)
+            if hedge:
+                router.record_hedge(provider)
+            tasks[provider] = asyncio.create_task(pump(provider))
+            return router.hedge_delay(provider)
+
+        winner: Optional[str] = None
+        delay = start_next()
+        try:
+            while True:
+                timeout = delay if winner is None and pending else None
+                try:
+                    provider, kind, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # 首个输出迟迟未到，发出对冲请求
+                    delay = start_next(hedge=True)
+                    continue
+
+                if winner is None:
+                    if kind == _ERROR:
+                        router.record_failure(provider)
+                        del tasks[provider]
+                        if not tasks:
+                            # 没有其他请求在进行，立即切换到下一个 provider
+                            delay = start_next()
+                            if delay is None:
+                                raise payload
+                        continue
+                    winner = provider
+                    for other, task in tasks.items():
+                        if other != winner:
+                            task.cancel()
+                elif provider != winner:
+                    continue
+
+                if kind == _CHUNK:
+                    message: AIMessageChunk = payload.model_copy(update={"id": None})
+                    chunk = ChatGenerationChunk(message=message)
+                    if run_manager is not None:
+                        await run_manager.on_llm_new_token(message.text, chunk=chunk)
+                    yield chunk
+                elif kind == _DONE:
+                    router.record_success(provider)
+                    return
+                else:
+                    router.record_failure(provider)
+                    raise payload
+        finally:
+            for task in tasks.values():
+                task.cancel()
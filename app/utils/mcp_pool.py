@@ -0,0 +1,223 @@
+"""
+MCP 会话池
+
+为每个已启用的 MCP 服务维护一个长连接会话，供所有聊天会话共享：
+- 工具调用复用已初始化的会话，避免每次调用都重新拉起 stdio 子进程、重新握手
+- 每个服务有独立的并发上限
+- 会话空闲超过一定时间后，下次使用前先 ping 一次做健康检查，失败则自动重连
+- 会话绑定在创建它的事件循环上，切换事件循环后会在新循环上重新建立
+- 请求发出前会话已断开时重连并重试一次；请求发出后失败（超时、连接中途断开）时不重试，
+  工具（如 execute_python）未必幂等，重试可能让一次调用执行两次
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import anyio
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+# 向会话写入请求时、写入之前抛出的异常：连接已关闭，请求没有发出，重连后重试是安全的
+_NOT_SENT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+
+class _PooledSession:
+    """
+    单个 MCP 服务的长连接会话
+
+    MCP 的 stdio / http 客户端基于 anyio 任务组实现，进入与退出必须发生在同一个任务中，
+    因此会话由一个专属的后台任务持有，关闭时通知该任务退出上下文。
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server_name: str) -> None:
+        self._client = client
+        self._server_name = server_name
+        self._ready: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.session: Optional[Any] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_used: float = 0.0
+
+    async def open(self, timeout: float) -> Any:
+        self.loop = asyncio.get_running_loop()
+        self._ready = self.loop.create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._hold(), name=f"mcp-session:{self._server_name}")
+        try:
+            self.session = await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except BaseException:
+            await self.close()
+            raise
+        self.last_used = self.loop.time()
+        return self.session
+
+    async def _hold(self) -> None:
+        try:
+            async with self._client.session(self._server_name) as session:
+                self._ready.set_result(session)
+                await self._closing.wait()
+        except Exception as exc:
+            if not self._ready.done():
+                self._ready.set_exception(exc)
+        finally:
+            self.session = None
+            if not self._ready.done():
+                self._ready.cancel()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        if self._closing is not None:
+            self._closing.set()
+        try:
+            await asyncio.wait_for(task, timeout=5)
+        except (asyncio.TimeoutError, asyncio.CancelledError, Exception):
+            task.cancel()
+        self.session = None
+
+
+class MCPSessionPool:
+    """
+    MCP 会话池
+
+    同时作为 langchain-mcp-adapters 的工具调用拦截器（tool interceptor）：
+    工具调用被拦截后，直接在池中的长连接会话上执行，不再走适配器默认的“每次新建会话”逻辑。
+    """
+
+    def __init__(
+        self,
+        connections: Dict[str, dict],
+        *,
+        max_concurrency: int = 4,
+        health_check_interval: float = 30.0,
+        connect_timeout: float = 30.0,
+    ) -> None:
+        self._connections = connections
+        self._client = MultiServerMCPClient(connections)
+        self._max_concurrency = max_concurrency
+        self._health_check_interval = health_check_interval
+        self._connect_timeout = connect_timeout
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def server_names(self) -> List[str]:
+        return list(self._connections)
+
+    # ── 会话管理 ──────────────────────────────────────────────────────────────
+
+    def _bind_loop(self) -> None:
+        """锁、信号量和会话都绑定在事件循环上，切换循环时整体重建"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # 旧循环已不可用，其上的会话随旧循环一起销毁，这里只丢弃引用
+        self._loop = loop
+        self._sessions = {}
+        self._locks = {name: asyncio.Lock() for name in self._connections}
+        self._semaphores = {
+            name: asyncio.Semaphore(self._max_concurrency) for name in self._connections
+        }
+
+    async def _is_healthy(self, pooled: _PooledSession) -> bool:
+        if not pooled.alive:
+            return False
+        if self._loop.time() - pooled.last_used < self._health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(pooled.session.send_ping(), timeout=5)
+        except Exception:
+            return False
+        pooled.last_used = self._loop.time()
+        return True
+
+    async def get_session(self, server_name: str) -> Any:
+        """获取服务的会话（不存在或不健康时重新建立）"""
+        self._bind_loop()
+        async with self._locks[server_name]:
+            pooled = self._sessions.get(server_name)
+            if pooled is not None and await self._is_healthy(pooled):
+                return pooled.session
+            if pooled is not None:
+                await pooled.close()
+            pooled = _PooledSession(self._client, server_name)
+            await pooled.open(self._connect_timeout)
+            self._sessions[server_name] = pooled
+            return pooled.session
+
+    async def _invalidate(self, server_name: str, session: Any) -> None:
+        async with self._locks[server_name]:
+            pooled = self._sessions.get(server_name)
+            if pooled is not None and pooled.session is session:
+                del self._sessions[server_name]
+                await pooled.close()
+
+    async def close(self) -> None:
+        """关闭所有会话"""
+        if self._loop is not asyncio.get_running_loop():
+            self._sessions = {}
+            return
+        sessions, self._sessions = list(self._sessions.values()), {}
+        await asyncio.gather(*(pooled.close() for pooled in sessions))
+
+    # ── 工具 ──────────────────────────────────────────────────────────────────
+
+    async def get_tools(self, server_name: Optional[str] = None) -> List[Any]:
+        """加载 MCP 工具，工具调用统一经由本会话池执行"""
+        names = [server_name] if server_name is not None else self.server_names
+
+        async def load(name: str) -> List[Any]:
+            session = await self.get_session(name)
+            return await load_mcp_tools(
+                session,
+                connection=self._connections[name],
+                tool_interceptors=[self],
+                server_name=name,
+            )
+
+        results = await asyncio.gather(*(load(name) for name in names))
+        return [t for tools in results for t in tools]
+
+    async def __call__(self, request: Any, handler: Any) -> Any:
+        """工具调用拦截器：在池化会话上执行，请求发出前连接已失效时重连并重试一次"""
+        server_name = request.server_name
+        if server_name not in self._connections:
+            return await handler(request)
+
+        self._bind_loop()
+        async with self._semaphores[server_name]:
+            for attempt in range(2):
+                session = await self.get_session(server_name)
+                try:
+                    result = await session.call_tool(request.name, request.args)
+                except McpError as exc:
+                    # 请求发出后连接断开：工具可能已经执行，丢弃会话但不重试
+                    if exc.error.code == CONNECTION_CLOSED:
+                        await self._invalidate(server_name, session)
+                    # 其余为协议层返回的错误（如参数不合法、读取超时），会话本身仍然可用
+                    raise
+                except _NOT_SENT_ERRORS:
+                    await self._invalidate(server_name, session)
+                    if attempt:
+                        raise
+                    continue
+                except Exception:
+                    # 无法确定请求是否已送达，丢弃会话但不重试
+                    await self._invalidate(server_name, session)
+                    raise
+                pooled = self._sessions.get(server_name)
+                if pooled is not None:
+                    pooled.last_used = self._loop.time()
+                return result
@@ -0,0 +1,267 @@
+"""
+延迟与吞吐指标
+
+记录对话链路各环节的耗时直方图，按指标名 + 标签（如 session、provider、tool）区分：
+- agent_acquire_seconds：获取主 Agent 的耗时
+- ttft_seconds：从收到用户消息到首个输出的耗时
+- response_seconds：一轮回复的总耗时
+- model_call_seconds：单次模型调用耗时
+- tool_call_seconds：单次工具调用耗时（含 MCP 工具）
+- summarization_seconds：历史对话压缩中间件的耗时
+- queue_wait_seconds：请求在准入队列中的等待耗时
+- requests_shed_total：队列已满被拒绝的请求数（计数器）
+- tool_cache_hits_total / tool_cache_misses_total：工具结果缓存的命中与未命中次数（计数器）
+- error_summaries_total：错误摘要的来源（缓存 / 本地分类 / LLM / 原始日志）计数
+- provider_ttft_seconds：多 provider 模式下各 provider 的首字延迟
+- provider_hedges_total / provider_failures_total / provider_ejections_total：对冲、失败与摘除次数
+- api_requests_total：流式 HTTP API 的请求数，按结果（ok / error / cancelled）区分
+
+指标可渲染为文本或 JSON，供 /metrics 接口输出；配置 trace 文件后，每次观测还会以 JSONL 追加写入。
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, SummarizationMiddleware
+
+# 直方图桶的上界（秒），覆盖 1ms ~ 2min
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """固定分桶的直方图，分位数按桶内线性插值估算"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    每个指标下的标签组合（series）数量有上限，超出时淘汰最久未更新的组合，
+    避免按 session 打标签时无限增长。
+    """
+
+    def __init__(self, max_series: int = 1000) -> None:
+        self._max_series = max_series
+        self._histograms: Dict[str, OrderedDict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, OrderedDict[LabelKey, float]] = {}
+        self._lock = threading.Lock()
+        self._trace_file: Optional[Any] = None
+
+    # ── 记录 ──────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def _series(self, table: Dict[str, OrderedDict], name: str, key: LabelKey, default: Any):
+        series = table.setdefault(name, OrderedDict())
+        if key in series:
+            series.move_to_end(key)
+        else:
+            series[key] = default()
+            while len(series) > self._max_series:
+                series.popitem(last=False)
+        return series
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次观测值（秒）"""
+        key = self._key(labels)
+        with self._lock:
+            self._series(self._histograms, name, key, Histogram)[key].observe(value)
+        self._trace({"type": "histogram", "name": name, "value": value, "labels": dict(key)})
+
+    def increment(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        """计数器累加"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._series(self._counters, name, key, float)
+            series[key] += amount
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """计时上下文，同步与异步代码中均可使用"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # ── 输出 ──────────────────────────────────────────────────────────────────
+
+    def enable_trace(self, path: str) -> None:
+        """开启 JSONL trace，每次观测追加一行"""
+        self.disable_trace()
+        self._trace_file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def disable_trace(self) -> None:
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+    def _trace(self, record: Dict[str, Any]) -> None:
+        if self._trace_file is None:
+            return
+        record["ts"] = time.time()
+        with self._lock:
+            self._trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """以 JSON 友好的结构导出所有指标"""
+        with self._lock:
+            histograms = {
+                name: [{"labels": dict(key), **hist.to_dict()} for key, hist in series.items()]
+                for name, series in self._histograms.items()
+            }
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+        return {"histograms": histograms, "counters": counters}
+
+    def render_text(self) -> str:
+        """渲染为 Prometheus 风格的文本"""
+        lines: List[str] = []
+        snapshot = self.snapshot()
+        for name, series in snapshot["histograms"].items():
+            lines.append(f"# TYPE {name} summary")
+            for item in series:
+                labels = ",".join(f'{k}="{v}"' for k, v in item["labels"].items())
+                for q in ("p50", "p95", "p99"):
+                    quantile = f'quantile="0.{q[1:]}"'
+                    label_text = f"{labels},{quantile}" if labels else quantile
+                    lines.append(f"{name}{{{label_text}}} {item[q]:.6f}")
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {item['sum']:.6f}")
+                lines.append(f"{name}_count{suffix} {item['count']}")
+        for name, series in snapshot["counters"].items():
+            lines.append(f"# TYPE {name} counter")
+            for item in series:
+                labels = ",".join(f'{k}="{v}"' for k, v in item["labels"].items())
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}{suffix} {item['value']:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+# 进程级默认注册表
+registry = MetricsRegistry()
+
+
+def _session_of(runtime: Any) -> Optional[str]:
+    context = getattr(runtime, "context", None)
+    return getattr(context, "session_id", None) or None
+
+
+class MetricsMiddleware(AgentMiddleware):
+    """记录每次模型调用与工具调用的耗时"""
+
+    def __init__(self, provider: str, metrics: Optional[MetricsRegistry] = None) -> None:
+        super().__init__()
+        self._provider = provider
+        self._metrics = metrics or registry
+
+    async def awrap_model_call(self, request: Any, handler: Any) -> Any:
+        with self._metrics.timer(
+            "model_call_seconds",
+            provider=self._provider,
+            session=_session_of(request.runtime),
+        ):
+            return await handler(request)
+
+    async def awrap_tool_call(self, request: Any, handler: Any) -> Any:
+        with self._metrics.timer(
+            "tool_call_seconds",
+            provider=self._provider,
+            session=_session_of(request.runtime),
+            tool=request.tool_call.get("name"),
+        ):
+            return await handler(request)
+
+
+class TimedSummarizationMiddleware(SummarizationMiddleware):
+    """记录历史对话压缩耗时的 SummarizationMiddleware"""
+
+    def __init__(
+        self, *args: Any, provider: str, metrics: Optional[MetricsRegistry] = None, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._provider = provider
+        self._metrics = metrics or registry
+
+    async def abefore_model(self, state: Any, runtime: Any) -> Any:
+        with self._metrics.timer(
+            "summarization_seconds",
+            provider=self._provider,
+            session=_session_of(runtime),
+        ):
+            return await super().abefore_model(state, runtime)
@@ -3,6 +3,7 @@
 
 处理规则：
 - 删除思维链块：匹配 <details class="think-result-details">...</details>
+- 删除工具运行中推送的阶段性结果块：匹配 <details class="tool-progress-details">...</details>
 - 删除工具块的 HTML，但保留 <pre> 内的工具输出，并替换为明确标签：
   - 默认：```tool_return\n...\n```（工具名省略）
   - include_tool_name=True 时：```tool_return name="..."\n...\n```（name 来自 <code>）
@@ -41,6 +42,7 @@ def get_cleaned_text(
     think_details_class: str = "think-result-details",
     tool_details_class: str = "tool-result-details",
     tool_call_details_class: str = "tool-call-details",
+    tool_progress_details_class: str = "tool-progress-details",
     decode_escaped_newlines: bool = True,
     include_tool_name: bool = True,
 ) -> str:
@@ -54,8 +56,10 @@ def get_cleaned_text(
     think_details_re = _compile_details_block_re(think_details_class)
     tool_details_re = _compile_details_block_re(tool_details_class)
     tool_call_details_re = _compile_details_block_re(tool_call_details_class)
+    tool_progress_details_re = _compile_details_block_re(tool_progress_details_class)
 
     without_think = think_details_re.sub("", normalized)
+    without_think = tool_progress_details_re.sub("", without_think)
 
     def _fence_for(text: str) -> str:
         max_run = 0
@@ -0,0 +1,285 @@
+"""
+录制 / 回放 LLM provider
+
+用于在没有网络、不消耗 provider 额度的情况下，以真实并发压测流式输出、界面与工具链路。
+回放在 HTTP 层完成：ReplayTransport 挂载到共享连接池（utils/http_pool.py）上，
+ChatOpenAI 走的仍是真实的 SSE 解析逻辑，role_play 等通过 init_chat_model 创建的模型同样生效。
+
+fixture 为 JSON 文件，内容是一个或一组录制结果：
+
+    {
+        "match": "用户消息中包含的文字，省略时作为默认回复",
+        "step": 0,
+        "chunks": [{"choices": [{"index": 0, "delta": {"reasoning_content": "..."}}]}, ...]
+    }
+
+- chunks 为 chat.completion.chunk 对象，可包含 tool_calls 与 DashScope 的 reasoning_content
+- step 表示同一轮对话中的第几次模型调用（最后一条用户消息之后已有几条 assistant 消息），
+  用于区分“先调用工具、再给出回答”的多次调用；省略时匹配任意一次
+- 回放时可配置首字延迟（ttft）与输出速率（tokens_per_second，每个 chunk 按一个 token 计）；
+  非流式请求与真实 provider 一样，等整段输出“生成”完后一次返回
+
+录制时，RecordingTransport 把真实 provider 的流式响应按同样的格式写入目录，可直接用于回放。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+
+@dataclass
+class ReplayConfig:
+    """回放配置"""
+
+    # fixture 目录
+    fixtures_dir: str = "./bench/fixtures"
+    # 每秒输出的 chunk 数，0 表示不限速
+    tokens_per_second: float = 50.0
+    # 首个 chunk 之前的等待秒数
+    ttft: float = 0.3
+
+
+@dataclass
+class Fixture:
+    """一段录制的模型输出"""
+
+    chunks: List[Dict[str, Any]]
+    match: Optional[str] = None
+    step: Optional[int] = None
+
+
+def load_fixtures(directory: str) -> List[Fixture]:
+    """读取目录下所有 *.json fixture（按文件名排序）"""
+    fixtures: List[Fixture] = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data if isinstance(data, list) else [data]:
+            fixtures.append(Fixture(item["chunks"], item.get("match"), item.get("step")))
+    return fixtures
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def request_key(body: Dict[str, Any]) -> Tuple[str, int]:
+    """返回最后一条用户消息的文本，以及其后已有的 assistant 消息数（即本次调用的 step）"""
+    messages = body.get("messages") or []
+    last_user, step = "", 0
+    for message in messages:
+        if message.get("role") == "user":
+            last_user, step = _text_of(message.get("content")), 0
+        elif message.get("role") == "assistant":
+            step += 1
+    return last_user, step
+
+
+def select_fixture(fixtures: List[Fixture], last_user: str, step: int) -> Fixture:
+    """按用户消息匹配 fixture，优先选择 step 一致的，其次是未指定 step 的"""
+    candidates = [f for f in fixtures if f.match and f.match in last_user]
+    if not candidates:
+        candidates = [f for f in fixtures if not f.match] or fixtures
+    if not candidates:
+        raise LookupError("没有可用的回放 fixture")
+    return max(candidates, key=lambda f: (f.step == step, f.step is None))
+
+
+def _complete_chunk(chunk: Dict[str, Any], model: str, created: int) -> Dict[str, Any]:
+    # 手写的 fixture 可以省略这些字段
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        **chunk,
+    }
+
+
+def aggregate_chunks(chunks: List[Dict[str, Any]], model: str) -> Dict[str, Any]:
+    """把流式 chunk 合并为非流式的 chat.completion 响应"""
+    content, reasoning = [], []
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    finish_reason = "stop"
+    for chunk in chunks:
+        for choice in chunk.get("choices", []):
+            delta = choice.get("delta") or {}
+            content.append(delta.get("content") or "")
+            reasoning.append(delta.get("reasoning_content") or "")
+            for call in delta.get("tool_calls") or []:
+                merged = tool_calls.setdefault(
+                    call.get("index", 0),
+                    {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+                )
+                merged["id"] = call.get("id") or merged["id"]
+                function = call.get("function") or {}
+                merged["function"]["name"] += function.get("name") or ""
+                merged["function"]["arguments"] += function.get("arguments") or ""
+            finish_reason = choice.get("finish_reason") or finish_reason
+    message: Dict[str, Any] = {"role": "assistant", "content": "".join(content)}
+    if any(reasoning):
+        message["reasoning_content"] = "".join(reasoning)
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": 0,
+            "completion_tokens": len(chunks),
+            "total_tokens": len(chunks),
+        },
+    }
+
+
+class _ReplayStream(httpx.AsyncByteStream, httpx.SyncByteStream):
+    """按首字延迟与输出速率逐个输出 SSE 事件，与网络流一样只能读取一次"""
+
+    def __init__(self, events: List[bytes], ttft: float, interval: float) -> None:
+        self._events = events
+        self._ttft = ttft
+        self._interval = interval
+
+    def _delays(self) -> Iterator[Tuple[float, bytes]]:
+        # openai SDK 读到 [DONE] 后还会再排空一次响应流，此时不能重复输出
+        events, self._events = self._events, []
+        for index, event in enumerate(events):
+            yield (self._ttft if index == 0 else self._interval), event
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for delay, event in self._delays():
+            if delay:
+                await asyncio.sleep(delay)
+            yield event
+
+    def __iter__(self) -> Iterator[bytes]:
+        for delay, event in self._delays():
+            if delay:
+                time.sleep(delay)
+            yield event
+
+
+class ReplayTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
+    """从 fixture 回放 /chat/completions 响应，同时支持同步与异步客户端"""
+
+    def __init__(
+        self,
+        fixtures: List[Fixture],
+        tokens_per_second: float = 0.0,
+        ttft: float = 0.0,
+    ) -> None:
+        self.fixtures = fixtures
+        self.ttft = ttft
+        self.interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    @classmethod
+    def from_config(cls, config: ReplayConfig) -> ReplayTransport:
+        return cls(load_fixtures(config.fixtures_dir), config.tokens_per_second, config.ttft)
+
+    def _respond(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "回放只支持 /chat/completions"}})
+        body = json.loads(request.content or b"{}")
+        model = body.get("model", "replay")
+        fixture = select_fixture(self.fixtures, *request_key(body))
+
+        if not body.get("stream"):
+            payload = aggregate_chunks(fixture.chunks, model)
+            delay = self.ttft + self.interval * max(len(fixture.chunks) - 1, 0)
+            stream = _ReplayStream([json.dumps(payload).encode()], delay, 0.0)
+            headers = {"content-type": "application/json"}
+        else:
+            created = int(time.time())
+            events = [
+                f"data: {json.dumps(_complete_chunk(c, model, created), ensure_ascii=False)}\n\n"
+                for c in fixture.chunks
+            ]
+            events.append("data: [DONE]\n\n")
+            stream = _ReplayStream([e.encode() for e in events], self.ttft, self.interval)
+            headers = {"content-type": "text/event-stream"}
+        return httpx.Response(200, headers=headers, stream=stream, request=request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        return self._respond(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        return self._respond(request)
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, on_close: Any) -> None:
+        self._inner = inner
+        self._on_close = on_close
+        self._data = bytearray()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for part in self._inner:
+            self._data.extend(part)
+            yield part
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+        self._on_close(bytes(self._data))
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """转发到真实 provider，同时把流式响应按 fixture 格式写入目录"""
+
+    _counter = itertools.count()
+    _lock = threading.Lock()
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, directory: str) -> None:
+        self._inner = inner
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _save(self, last_user: str, step: int, data: bytes) -> None:
+        chunks = []
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            if line.startswith("data:") and line[5:].strip() != "[DONE]":
+                chunks.append(json.loads(line[5:]))
+        if not chunks:
+            return
+        with self._lock:
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self._counter):04d}.json"
+        record = {"match": last_user, "step": step, "chunks": chunks}
+        with open(os.path.join(self._directory, name), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._inner.handle_async_request(request)
+        if not request.url.path.endswith("/chat/completions") or response.status_code != 200:
+            return response
+        body = json.loads(request.content or b"{}")
+        if not body.get("stream"):
+            return response
+        last_user, step = request_key(body)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(
+                response.stream, lambda data: self._save(last_user, step, data)
+            ),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
@@ -0,0 +1,163 @@
+"""
+准入控制与公平调度
+
+多个用户同时使用时，所有请求直接打到 LLM 提供商容易触发限流、拉长所有人的尾延迟。
+调度器为每个 provider 维护一条通道（lane）：
+- 同一时刻最多 max_concurrency 个请求在运行
+- 超出的请求进入有界等待队列，队列满时直接拒绝（load shedding）
+- 等待队列按会话轮转出队：每个会话轮流放行一个请求，单个会话连发多条不会挤占其他会话
+- 排队中的请求可以随时查询自己的位置，用于在界面上展示
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+
+class QueueFullError(RuntimeError):
+    """等待队列已满，请求被拒绝"""
+
+
+class Ticket:
+    """一次准入申请"""
+
+    def __init__(self, lane: _Lane, session_id: str) -> None:
+        self._lane = lane
+        self.session_id = session_id
+        self.granted = False
+        self.released = False
+
+    def position(self) -> int:
+        """前面还有多少个请求在排队（已放行时为 0）"""
+        if self.granted or self.released:
+            return 0
+        return self._lane.position(self)
+
+    async def wait(self) -> None:
+        """等待队列发生变化（被放行或排队位置前移）"""
+        if self.granted or self.released:
+            return
+        await self._lane.changed.wait()
+
+    def release(self) -> None:
+        """结束运行或放弃排队，可重复调用"""
+        if self.released:
+            return
+        self.released = True
+        self._lane.release(self)
+
+    async def __aenter__(self) -> Ticket:
+        while not self.granted:
+            await self.wait()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+class _Lane:
+    """单个 provider 的并发通道"""
+
+    def __init__(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        # 会话 -> 该会话的排队请求；会话按轮转顺序排列
+        self._queues: OrderedDict[str, Deque[Ticket]] = OrderedDict()
+        self.changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def submit(self, session_id: str) -> Ticket:
+        ticket = Ticket(self, session_id)
+        if self.running < self.max_concurrency and not self.queued:
+            ticket.granted = True
+            self.running += 1
+            return ticket
+        if self.queued >= self.max_queue:
+            raise QueueFullError(f"等待队列已满（{self.max_queue}）")
+        self._queues.setdefault(session_id, deque()).append(ticket)
+        self.queued += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        queue = self._queues.get(ticket.session_id)
+        if not queue or ticket not in queue:
+            return 0
+        depth = queue.index(ticket)
+        # 轮转顺序下，其他会话在前 depth 轮各放行一个；排在本会话之前的会话在第 depth 轮也先放行
+        ahead = depth
+        before = True
+        for session_id, other in self._queues.items():
+            if session_id == ticket.session_id:
+                before = False
+                continue
+            ahead += min(len(other), depth + 1 if before else depth)
+        return ahead
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.granted:
+            self.running -= 1
+        else:
+            queue = self._queues.get(ticket.session_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self.queued -= 1
+                if not queue:
+                    del self._queues[ticket.session_id]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self.queued -= 1
+            # 轮转：放行后该会话移到队尾
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            ticket.granted = True
+            self.running += 1
+        self._notify()
+
+
+class AdmissionScheduler:
+    """按 provider 分通道的准入调度器"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        provider_limits: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._provider_limits = dict(provider_limits or {})
+        self._lanes: Dict[str, _Lane] = {}
+
+    def _lane(self, provider: str) -> _Lane:
+        lane = self._lanes.get(provider)
+        if lane is None:
+            limit = self._provider_limits.get(provider, self._max_concurrency)
+            lane = self._lanes[provider] = _Lane(limit, self._max_queue)
+        return lane
+
+    def submit(self, provider: str, session_id: str) -> Ticket:
+        """申请准入：有空闲并发时立即放行，否则排队；队列已满时抛出 QueueFullError"""
+        return self._lane(provider).submit(session_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            provider: {
+                "running": lane.running,
+                "queued": lane.queued,
+                "max_concurrency": lane.max_concurrency,
+                "max_queue": lane.max_queue,
+            }
+            for provider, lane in self._lanes.items()
+        }
@@ -0,0 +1,112 @@
+"""
+多进程共享的会话存储
+
+thread 模式下，每个 Gradio 会话对应一个 LangGraph thread_id。单进程时这一映射保存在内存中
+（app.py 中的 SessionThreads）；多进程（--workers）时改为保存在与 sqlite checkpointer
+同一个数据库文件中，任意 worker 都能接着同一个 thread 继续对话，worker 重启后也不会丢失。
+
+每个会话同时记录 thread 对应的对话轮数（界面上的用户消息数），只在一轮成功结束后更新。
+出错或被中断的一轮可能在 checkpoint 中留下未应答的工具调用，之后的请求都会被模型服务拒绝；
+界面历史与记录的轮数不一致（出错、中断、重试、撤销或清空对话）时开启新的 thread，
+由调用方用界面上的完整历史重新建立上下文。
+
+sqlite 的读写是同步的，多个 worker 并发写入时可能要等待文件锁，事件循环中应使用 aresolve，
+在线程池中执行，等锁期间不会阻塞其他会话的流式输出。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS gradio_sessions (
+    session_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    turns INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def count_turns(history: List[Dict[str, Any]]) -> int:
+    """界面历史中的对话轮数（用户消息数）"""
+    return sum(1 for m in history if m.get("role") == "user")
+
+
+class SqliteSessionStore:
+    """与 SessionThreads 接口一致、基于 sqlite 的会话到 thread_id 映射，可被多个进程共享"""
+
+    def __init__(self, path: str, max_sessions: int = 100_000) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # 多个进程并发写入时等待锁释放，而不是立即报错
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(gradio_sessions)")}
+        if "turns" not in columns:
+            # 旧版本创建的数据库没有 turns 列，已有会话下一轮会开启新的 thread
+            self._conn.execute(
+                "ALTER TABLE gradio_sessions ADD COLUMN turns INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.commit()
+
+    def resolve(self, session_id: str, history: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """
+        返回 (thread_id, 是否为新 thread)。history 为本轮之前的界面历史，
+        与 thread 记录的轮数一致时沿用原 thread，否则开启新的 thread。
+        """
+        turns = count_turns(history)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT thread_id, turns FROM gradio_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and turns > 0 and row[1] == turns:
+                self._conn.execute(
+                    "UPDATE gradio_sessions SET updated_at = ? WHERE session_id = ?",
+                    (time.time(), session_id),
+                )
+                return row[0], False
+            thread_id = str(uuid.uuid4())
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gradio_sessions VALUES (?, ?, ?, ?)",
+                (session_id, thread_id, time.time(), turns),
+            )
+            if row is None:
+                # 只在新增会话时清理，淘汰最久未使用的会话
+                self._conn.execute(
+                    "DELETE FROM gradio_sessions WHERE session_id IN ("
+                    "SELECT session_id FROM gradio_sessions ORDER BY updated_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self._max_sessions,),
+                )
+        return thread_id, True
+
+    def complete(self, session_id: str, thread_id: str, history: List[Dict[str, Any]]) -> None:
+        """一轮成功结束后记录 thread 已包含的轮数，history 为本轮结束后的界面历史"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE gradio_sessions SET turns = ?, updated_at = ? "
+                "WHERE session_id = ? AND thread_id = ?",
+                (count_turns(history), time.time(), session_id, thread_id),
+            )
+
+    async def aresolve(self, session_id: str, history: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """resolve 的异步版本，在线程池中执行"""
+        return await asyncio.to_thread(self.resolve, session_id, history)
+
+    async def acomplete(
+        self, session_id: str, thread_id: str, history: List[Dict[str, Any]]
+    ) -> None:
+        """complete 的异步版本，在线程池中执行"""
+        await asyncio.to_thread(self.complete, session_id, thread_id, history)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,244 @@
+"""
+工具结果缓存
+
+Agent 在一次对话中经常用相同参数重复调用同一个工具（例如反复计算同一个表达式、
+重复搜索同一个问题）。工具作者可以按工具声明缓存策略：
+- 纯函数：结果只取决于参数，缓存不过期，例如 calculator
+- TTL：结果会随时间变化，缓存在 ttl 秒后失效，例如联网搜索、天气
+
+本地工具用 @cacheable 声明；MCP 工具无法修改定义，在 MCPConfig.cache_policies 中按工具名配置。
+缓存键为工具名 + 规范化后的参数（JSON，键排序；策略可提供 key 函数进一步规范化，例如搜索词），
+按 LRU 淘汰，同时限制条目数与总字节数。
+并发的相同调用只执行一次（single-flight），其余调用等待并复用同一个结果。
+命中率通过 tool_cache_hits_total / tool_cache_misses_total 计数器输出，
+复用进行中调用的次数通过 tool_cache_shared_total 输出。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+
+from utils.metrics import MetricsRegistry, registry
+
+# 工具 metadata 中保存缓存策略的键
+CACHE_POLICY_KEY = "cache_policy"
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """工具结果的缓存策略"""
+
+    # 缓存有效期（秒），None 表示纯函数，结果永不过期
+    ttl: Optional[float] = None
+    # 判断结果是否可以缓存（入参为工具返回的内容），例如跳过表示失败的返回值
+    cache_if: Optional[Callable[[Any], bool]] = None
+    # 把工具参数映射为缓存键（入参为工具参数），例如规范化搜索词的大小写与空白
+    key: Optional[Callable[[Any], Any]] = None
+    # 把运行时上下文映射为缓存键的一部分（入参为 runtime.context，可能为 None），
+    # 结果依赖调用方凭据时用它隔离不同调用方的缓存
+    context_key: Optional[Callable[[Any], Any]] = None
+
+
+def cacheable(
+    ttl: Optional[float] = None,
+    cache_if: Optional[Callable[[Any], bool]] = None,
+    key: Optional[Callable[[Any], Any]] = None,
+    context_key: Optional[Callable[[Any], Any]] = None,
+) -> Callable[[BaseTool], BaseTool]:
+    """
+    声明工具结果可缓存，放在 @tool 之上使用：
+
+        @cacheable()
+        @tool
+        def calculator(expression: str) -> str: ...
+    """
+
+    def decorate(tool: BaseTool) -> BaseTool:
+        tool.metadata = {
+            **(tool.metadata or {}),
+            CACHE_POLICY_KEY: CachePolicy(ttl, cache_if, key, context_key),
+        }
+        return tool
+
+    return decorate
+
+
+def canonical_args(args: Any) -> str:
+    """规范化工具参数，键顺序与空白不同的等价参数得到相同的缓存键"""
+    return json.dumps(args, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ToolResultCache:
+    """按 LRU 淘汰的工具结果缓存，限制条目数与总字节数"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._metrics = metrics or registry
+        # (工具名, 规范化参数) -> (结果, 过期时间, 字节数)
+        self._entries: OrderedDict[Tuple[str, str], Tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        # 进行中的调用，(工具名, 规范化参数) -> 等待结果的 Future
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tool: str, args: Any) -> Optional[Any]:
+        """查询缓存，未命中或已过期时返回 None"""
+        key = (tool, canonical_args(args))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses[tool] = self._misses.get(tool, 0) + 1
+            else:
+                self._entries.move_to_end(key)
+                self._hits[tool] = self._hits.get(tool, 0) + 1
+        self._metrics.increment(
+            "tool_cache_misses_total" if entry is None else "tool_cache_hits_total", tool=tool
+        )
+        return None if entry is None else entry[0]
+
+    def put(self, tool: str, args: Any, value: Any, ttl: Optional[float], size: int) -> None:
+        """写入缓存；单个结果超过字节上限时不缓存"""
+        if size > self._max_bytes:
+            return
+        key = (tool, canonical_args(args))
+        expires_at = float("inf") if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def begin_call(self, tool: str, args: Any) -> Tuple[asyncio.Future, bool]:
+        """
+        登记一次未命中缓存的调用（single-flight）。
+
+        返回该参数对应的 Future，以及本次调用是否需要自己执行：为 True 时执行完须调用 end_call；
+        为 False 时已有相同的调用在进行中，等待 Future 即可得到其结果。
+        """
+        key = (tool, canonical_args(args))
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                leader = False
+            else:
+                future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+                leader = True
+        if not leader:
+            self._metrics.increment("tool_cache_shared_total", tool=tool)
+        return future, leader
+
+    def end_call(self, tool: str, args: Any, result: Any) -> None:
+        """结束 begin_call 登记的调用，把结果交给等待中的相同调用（失败时传入 None）"""
+        key = (tool, canonical_args(args))
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """各工具的命中次数、未命中次数与命中率，以及缓存占用"""
+        with self._lock:
+            tools = {}
+            for tool in sorted(self._hits.keys() | self._misses.keys()):
+                hits, misses = self._hits.get(tool, 0), self._misses.get(tool, 0)
+                tools[tool] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "in_flight": len(self._in_flight),
+                "tools": tools,
+            }
+
+
+class ToolCacheMiddleware(AgentMiddleware):
+    """
+    按工具缓存策略短路重复的工具调用
+
+    只缓存成功的 ToolMessage；命中时返回一份新的消息，tool_call_id 指向本次调用。
+    未命中时，并发的相同调用共用一次执行；执行失败、抛出异常或结果不满足 cache_if 时，
+    等待中的调用各自重新执行。
+    """
+
+    def __init__(
+        self, cache: ToolResultCache, policies: Optional[Dict[str, CachePolicy]] = None
+    ) -> None:
+        super().__init__()
+        self._cache = cache
+        self._policies = dict(policies or {})
+
+    def _policy(self, request: Any) -> Optional[CachePolicy]:
+        name = request.tool_call["name"]
+        if name in self._policies:
+            return self._policies[name]
+        metadata = getattr(request.tool, "metadata", None) or {}
+        return metadata.get(CACHE_POLICY_KEY)
+
+    async def awrap_tool_call(self, request: Any, handler: Any) -> Any:
+        policy = self._policy(request)
+        if policy is None:
+            return await handler(request)
+
+        name, args = request.tool_call["name"], request.tool_call.get("args", {})
+        if policy.key is not None:
+            args = policy.key(args)
+        if policy.context_key is not None:
+            context = getattr(getattr(request, "runtime", None), "context", None)
+            args = {"args": args, "context": policy.context_key(context)}
+        cached = self._cache.get(name, args)
+        if cached is not None:
+            return cached.model_copy(update={"tool_call_id": request.tool_call["id"], "id": None})
+
+        future, leader = self._cache.begin_call(name, args)
+        if not leader:
+            shared = await asyncio.shield(future)
+            if shared is None:
+                return await handler(request)
+            return shared.model_copy(update={"tool_call_id": request.tool_call["id"], "id": None})
+
+        shared = None
+        try:
+            result = await handler(request)
+            # 只有可缓存的结果才交给等待中的调用；被 cache_if 拒绝的结果（如空结果）由它们各自重新执行
+            if (
+                isinstance(result, ToolMessage)
+                and result.status != "error"
+                and (policy.cache_if is None or policy.cache_if(result.content))
+            ):
+                shared = result.model_copy()
+                size = len(str(result.content).encode("utf-8"))
+                self._cache.put(name, args, shared, policy.ttl, size)
+            return result
+        finally:
+            self._cache.end_call(name, args, shared)
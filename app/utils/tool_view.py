@@ -93,3 +93,31 @@ def format_tool_result(tool_name: str, tool_output: Any) -> str:
             "</details>\n\n",
         ]
     )
+
+
+def format_tool_progress(tool_name: str, title: str, content: Any) -> str:
+    """
+    格式化工具运行中推送的阶段性结果，返回 HTML 字符串。
+
+    工具返回后，界面用最终结果替换这些块；残留的块在发给 LLM 前会被删除（见 remove_html.py）。
+
+    :param tool_name: 工具名称
+    :param title: 阶段性结果的标题
+    :param content: 阶段性结果的内容
+    :return: 格式化后的 HTML 字符串
+    """
+    safe_tool_name = html.escape(tool_name)
+    safe_title = html.escape(title)
+    safe_content = html.escape(_to_display_text(content))
+    return "\n".join(
+        [
+            '<details class="tool-progress-details" open>',
+            '<summary class="tool-progress-summary">',
+            f'<div class="tool-progress-title"> ⏳ <code class="tool-progress-name">{safe_tool_name}</code> {safe_title}</div>',
+            "</summary>",
+            '<pre class="tool-progress-pre">',
+            f"\n{safe_content}",
+            "</pre>",
+            "</details>\n\n",
+        ]
+    )
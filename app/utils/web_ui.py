@@ -324,6 +324,14 @@ html, body {
 .tool-call-details[open] .tool-call-icon { transform: rotate(180deg); }
 .tool-call-icon { transition: transform 0.2s ease; fill: none; stroke: #d9e6ff; stroke-width: 2; stroke-linecap: round; stroke-linejoin: round; }
 
+/* Tool Progress 样式 */
+.tool-progress-details { border: 1px dashed #4a5a3d; border-radius: 8px; padding: 10px; margin: 10px 0; background-color: #262b22; }
+.tool-progress-summary::-webkit-details-marker { display: none; }
+.tool-progress-summary { list-style: none; display: flex; align-items: center; font-weight: bold; color: #d5e8c4; outline: none; }
+.tool-progress-title { display: flex; align-items: center; }
+.tool-progress-name { color: #a8d08d; background: none; border: none; margin: 0 5px; font-size: 1em; line-height: inherit; }
+.tool-progress-pre { margin-top: 10px; padding: 10px; background-color: #1e2219; border-radius: 4px; color: #d5e8c4; font-family: monospace; white-space: pre-wrap; max-height: 200px; overflow-y: auto; border: 1px solid #333; }
+
 /* Think Result 样式 */
 .think-result-details { border: 1px solid #555; border-radius: 8px; padding: 10px; margin: 10px 0; background-color: #2a2a3a; }
 .think-result-summary::-webkit-details-marker { display: none; }
@@ -375,8 +383,12 @@ def _stop_generation(history):
     return send_update, stop_update, _clear_active_typing_indicator(history)
 
 
-def create_ui(llm_func, tab_name, main_title, initial_message=None):
-    """创建聊天界面"""
+def create_ui(llm_func, tab_name, main_title, initial_message=None, concurrency_limit="default"):
+    """
+    创建聊天界面
+
+    concurrency_limit 透传给 Gradio 事件，None 表示不限制（由调用方自行做准入控制）
+    """
     with gr.Blocks(title=tab_name, fill_width=True) as ui:
         # 标题区域
         gr.Markdown(
@@ -429,7 +441,12 @@ def create_ui(llm_func, tab_name, main_title, initial_message=None):
             queue=False,
             show_progress="hidden",
         )
-        enter_generation = enter_start.then(llm_func, [msg, chatbot], [msg, chatbot])
+        enter_generation = enter_start.then(
+            llm_func,
+            [msg, chatbot],
+            [msg, chatbot],
+            concurrency_limit=concurrency_limit,
+        )
         enter_generation.then(
             _show_send_button,
             None,
@@ -445,7 +462,12 @@ def create_ui(llm_func, tab_name, main_title, initial_message=None):
             queue=False,
             show_progress="hidden",
         )
-        click_generation = click_start.then(llm_func, [msg, chatbot], [msg, chatbot])
+        click_generation = click_start.then(
+            llm_func,
+            [msg, chatbot],
+            [msg, chatbot],
+            concurrency_limit=concurrency_limit,
+        )
         click_generation.then(
             _show_send_button,
             None,
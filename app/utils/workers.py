@@ -0,0 +1,247 @@
+"""
+多进程模式（--workers N）
+
+单个进程只有一个事件循环和一把 GIL，HTML 清洗、工具结果格式化等 CPU 密集的工作会限制吞吐。
+多进程模式下，主进程在 port+1 … port+N 上各启动一个 app.py worker，自身在 port 上运行
+会话粘滞的反向代理：
+
+- 浏览器首次访问时由代理写入 STICKY_COOKIE，同一浏览器的页面、Gradio 队列与 SSE 请求
+  始终落在同一个 worker 上（Gradio 的队列状态保存在 worker 进程内）
+- 程序化调用可以用 X-Session-ID 请求头指定路由键，同一会话的请求落在同一个 worker 上
+- 选中的 worker 连接失败时依次尝试其他 worker
+
+会话状态（thread 模式）通过共享的 sqlite checkpointer 与 utils/session_store.py 在 worker 之间共享。
+准入控制、工具缓存与指标仍是每个 worker 独立的，/metrics 可直接访问各 worker 的端口。
+
+所有 worker 的流式响应都要经过代理，单个代理进程的事件循环会成为瓶颈。代理可以运行多个进程
+（--proxy-processes）：主进程绑定监听 socket，其余代理进程继承同一个 socket，由内核分配连接；
+路由只取决于路由键（crc32 取模），任一代理进程都会把同一会话转发到同一个 worker。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, List, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+STICKY_COOKIE = "agent_worker"
+SESSION_HEADER = "x-session-id"
+
+# 逐跳头部，不应被代理转发
+_HOP_HEADERS = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+        "host",
+        "content-length",
+    }
+)
+
+
+class StickyRouter:
+    """按路由键把请求稳定地映射到某个 worker"""
+
+    def __init__(self, workers: List[str]) -> None:
+        if not workers:
+            raise ValueError("至少需要一个 worker")
+        self.workers = list(workers)
+
+    def candidates(self, key: str) -> Iterator[int]:
+        """返回首选 worker 及其后的备选顺序"""
+        start = zlib.crc32(key.encode()) % len(self.workers)
+        for offset in range(len(self.workers)):
+            yield (start + offset) % len(self.workers)
+
+
+def create_proxy_app(
+    workers: List[str], transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Starlette:
+    """创建会话粘滞的反向代理，workers 为各 worker 的地址，如 http://127.0.0.1:7861"""
+    router = StickyRouter(workers)
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(None, connect=5.0),
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=256),
+        transport=transport,
+    )
+
+    async def proxy(request: Request) -> Response:
+        key = request.headers.get(SESSION_HEADER) or request.cookies.get(STICKY_COOKIE)
+        new_cookie = None
+        if key is None:
+            key = new_cookie = uuid.uuid4().hex
+
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS]
+        headers.append(("x-forwarded-for", request.client.host if request.client else ""))
+        body = await request.body()
+
+        for index in router.candidates(key):
+            upstream = client.build_request(
+                request.method,
+                httpx.URL(router.workers[index]).join(request.url.path),
+                params=request.url.query,
+                headers=headers,
+                content=body,
+            )
+            try:
+                response = await client.send(upstream, stream=True)
+            except httpx.ConnectError:
+                continue
+            proxied = StreamingResponse(
+                response.aiter_raw(),
+                status_code=response.status_code,
+                headers={
+                    k: v
+                    for k, v in response.headers.items()
+                    if k.lower() not in _HOP_HEADERS and k.lower() != "set-cookie"
+                },
+                background=BackgroundTask(response.aclose),
+            )
+            # Set-Cookie 可能有多个，单独透传
+            for value in response.headers.get_list("set-cookie"):
+                proxied.headers.append("set-cookie", value)
+            proxied.headers["x-worker"] = str(index)
+            if new_cookie is not None:
+                proxied.set_cookie(STICKY_COOKIE, new_cookie, httponly=True, samesite="lax")
+            return proxied
+        return PlainTextResponse("没有可用的 worker", status_code=502)
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette) -> AsyncIterator[None]:
+        yield
+        await client.aclose()
+
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+    return Starlette(
+        routes=[Route("/{path:path}", proxy, methods=methods)],
+        lifespan=lifespan,
+    )
+
+
+def spawn_workers(argv: List[str], ports: List[int]) -> List[subprocess.Popen]:
+    """以相同参数启动 worker 进程，只替换监听地址；argparse 以最后出现的参数为准"""
+    script = os.path.abspath(sys.argv[0])
+    return [
+        subprocess.Popen(
+            [sys.executable, script, *argv, "--workers", "1", "--host", "127.0.0.1"]
+            + ["--port", str(port)]
+        )
+        for port in ports
+    ]
+
+
+def spawn_proxies(sock: socket.socket, workers: List[str], count: int) -> List[subprocess.Popen]:
+    """启动 count 个代理进程，继承已绑定的监听 socket"""
+    fd = sock.fileno()
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "utils.workers", "--fd", str(fd), *workers],
+            cwd=app_dir,
+            pass_fds=(fd,),
+        )
+        for _ in range(count)
+    ]
+
+
+def serve_proxy(fd: int, workers: List[str]) -> None:
+    """在继承的监听 socket 上运行代理（代理子进程的入口）"""
+    sock = socket.socket(fileno=fd)
+    server = uvicorn.Server(uvicorn.Config(create_proxy_app(workers), log_level="warning"))
+    try:
+        asyncio.run(server.serve(sockets=[sock]))
+    except KeyboardInterrupt:
+        pass
+
+
+async def wait_ready(workers: List[str], timeout: float) -> List[str]:
+    """等待各 worker 开始服务，返回超时仍未就绪的 worker"""
+    deadline = time.monotonic() + timeout
+    pending = list(workers)
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while pending and time.monotonic() < deadline:
+            for url in list(pending):
+                try:
+                    await client.get(f"{url}/metrics")
+                    pending.remove(url)
+                except httpx.HTTPError:
+                    pass
+            if pending:
+                await asyncio.sleep(0.5)
+    return pending
+
+
+def stop_workers(processes: List[subprocess.Popen], timeout: float = 15.0) -> None:
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def serve_workers(
+    argv: List[str],
+    host: str,
+    port: int,
+    workers: int,
+    ready_timeout: Optional[float] = None,
+    proxy_processes: int = 1,
+) -> None:
+    """
+    启动 workers 个 worker 进程，并在 host:port 上运行粘滞代理，退出时停止所有 worker。
+    proxy_processes 为代理进程数（含本进程），共用同一个监听 socket。
+    """
+    ports = [port + 1 + index for index in range(workers)]
+    urls = [f"http://127.0.0.1:{p}" for p in ports]
+    # uvicorn 退出前会按原处理方式重新触发收到的信号，SIGTERM 的默认处理会直接结束进程；
+    # 改为抛出 KeyboardInterrupt，确保 finally 中停止 worker
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    processes = spawn_workers(argv, ports)
+    try:
+        not_ready = await wait_ready(urls, ready_timeout or 120.0)
+        if not_ready:
+            print(f"以下 worker 未能按时就绪，代理会跳过它们：{not_ready}")
+        config = uvicorn.Config(create_proxy_app(urls), host=host, port=port)
+        sock = config.bind_socket()
+        processes += spawn_proxies(sock, urls, proxy_processes - 1)
+        print(
+            f"多进程模式：{workers} 个 worker（端口 {ports[0]}-{ports[-1]}），"
+            f"{proxy_processes} 个代理进程 {host}:{port}"
+        )
+        await uvicorn.Server(config).serve(sockets=[sock])
+    finally:
+        stop_workers(processes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会话粘滞的代理进程（由 serve_workers 启动）")
+    parser.add_argument("--fd", type=int, required=True, help="继承的监听 socket")
+    parser.add_argument("workers", nargs="+", help="各 worker 的地址")
+    args = parser.parse_args()
+    serve_proxy(args.fd, args.workers)
@@ -1,50 +1,19 @@
 # -*- coding: utf-8 -*-
 from fastmcp import FastMCP
-import ast
 import re
 
+# Vendored copy of the app's arithmetic engine (app/arith.py, standard library only)
+try:
+    from . import arith
+except ImportError:
+    # server.py run directly as a script, without the package
+    import arith
 
-mcp = FastMCP("math_mcp")
 
+mcp = FastMCP("math_mcp")
 
-def _eval_ast(node):
-    """Safely evaluate a restricted arithmetic AST node."""
-    if isinstance(node, ast.Expression):
-        return _eval_ast(node.body)
-    if isinstance(node, ast.BinOp):
-        left = _eval_ast(node.left)
-        right = _eval_ast(node.right)
-        op = node.op
-        if isinstance(op, ast.Add):
-            return left + right
-        if isinstance(op, ast.Sub):
-            return left - right
-        if isinstance(op, ast.Mult):
-            return left * right
-        if isinstance(op, ast.Div):
-            return left / right
-        if isinstance(op, ast.Mod):
-            return left % right
-        if isinstance(op, ast.Pow):
-            return left**right
-        if isinstance(op, ast.FloorDiv):
-            return left // right
-        raise ValueError("Unsupported operation")
-    if isinstance(node, ast.UnaryOp):
-        operand = _eval_ast(node.operand)
-        if isinstance(node.op, ast.UAdd):
-            return +operand
-        if isinstance(node.op, ast.USub):
-            return -operand
-        raise ValueError("Unsupported unary operation")
-    if isinstance(node, ast.Constant):
-        if isinstance(node.value, (int, float)):
-            return node.value
-        raise ValueError("Unsupported constant type")
-    # For compatibility if ast.Num appears (older Python)
-    if isinstance(node, ast.Num):
-        return node.n
-    raise ValueError("Unsupported expression element")
+# The normalized expression is limited to 200 characters, tighter than the engine default
+LIMITS = arith.EvalLimits(max_length=200)
 
 
 def _normalize_expression(text: str) -> str:
@@ -75,19 +44,11 @@ def math(question: str) -> int | float:
     if not expr:
         raise ValueError("No arithmetic expression found in input")
 
-    # Security: Further limit expression length after normalization
-    if len(expr) > 200:
-        raise ValueError("Expression too complex after normalization")
-
+    # Length, operation count, result size and time limits are enforced by the engine
     try:
-        parsed = ast.parse(expr, mode="eval")
-        result = _eval_ast(parsed)
-    except ZeroDivisionError:
-        raise ValueError("Division by zero is not allowed")
-    except RecursionError:
-        raise ValueError("Expression too complex - recursion depth exceeded")
-    except Exception as e:
-        raise ValueError(f"Failed to evaluate expression: {expr}") from e
+        result = arith.evaluate(expr, LIMITS)
+    except ValueError as e:
+        raise ValueError(f"Failed to evaluate expression: {expr} ({e})") from e
 
     # Return int if it is an integer value, else float
     if isinstance(result, float) and result.is_integer():